@@ -0,0 +1,208 @@
+"""
+准入控制 + 降级 (brownout)
+流量突增时如果每个请求都用最贵的设置生成, 所有人的延迟都会一起崩溃;
+这里在进程内统计执行中与排队中的生成请求 (backlog), 按门槛分级处理:
+- 正常: 照使用者的选择生成
+- 降级: 改用较便宜的模型 (例如 Llama-3.2-1B)
+- 缩短: 除了换模型, 再把 max_tokens 缩短
+- 拒绝: 立即回覆「忙碌中」并附上预计可重试的时间, 不占用任何资源
+同时最多 max_in_flight 个请求在执行, 其余按先来先服务排队
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+# ============================================
+# 配置
+# ============================================
+
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("LUCKY_VICKY_MAX_IN_FLIGHT", "4"))
+DEFAULT_DOWNGRADE_AT = int(os.getenv("LUCKY_VICKY_DOWNGRADE_AT", "4"))   # backlog 达到此值开始换便宜模型
+DEFAULT_SHORTEN_AT = int(os.getenv("LUCKY_VICKY_SHORTEN_AT", "8"))       # backlog 达到此值再缩短 max_tokens
+DEFAULT_REJECT_AT = int(os.getenv("LUCKY_VICKY_REJECT_AT", "16"))        # backlog 达到此值直接拒绝
+DEFAULT_CHEAP_MODEL = "meta-llama/Llama-3.2-1B-Instruct"
+DEFAULT_SHORT_MAX_TOKENS = 200
+DEFAULT_SERVICE_TIME = 8.0   # 还没有样本时假设每个请求需要的秒数
+_SERVICE_ALPHA = 0.2
+
+NORMAL = "normal"
+DOWNGRADE = "downgrade"
+SHORTEN = "shorten"
+
+
+class Overloaded(RuntimeError):
+    """backlog 超过拒绝门槛; retry_after 为预计可重试的秒数"""
+
+    def __init__(self, backlog, retry_after):
+        self.backlog = backlog
+        self.retry_after = retry_after
+        super().__init__(f"服务忙碌中 (排队 {backlog} 个请求), 请约 {retry_after:.0f} 秒后再试")
+
+
+class Permit:
+    """一次准入; level 决定这次请求的降级程度, 用完必须 release"""
+
+    def __init__(self, controller, level):
+        self.level = level
+        self._controller = controller
+        self._granted = False   # 已取得执行名额
+        self._started = None
+        self._released = False
+
+    def apply(self, model, params):
+        """
+        按降级程度调整模型与采样参数
+
+        返回:
+            (模型 ID, 采样参数)
+        """
+        controller = self._controller
+        if self.level in (DOWNGRADE, SHORTEN):
+            model = controller.cheap_model
+        if self.level == SHORTEN:
+            params = {**params, "max_tokens": min(params.get("max_tokens", controller.short_max_tokens),
+                                                  controller.short_max_tokens)}
+        return model, params
+
+    async def start(self):
+        """等待执行名额 (在哪个事件循环中调用都可以)"""
+        await self._controller._wait_slot(self)
+        self._started = time.monotonic()
+
+    def release(self):
+        """归还名额 (或放弃排队); 重复调用无副作用"""
+        if self._released:
+            return
+        self._released = True
+        self._controller._release(self)
+
+
+class AdmissionController:
+    """
+    进程内共享的准入控制器 (线程安全)
+
+    参数:
+        max_in_flight: 同时执行的生成请求上限
+        downgrade_at / shorten_at / reject_at: backlog (执行中 + 排队中) 的分级门槛
+        cheap_model: 降级时改用的模型
+        short_max_tokens: 缩短时的 max_tokens 上限
+    """
+
+    def __init__(self, max_in_flight=DEFAULT_MAX_IN_FLIGHT, downgrade_at=DEFAULT_DOWNGRADE_AT,
+                 shorten_at=DEFAULT_SHORTEN_AT, reject_at=DEFAULT_REJECT_AT,
+                 cheap_model=DEFAULT_CHEAP_MODEL, short_max_tokens=DEFAULT_SHORT_MAX_TOKENS):
+        self.max_in_flight = max_in_flight
+        self.downgrade_at = downgrade_at
+        self.shorten_at = shorten_at
+        self.reject_at = reject_at
+        self.cheap_model = cheap_model
+        self.short_max_tokens = short_max_tokens
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._waiters = deque()   # [(permit, loop, future)], 先来先服务
+        self._admitted = 0        # 已准入但还没 release 的请求数 (= backlog)
+        self._service_time = DEFAULT_SERVICE_TIME
+        self._stats = {NORMAL: 0, DOWNGRADE: 0, SHORTEN: 0, "rejected": 0, "completed": 0}
+
+    def level_for(self, backlog):
+        """backlog 对应的处理方式; 超过拒绝门槛时返回 None"""
+        if backlog >= self.reject_at:
+            return None
+        if backlog >= self.shorten_at:
+            return SHORTEN
+        if backlog >= self.downgrade_at:
+            return DOWNGRADE
+        return NORMAL
+
+    def current_level(self):
+        """以目前的 backlog 来说, 新请求会得到的处理方式 (不占用名额; 会被拒绝时返回 None)"""
+        with self._lock:
+            return self.level_for(self._admitted)
+
+    def estimate_wait(self, backlog):
+        """backlog 个请求排在前面时, 预计要等待的秒数"""
+        rounds = max(0, backlog - self.max_in_flight) // self.max_in_flight + 1
+        return rounds * self._service_time
+
+    def admit(self):
+        """
+        决定是否接受这个请求 (不等待, 立即返回)
+
+        返回:
+            Permit
+        抛出:
+            Overloaded: backlog 超过拒绝门槛
+        """
+        with self._lock:
+            backlog = self._admitted
+            level = self.level_for(backlog)
+            if level is None:
+                self._stats["rejected"] += 1
+                raise Overloaded(backlog, self.estimate_wait(backlog))
+            self._admitted += 1
+            self._stats[level] += 1
+        return Permit(self, level)
+
+    async def _wait_slot(self, permit):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._in_flight < self.max_in_flight and not self._waiters:
+                self._in_flight += 1
+                permit._granted = True
+                return
+            future = loop.create_future()
+            self._waiters.append((permit, loop, future))
+        # 被取消时: 仍在队列中的话由 release 移除, 名额已经转交过来的话由 release 归还
+        await future
+
+    def _release(self, permit):
+        with self._lock:
+            self._admitted -= 1
+            if not permit._granted:
+                # 还在排队 (或根本没有 start) 就放弃了, 没有占用名额
+                self._waiters = deque(w for w in self._waiters if w[0] is not permit)
+                return
+            self._in_flight -= 1
+            if permit._started is not None:
+                self._stats["completed"] += 1
+                elapsed = time.monotonic() - permit._started
+                self._service_time += _SERVICE_ALPHA * (elapsed - self._service_time)
+            self._wake_next()
+
+    def _wake_next(self):
+        """名额空出时交给排最前面、还没被取消的请求 (调用者需持有锁)"""
+        while self._waiters and self._in_flight < self.max_in_flight:
+            permit, loop, future = self._waiters.popleft()
+            self._in_flight += 1
+            permit._granted = True
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(in_flight=self._in_flight, queued=len(self._waiters),
+                         backlog=self._admitted, service_time=self._service_time)
+        return stats
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+_default_controller = None
+_default_lock = threading.Lock()
+
+
+def get_admission_controller():
+    """获取进程内共享的准入控制器"""
+    global _default_controller
+    if _default_controller is None:
+        with _default_lock:
+            if _default_controller is None:
+                _default_controller = AdmissionController()
+    return _default_controller
@@ -0,0 +1,215 @@
+"""
+异步生成引擎
+基于 AsyncInferenceClient 的 asyncio 调用路径:
+- Gradio 可以直接 await 异步处理函数
+- Streamlit 通过共享的后台事件循环驱动协程
+等待模型响应时不再占用工作线程, 单个进程可同时挂起数百个生成请求
+"""
+
+import asyncio
+import threading
+import weakref
+
+from client_pool import token_fingerprint
+from rate_limiter import get_rate_limiter
+from stream_utils import chunk_text
+
+# ============================================
+# 配置
+# ============================================
+
+DEFAULT_MAX_CONCURRENCY = 256  # 每个事件循环同时进行的远程调用上限
+
+
+# ============================================
+# 共享后台事件循环
+# ============================================
+
+class BackgroundLoop:
+    """在守护线程中常驻运行的事件循环, 供同步代码提交协程"""
+
+    def __init__(self, name="lucky-vicky-async"):
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.call_soon(self._ready.set)
+        self._loop.run_forever()
+
+    @property
+    def loop(self):
+        return self._loop
+
+    def submit(self, coro):
+        """提交协程, 返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro, timeout=None):
+        """提交协程并阻塞等待结果 (只阻塞调用方线程, 不额外占用线程)"""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+
+_background_loop = None
+_background_lock = threading.Lock()
+
+
+def get_background_loop():
+    """获取进程内共享的后台事件循环 (首次调用时启动)"""
+    global _background_loop
+    if _background_loop is None:
+        with _background_lock:
+            if _background_loop is None:
+                _background_loop = BackgroundLoop()
+    return _background_loop
+
+
+def run_sync(coro, timeout=None):
+    """在共享后台事件循环中执行协程并返回结果"""
+    return get_background_loop().run(coro, timeout)
+
+
+def iterate_sync(async_iterable, timeout=None):
+    """把异步迭代器转换成同步生成器, 每一步都在共享后台事件循环中执行"""
+    loop = get_background_loop()
+    iterator = async_iterable.__aiter__()
+    try:
+        while True:
+            try:
+                yield loop.run(iterator.__anext__(), timeout)
+            except StopAsyncIteration:
+                return
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            loop.run(aclose())
+
+
+# ============================================
+# 异步客户端
+# ============================================
+
+# AsyncInferenceClient 内部的 HTTP 会话绑定在创建它的事件循环上,
+# 因此按事件循环 -> (base_url, token) 缓存, 同一循环内的所有协程共享一个客户端;
+# 用弱引用以循环本身为 key (不用 id(loop): 循环被回收后 id 可能被新的循环重复使用)
+_async_clients = weakref.WeakKeyDictionary()
+_semaphores = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+def get_async_hf_client(token=None, base_url=None, timeout=None):
+    """获取当前事件循环上共享的 AsyncInferenceClient"""
+    from huggingface_hub import AsyncInferenceClient
+
+    loop = asyncio.get_running_loop()
+    key = (base_url or "default", token_fingerprint(token))
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            kwargs = {}
+            if token:
+                kwargs["token"] = token
+            if base_url:
+                kwargs["base_url"] = base_url
+            if timeout:
+                kwargs["timeout"] = timeout
+            client = AsyncInferenceClient(**kwargs)
+            clients[key] = client
+    return client
+
+
+def _get_semaphore(max_concurrency):
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        semaphores = _semaphores.setdefault(loop, {})
+        semaphore = semaphores.get(max_concurrency)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(max_concurrency)
+            semaphores[max_concurrency] = semaphore
+    return semaphore
+
+
+async def acquire_hf_quota(token=None):
+    """
+    先向共享令牌桶取得一个 Hugging Face 请求额度, 之后的调用传 rate_limit=False
+
+    需要把限流排队与模型本身的耗时分开计时 (例如 ModelRouter.track) 时使用
+    """
+    return await get_rate_limiter().acquire_async("huggingface", token_fingerprint(token))
+
+
+async def chat_completion_async(messages, model, token=None, base_url=None,
+                                max_concurrency=DEFAULT_MAX_CONCURRENCY, rate_limit=True, **kwargs):
+    """
+    异步对话补全
+
+    参数:
+        messages: 对话消息列表
+        model: 模型 ID
+        token: Hugging Face API token
+        max_concurrency: 当前事件循环允许的最大并发调用数
+        rate_limit: 是否先向共享令牌桶取得请求额度
+        **kwargs: 透传给 chat_completion 的参数 (max_tokens, temperature 等)
+    """
+    if rate_limit:
+        await acquire_hf_quota(token)
+    client = get_async_hf_client(token, base_url)
+    async with _get_semaphore(max_concurrency):
+        return await client.chat_completion(messages=messages, model=model, **kwargs)
+
+
+async def chat_completion_stream_async(messages, model, token=None, base_url=None,
+                                       max_concurrency=DEFAULT_MAX_CONCURRENCY, rate_limit=True, meta=None,
+                                       **kwargs):
+    """
+    异步流式对话补全, 逐块 yield 文本增量
+
+    role / finish 等不带内容的 chunk 会被跳过;
+    传入 meta (dict) 时, 把收到的 finish_reason 与提供商回报的停止条件 (stop_reason / matched_stop)
+    写进 meta["finish_reason"] / meta["matched"] (例如 SignOffCutter.meta)
+    """
+    if rate_limit:
+        await acquire_hf_quota(token)
+    client = get_async_hf_client(token, base_url)
+    async with _get_semaphore(max_concurrency):
+        stream = await client.chat_completion(messages=messages, model=model, stream=True, **kwargs)
+        async for chunk in stream:
+            if meta is not None:
+                _record_finish(chunk, meta)
+            content = chunk_text(chunk)
+            if content:
+                yield content
+
+
+def _record_finish(chunk, meta):
+    choices = getattr(chunk, "choices", None)
+    if not choices:
+        return
+    choice = choices[0]
+    finish_reason = getattr(choice, "finish_reason", None)
+    if finish_reason is None:
+        return
+    meta["finish_reason"] = finish_reason
+    matched = getattr(choice, "stop_reason", None)
+    meta["matched"] = getattr(choice, "matched_stop", None) if matched is None else matched
+
+
+async def close_async_clients():
+    """关闭当前事件循环上创建的异步客户端 (并移除该循环的信号量)"""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = _async_clients.pop(loop, {})
+        _semaphores.pop(loop, None)
+    for client in clients.values():
+        close = getattr(client, "close", None)
+        if close is not None:
+            await close()
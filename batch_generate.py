@@ -0,0 +1,245 @@
+"""
+Lucky Vicky 批量生成工具
+从 JSONL 或 CSV 逐行读取事件, 以有限并发数生成贴文, 结果逐笔写入 JSONL
+
+- 输出文件本身就是检查点: 每完成一笔立即写入并 flush,
+  中断后用同样的命令重新执行, 已成功的行会自动跳过
+- 失败的行也会写入 (带 error 字段), 下次执行时重试; 同一个 id 以最后一笔为准
+- 与 Streamlit / Gradio / Groq 脚本共用 SQLite 磁盘缓存 (同一份 prompt 与采样参数,
+  同一个事件 + 模型会命中彼此生成的贴文; 指定 --max-tokens 时则是不同的缓存条目)
+
+用法:
+    python batch_generate.py events.jsonl -o posts.jsonl --concurrency 8
+    python batch_generate.py events.csv --backend hf --model meta-llama/Llama-3.2-3B-Instruct
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from client_pool import aisuite_client, hf_client
+from disk_cache import get_disk_cache
+from prompt_templates import GENERATION_PARAMS, LUCKY_VICKY
+from response_cache import make_cache_key
+from stop_sequences import finish_response, stop_params
+
+# ============================================
+# 配置
+# ============================================
+
+SYSTEM_PROMPT = LUCKY_VICKY.system
+
+DEFAULT_MODELS = {
+    "groq": "groq:llama-3.3-70b-versatile",
+    "hf": "meta-llama/Llama-3.2-3B-Instruct",
+}
+
+DEFAULT_CONCURRENCY = 8
+PROGRESS_INTERVAL = 2.0  # 秒
+
+
+def load_hf_token():
+    """与 Gradio 版相同: 先读 .env, 再读环境变量"""
+    try:
+        with open('.env', 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('HF_TOKEN='):
+                    return line.strip().split('=', 1)[1]
+    except FileNotFoundError:
+        pass
+    return os.getenv('HF_TOKEN')
+
+
+# ============================================
+# 输入 / 检查点
+# ============================================
+
+def iter_events(path, field="event"):
+    """
+    逐行产出 (row_id, event), 不会把整个文件读进内存
+
+    row_id 优先使用输入中的 id 字段, 否则使用行号 (从 1 开始, 不含 CSV 标题)
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for number, row in enumerate(rows, 1):
+            event = (row.get(field) or "").strip()
+            if event:
+                yield str(row.get("id") or number), event
+
+
+def load_done(output_path):
+    """读取已有输出, 返回已成功的 row_id 集合; 最后一行若写到一半则忽略"""
+    done = set()
+    try:
+        with open(output_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if "post" in record:
+                    done.add(record["id"])
+    except FileNotFoundError:
+        pass
+    return done
+
+
+# ============================================
+# 生成
+# ============================================
+
+def make_generator(backend, model, max_tokens=None):
+    """返回 generate(event) -> (贴文, 是否来自缓存), 失败时抛出异常"""
+    cache = get_disk_cache()
+    params = {**GENERATION_PARAMS, "max_tokens": max_tokens} if max_tokens else GENERATION_PARAMS
+    hf_token = load_hf_token() if backend == "hf" else None
+
+    def generate(event):
+        key = make_cache_key(SYSTEM_PROMPT, event, model, **params)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached, True
+
+        messages = LUCKY_VICKY.build(event, model, params["max_tokens"])
+        # 在结尾语停止 (stop 参数不影响贴文内容, 所以不放进缓存 key)
+        call_params = stop_params(event, model, params)
+        started = time.perf_counter()
+        if backend == "groq":
+            with aisuite_client("groq") as client:
+                response = client.chat.completions.create(model=model, messages=messages, **call_params)
+        else:
+            with hf_client(hf_token) as client:
+                response = client.chat_completion(messages=messages, model=model, **call_params)
+
+        result = finish_response(response, params["max_tokens"], time.perf_counter() - started, model)
+        cache.set(key, result)
+        return result, False
+
+    return generate
+
+
+class Progress:
+    """吞吐量与 ETA (每隔几秒打印一行)"""
+
+    def __init__(self, total, skipped):
+        self.total = total
+        self.skipped = skipped
+        self.done = 0
+        self.failed = 0
+        self.cached = 0
+        self.start = time.perf_counter()
+        self._last_print = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, ok, cached=False):
+        with self._lock:
+            self.done += 1
+            self.failed += 0 if ok else 1
+            self.cached += 1 if cached else 0
+        now = time.perf_counter()
+        finished = self.skipped + self.done >= self.total
+        if now - self._last_print >= PROGRESS_INTERVAL and not finished:
+            self._last_print = now
+            self.report()
+
+    def report(self, final=False):
+        elapsed = time.perf_counter() - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        remaining = self.total - self.skipped - self.done
+        eta = remaining / rate if rate > 0 else float("inf")
+        eta_text = "完成" if final or remaining <= 0 else (f"{eta:.0f}s" if rate > 0 else "--")
+        print(f"📊 {self.skipped + self.done}/{self.total} | 失败 {self.failed} | "
+              f"缓存 {self.cached} | {rate:.2f} 笔/秒 | ETA {eta_text}", flush=True)
+
+
+def run_batch(input_path, output_path, backend="groq", model=None, concurrency=DEFAULT_CONCURRENCY,
+              field="event", max_tokens=None):
+    """执行批量生成, 返回 Progress"""
+    model = model or DEFAULT_MODELS[backend]
+    generate = make_generator(backend, model, max_tokens)
+
+    # 先快速扫一遍输入, 算出总数与已完成数 (用于 ETA)
+    done = load_done(output_path)
+    total = skipped = 0
+    for row_id, _ in iter_events(input_path, field):
+        total += 1
+        skipped += row_id in done
+    progress = Progress(total, skipped)
+    pending = ((row_id, event) for row_id, event in iter_events(input_path, field) if row_id not in done)
+
+    print(f"🚀 {backend} / {model} | 共 {total} 笔, 已完成 {progress.skipped} 笔, 并发 {concurrency}")
+
+    def work(row_id, event):
+        try:
+            post, cached = generate(event)
+            return {"id": row_id, "event": event, "model": model, "post": post}, cached
+        except Exception as e:
+            return {"id": row_id, "event": event, "model": model, "error": str(e)}, False
+
+    with open(output_path, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as executor:
+        in_flight = set()
+        try:
+            for row_id, event in pending:
+                # 最多只有 2 x 并发数 的事件在排队, 输入再大内存也不会增长
+                if len(in_flight) >= concurrency * 2:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    _write_results(finished, out, progress)
+                in_flight.add(executor.submit(work, row_id, event))
+            finished, _ = wait(in_flight)
+            _write_results(finished, out, progress)
+        except KeyboardInterrupt:
+            print("\n⏹️  中断: 等待进行中的请求完成后保存进度...")
+            for future in in_flight:
+                future.cancel()
+            finished, _ = wait(in_flight)
+            _write_results([f for f in finished if not f.cancelled()], out, progress)
+            progress.report()
+            print("重新执行同样的命令即可从中断处继续")
+            raise
+
+    progress.report(final=True)
+    return progress
+
+
+def _write_results(finished, out, progress):
+    for future in finished:
+        record, cached = future.result()
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        progress.update("post" in record, cached)
+    out.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lucky Vicky 批量生成 (支持中断续跑)")
+    parser.add_argument("input", help="事件文件 (.jsonl 或 .csv)")
+    parser.add_argument("-o", "--output", help="输出 JSONL (默认: <输入文件名>.posts.jsonl)")
+    parser.add_argument("--backend", choices=sorted(DEFAULT_MODELS), default="groq",
+                        help="groq 使用 aisuite, hf 使用 huggingface_hub InferenceClient")
+    parser.add_argument("--model", help="模型 ID (默认依 backend 而定)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="同时进行的请求数")
+    parser.add_argument("--field", default="event", help="事件所在的字段 / 栏位名称")
+    parser.add_argument("--max-tokens", type=int, help="每篇贴文的 max_tokens (默认与应用相同的 500)")
+    args = parser.parse_args(argv)
+
+    output = args.output or os.path.splitext(args.input)[0] + ".posts.jsonl"
+    try:
+        progress = run_batch(args.input, output, args.backend, args.model, args.concurrency,
+                             args.field, args.max_tokens)
+    except KeyboardInterrupt:
+        return 130
+    print(f"✅ 结果已写入 {output}")
+    return 1 if progress.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+缓存 key 正规化 - 效能测试
+1. 每个事件的正规化耗时 (首次计算 / lru_cache 命中)
+2. 在人工整理的事件写法 (保留组) 上, 有多少写法被合并、有没有不同事件被误合并
+3. 保留组的不同缓存 key 数在正规化前后的变化
+
+不报告命中率: 保留组只有几十种写法, 任何大小接近正式环境 (512 条) 的缓存都装得下,
+命中率在正规化前后都接近 100%, 看不出差别; 合并率与 key 数减少才是正规化真正的效果
+
+执行: python bench_normalization.py
+"""
+
+import random
+import time
+
+from event_normalizer import normalize_event
+from response_cache import make_cache_key
+
+# 基础事件 (包含 Streamlit 侧边栏与 Gradio 的范例)
+BASE_EVENTS = [
+    "今天咖啡灑到電腦上了!",
+    "出門忘記帶傘,結果下大雨",
+    "考試考得不太好",
+    "今天遲到了10分鐘",
+    "手機掉到水裡了",
+    "錢包不見了",
+    "搭捷運坐過站",
+    "下班前被老闆叫去開會",
+    "新買的鞋子被踩髒了",
+    "排隊排了很久結果賣完了",
+]
+
+# 人工整理的事件写法 (保留组, 不是由正规化规则反推生成的):
+# 模拟不同使用者真的会打出来的样子 —— 简体输入法、手机全形标点、口语改写、错字、加减字;
+# 其中有些只是表面差异 (正规化应该合并), 有些是改写 (正规化本来就合并不了)
+HELD_OUT_VARIANTS = {
+    "今天咖啡灑到電腦上了!": [
+        "今天咖啡洒到电脑上了！", "今天咖啡灑到電腦上了！！", "今天咖啡灑到電腦上了😭😭",
+        "今天咖啡洒在电脑上了", "今天把咖啡打翻在電腦上", "咖啡灑到電腦上了...",
+        "今天咖啡撒到电脑上了", "今天 咖啡灑到電腦上了",
+    ],
+    "出門忘記帶傘,結果下大雨": [
+        "出門忘記帶傘，結果下大雨", "出门忘记带伞,结果下大雨", "出門忘了帶傘結果下大雨",
+        "出門忘記帶雨傘,結果下大雨", "出門沒帶傘 結果下超大雨", "出门忘记带伞，结果下大雨了",
+    ],
+    "考試考得不太好": [
+        "考試考得不太好。", "考试考得不太好", "考試考得不太好😢", "考試考不太好",
+        "這次考試考得不太好", "考試考得不好",
+    ],
+    "今天遲到了10分鐘": [
+        "今天遲到了１０分鐘", "今天迟到了10分钟", "今天遲到了十分鐘", "今天遲到10分鐘",
+        "今天遲到了 10 分鐘", "今天又遲到了10分鐘",
+    ],
+    "手機掉到水裡了": [
+        "手機掉到水裡了！", "手机掉到水里了", "手機掉進水裡了", "手機不小心掉到水裡了",
+        "手機掉到水裏了", "手機掉水裡了💦",
+    ],
+    "錢包不見了": ["錢包不見了!!", "钱包不见了", "錢包不見了…", "我的錢包不見了", "皮夾不見了"],
+    "搭捷運坐過站": ["搭捷運坐過站了", "搭捷运坐过站", "搭捷運搭過站", "坐捷運坐過頭了"],
+    "下班前被老闆叫去開會": [
+        "下班前被老闆叫去開會。", "下班前被老板叫去开会", "快下班了被老闆叫去開會",
+    ],
+    "新買的鞋子被踩髒了": ["新買的鞋子被踩髒了😭", "新买的鞋子被踩脏了", "新鞋被踩髒了"],
+    "排隊排了很久結果賣完了": [
+        "排隊排了很久結果賣完了!", "排队排了很久结果卖完了", "排隊排很久結果賣完了",
+    ],
+}
+
+
+def build_corpus(size=5000, seed=42):
+    """按 Zipf 分布抽基础事件, 再从保留组中随机选一种写法 (原文本身也算一种); 只用来测耗时"""
+    rng = random.Random(seed)
+    weights = [1 / (i + 1) for i in range(len(BASE_EVENTS))]
+    corpus = []
+    for _ in range(size):
+        event = rng.choices(BASE_EVENTS, weights)[0]
+        corpus.append(rng.choice([event] + HELD_OUT_VARIANTS[event]))
+    return corpus
+
+
+def merge_report():
+    """
+    保留组上的合并情况
+
+    返回:
+        (合并到原文 key 的写法数, 写法总数, 不同事件被误合并的对数)
+    """
+    merged = total = 0
+    for event, variants in HELD_OUT_VARIANTS.items():
+        base = normalize_event(event)
+        total += len(variants)
+        merged += sum(normalize_event(variant) == base for variant in variants)
+    keys = {}
+    for event, variants in HELD_OUT_VARIANTS.items():
+        for text in [event] + variants:
+            keys.setdefault(normalize_event(text), set()).add(event)
+    collisions = sum(len(events) - 1 for events in keys.values())
+    return merged, total, collisions
+
+
+def distinct_keys():
+    """保留组 (含原文) 的不同 key 数: (原文比对, 正规化后)"""
+    texts = [text for event, variants in HELD_OUT_VARIANTS.items() for text in [event] + variants]
+    return len(set(texts)), len({normalize_event(text) for text in texts})
+
+
+def bench_cost(corpus):
+    normalize_event.cache_clear()
+    unique = list(dict.fromkeys(corpus))
+
+    start = time.perf_counter()
+    for text in unique:
+        normalize_event(text)
+    cold = (time.perf_counter() - start) / len(unique)
+
+    start = time.perf_counter()
+    for text in corpus:
+        normalize_event(text)
+    warm = (time.perf_counter() - start) / len(corpus)
+
+    start = time.perf_counter()
+    for text in corpus:
+        make_cache_key("system", text, "model", temperature=0.8)
+    key_cost = (time.perf_counter() - start) / len(corpus)
+    return cold, warm, key_cost
+
+
+def main():
+    corpus = build_corpus()
+
+    cold, warm, key_cost = bench_cost(corpus)
+    print("=" * 60)
+    print("正规化耗时 (每个事件)")
+    print("=" * 60)
+    print(f"首次计算:        {cold * 1e6:8.2f} µs")
+    print(f"lru_cache 命中:  {warm * 1e6:8.2f} µs")
+    print(f"完整缓存 key:    {key_cost * 1e6:8.2f} µs")
+
+    merged, total, collisions = merge_report()
+    exact_keys, norm_keys = distinct_keys()
+    print("\n" + "=" * 60)
+    print(f"保留组 ({len(BASE_EVENTS)} 个基础事件, {total} 种写法)")
+    print("=" * 60)
+    print(f"合并到原文 key: {merged}/{total} 种写法 ({merged / total:.0%}); 未合并的大多是改写, 要靠语义缓存")
+    print(f"不同 key 数:    {exact_keys} -> {norm_keys} ({norm_keys / exact_keys - 1:+.0%})")
+    print(f"不同事件误合并: {collisions} 对")
+
+
+if __name__ == "__main__":
+    main()
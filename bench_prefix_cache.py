@@ -0,0 +1,115 @@
+"""
+本地推理前缀 KV 缓存 - 效能测试
+每个请求都以同一段 Lucky Vicky system prompt 开头, 只有使用者输入的事件不同:
+1. prompt 的 token 组成 (固定前缀 / 事件)
+2. 每个事件的 prefill 耗时: 整段重新计算 vs 重复使用前缀的 KV 快照
+3. 两种方式算出的 logits 是否一致
+
+执行:
+    python bench_prefix_cache.py                              # 随机初始化的模型 (不需要下载)
+    python bench_prefix_cache.py --model-dir .cache/local_model
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from bench_normalization import BASE_EVENTS
+from local_backend import create_random_model, get_local_model
+from prompt_templates import LUCKY_VICKY
+
+# 比迷你模型大一些, prefill 耗时才比较接近真实模型的比例
+BENCH_CONFIG = {"dim": 256, "n_layers": 4, "n_heads": 8, "n_kv_heads": 4, "hidden_dim": 704}
+
+
+def timed(fn, repeat):
+    """执行 repeat 次, 返回 (最后一次的结果, 耗时中位数)"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, statistics.median(times)
+
+
+def bench(model, repeat=3):
+    rows = []
+    for event in BASE_EVENTS:
+        messages = LUCKY_VICKY.build(event)
+        prefix_ids, rest_ids = model.encode_prompt(messages)
+        prompt_ids = prefix_ids + rest_ids
+
+        (_, full_logits), full_time = timed(lambda: model.prefill(prompt_ids), repeat)
+        model.prefill(prompt_ids, len(prefix_ids))  # 确保前缀已经在缓存里
+        (_, cached_logits), cached_time = timed(lambda: model.prefill(prompt_ids, len(prefix_ids)), repeat)
+        rows.append({
+            "event": event,
+            "prefix_tokens": len(prefix_ids),
+            "event_tokens": len(rest_ids),
+            "full": full_time,
+            "cached": cached_time,
+            "max_diff": float(np.abs(full_logits - cached_logits).max()),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地推理前缀 KV 缓存效能测试")
+    parser.add_argument("--model-dir", help="本地模型目录 (默认生成随机初始化的模型)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_dir = args.model_dir or create_random_model(os.path.join(tmp, "bench_model"), BENCH_CONFIG)
+        model = get_local_model(model_dir)
+        model.prefix_cache.clear()
+
+        # 第一次请求: 前缀缓存未命中, 要算整段前缀
+        messages = LUCKY_VICKY.build(BASE_EVENTS[0])
+        prefix_ids, rest_ids = model.encode_prompt(messages)
+        start = time.perf_counter()
+        model.prefill(prefix_ids + rest_ids, len(prefix_ids))
+        first = time.perf_counter() - start
+
+        rows = bench(model, args.repeat)
+
+    prefix_tokens = rows[0]["prefix_tokens"]
+    event_tokens = statistics.mean(row["event_tokens"] for row in rows)
+    full = statistics.mean(row["full"] for row in rows)
+    cached = statistics.mean(row["cached"] for row in rows)
+
+    print("=" * 60)
+    print(f"Prompt 组成 ({len(rows)} 个事件)")
+    print("=" * 60)
+    print(f"固定前缀 (system prompt):  {prefix_tokens:6d} tokens")
+    print(f"事件 + 助手开头 (平均):    {event_tokens:6.1f} tokens")
+    print(f"前缀占比:                  {prefix_tokens / (prefix_tokens + event_tokens):6.1%}")
+
+    print("\n" + "=" * 60)
+    print("Prefill 耗时 (每个请求, 中位数取平均)")
+    print("=" * 60)
+    print(f"整段重新计算:      {full * 1000:8.2f} ms")
+    print(f"使用前缀缓存:      {cached * 1000:8.2f} ms")
+    print(f"首次 (建立缓存):   {first * 1000:8.2f} ms")
+    print(f"加速:              {full / cached:8.2f}x")
+    print(f"理想值 (只算事件): {(prefix_tokens + event_tokens) / event_tokens:8.2f}x")
+
+    print("\n" + "=" * 60)
+    print("各事件明细")
+    print("=" * 60)
+    for row in rows:
+        print(f"{row['event']:<20} {row['event_tokens']:4d} tokens  "
+              f"{row['full'] * 1000:7.2f} ms -> {row['cached'] * 1000:7.2f} ms  "
+              f"(logits 差异 {row['max_diff']:.1e})")
+
+    stats = model.prefix_cache.stats()
+    print(f"\n前缀缓存: 命中 {stats['hits']} / 未命中 {stats['misses']} / "
+          f"省下 {stats['reused_tokens']} 个 token 的 prefill")
+
+
+if __name__ == "__main__":
+    main()
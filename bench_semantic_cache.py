@@ -0,0 +1,128 @@
+"""
+语义缓存门槛验证
+在人工标注的事件对上计算每个门槛的命中 (同义) 与误命中 (不同义):
+1. 同义: 同一件事的不同说法, 应该共用贴文
+2. 不同义: 字面很像但意思相反或不同的事件, 绝对不能共用贴文
+误命中的代价 (把「考得很好」的贴文给「考得不太好」的人) 远高于少命中一次,
+所以门槛要比调参组上最像的不同义事件对至少高 THRESHOLD_MARGIN;
+保留组 (HELD_OUT_*) 没有参与调参, 用来确认门槛与反义字表不是只对调参组有效
+
+执行: python bench_semantic_cache.py
+"""
+
+from semantic_cache import DEFAULT_THRESHOLD, THRESHOLD_MARGIN, embed_event, polarity
+
+# 调参组: 门槛与反义字表按这些事件对调整
+PARAPHRASES = [
+    ("手機掉到水裡了", "手機不小心掉進水裡"),
+    ("手機掉到水裡了", "手機掉進水裡"),
+    ("今天咖啡灑到電腦上了!", "今天把咖啡打翻在電腦上"),
+    ("出門忘記帶傘,結果下大雨", "出門沒帶傘結果下大雨"),
+    ("出門忘記帶傘,結果下大雨", "出門忘了帶傘 結果下大雨"),
+    ("考試考得不太好", "這次考試考得不好"),
+    ("考試考得不太好", "考試沒考好"),
+    ("今天遲到了10分鐘", "今天又遲到了十分鐘"),
+    ("今天遲到了10分鐘", "今天遲到十分鐘"),
+    ("錢包不見了", "我的錢包不見了"),
+    ("錢包不見了", "錢包弄丟了"),
+    ("搭捷運坐過站", "搭捷運坐過頭了"),
+    ("下班前被老闆叫去開會", "快下班了被老闆叫去開會"),
+    ("新買的鞋子被踩髒了", "新鞋被人踩髒了"),
+    ("排隊排了很久結果賣完了", "排隊排很久結果賣完了"),
+]
+
+NON_PARAPHRASES = [
+    ("考試考得不太好", "考試考得很好"),
+    ("今天沒有遲到", "今天遲到了"),
+    ("今天遲到了10分鐘", "今天早到了10分鐘"),
+    ("出門忘記帶傘", "出門忘記帶錢包"),
+    ("咖啡灑到電腦", "咖啡灑到衣服"),
+    ("手機掉到水裡了", "錢包掉到水裡了"),
+    ("搭捷運坐過站", "搭公車坐過站"),
+    ("新買的鞋子被踩髒了", "新買的衣服被弄髒了"),
+    ("錢包不見了", "鑰匙不見了"),
+    ("排隊排了很久結果賣完了", "排隊排了很久終於買到了"),
+    ("下班前被老闆叫去開會", "下班前被老闆請吃飯"),
+    ("今天很累", "今天不累"),
+]
+
+# 保留组: 调完门槛之后才加入, 不能拿来调参 (加了新的事件对就要一起看调参组与保留组)
+HELD_OUT_PARAPHRASES = [
+    ("今天睡過頭了", "今天不小心睡過頭"),
+    ("公車沒等我就開走了", "公車開走了沒等我"),
+    ("鑰匙忘在家裡", "鑰匙忘在家裡了"),
+    ("電梯壞了只好爬樓梯", "電梯壞掉了只好爬樓梯"),
+    ("晚餐煮焦了", "晚餐不小心煮焦了"),
+    ("下雨鞋子都濕了", "下雨天鞋子濕了"),
+    ("被蚊子咬了好幾個包", "被蚊子咬好幾個包"),
+    ("手機螢幕摔破了", "手機螢幕摔破"),
+    ("外送送錯餐點", "外送送錯了餐點"),
+    ("感冒請假在家", "感冒了請假在家"),
+]
+
+HELD_OUT_NON_PARAPHRASES = [
+    ("今天比賽贏了", "今天比賽輸了"),
+    ("外面下大雨", "外面下小雨"),
+    ("這次分數很高", "這次分數很低"),
+    ("今天早起了", "今天晚起了"),
+    ("薪水變多了", "薪水變少了"),
+    ("今天很冷", "今天很熱"),
+    ("晚餐煮焦了", "早餐煮焦了"),
+    ("鑰匙忘在家裡", "鑰匙忘在公司"),
+    ("電梯壞了只好爬樓梯", "電梯修好了不用爬樓梯"),
+    ("手機螢幕摔破了", "手機殼摔破了"),
+    ("感冒請假在家", "感冒還是去上班"),
+    ("公車沒等我就開走了", "公車等我才開走"),
+]
+
+THRESHOLDS = [0.70, 0.75, 0.80, 0.85, 0.90, 0.95]
+
+
+def score(a, b):
+    """与 SemanticCache.get 相同的判断: 否定 / 程度 / 反义字标记不同时视为 0"""
+    if polarity(a) != polarity(b):
+        return 0.0
+    return float(embed_event(a) @ embed_event(b))
+
+
+def report_worst(title, negatives, pairs):
+    print("\n" + "=" * 60)
+    print(title)
+    print("=" * 60)
+    ranked = sorted(zip(negatives, pairs), reverse=True)
+    for s, (a, b) in ranked[:5]:
+        print(f"{s:.3f}  {a} / {b}")
+
+
+def main():
+    positives = [score(a, b) for a, b in PARAPHRASES]
+    negatives = [score(a, b) for a, b in NON_PARAPHRASES]
+
+    print("=" * 60)
+    print(f"调参组门槛扫描 ({len(PARAPHRASES)} 对同义, {len(NON_PARAPHRASES)} 对不同义)")
+    print("=" * 60)
+    for threshold in THRESHOLDS:
+        hits = sum(s >= threshold for s in positives)
+        false_hits = sum(s >= threshold for s in negatives)
+        marker = "  <- 目前默认" if threshold == DEFAULT_THRESHOLD else ""
+        print(f"{threshold:.2f}: 命中 {hits:2d}/{len(positives)}  误命中 {false_hits:2d}/{len(negatives)}{marker}")
+
+    worst = max(negatives)
+    print(f"\n最像的不同义事件对: {worst:.3f}, 门槛至少要 {worst + THRESHOLD_MARGIN:.3f} "
+          f"(余量 {THRESHOLD_MARGIN}); 目前默认 {DEFAULT_THRESHOLD} "
+          f"{'OK' if DEFAULT_THRESHOLD >= worst + THRESHOLD_MARGIN else '余量不足'}")
+    report_worst("调参组最像的不同义事件对", negatives, NON_PARAPHRASES)
+
+    held_positives = [score(a, b) for a, b in HELD_OUT_PARAPHRASES]
+    held_negatives = [score(a, b) for a, b in HELD_OUT_NON_PARAPHRASES]
+    print("\n" + "=" * 60)
+    print(f"保留组 (门槛 {DEFAULT_THRESHOLD}, {len(held_positives)} 对同义, {len(held_negatives)} 对不同义)")
+    print("=" * 60)
+    print(f"命中 {sum(s >= DEFAULT_THRESHOLD for s in held_positives)}/{len(held_positives)}  "
+          f"误命中 {sum(s >= DEFAULT_THRESHOLD for s in held_negatives)}/{len(held_negatives)}  "
+          f"最像的不同义事件对 {max(held_negatives):.3f} (余量 {DEFAULT_THRESHOLD - max(held_negatives):.3f})")
+    report_worst("保留组最像的不同义事件对", held_negatives, HELD_OUT_NON_PARAPHRASES)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+共享客户端工厂 - Keep-Alive 连接池
+所有入口 (Streamlit / Gradio / Groq 脚本 / Notebook) 都通过这里获取
+aisuite 与 huggingface_hub 的客户端,避免每次请求都重新建立 TLS 连接
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from rate_limiter import get_rate_limiter
+from retry_policy import budget_timeout
+
+# ============================================
+# 配置
+# ============================================
+
+DEFAULT_MAX_SIZE = 8          # 每个 (provider, base_url, token) 最多同时存在的客户端数
+DEFAULT_IDLE_TIMEOUT = 300.0  # 空闲超过此秒数的客户端会被回收
+DEFAULT_ACQUIRE_TIMEOUT = 30.0
+DEFAULT_REAP_INTERVAL = 60.0
+
+
+class PoolExhausted(RuntimeError):
+    """连接池已满且在超时时间内没有客户端被归还"""
+
+
+# ============================================
+# 连接池
+# ============================================
+
+class _Slot:
+    """单个 key 对应的池状态"""
+
+    def __init__(self):
+        self.idle = deque()   # (client, last_used)
+        self.in_use = 0
+
+
+class ClientPool:
+    """
+    线程安全的客户端池
+
+    参数:
+        max_size: 每个 key 允许的最大客户端数 (空闲 + 使用中)
+        idle_timeout: 空闲客户端的最长保留时间 (秒)
+        acquire_timeout: 池满时等待归还的最长时间 (秒)
+        reap_interval: 后台回收线程的执行间隔 (秒), 0 表示不启动
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT, reap_interval=DEFAULT_REAP_INTERVAL):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+        self.reap_interval = reap_interval
+
+        self._slots = {}
+        self._cond = threading.Condition()
+        self._reaper = None
+        self._stats = {"hits": 0, "misses": 0, "created": 0, "reaped": 0,
+                       "discarded": 0, "waits": 0}
+
+    def acquire(self, key, factory):
+        """从池中取出一个客户端, 没有空闲时用 factory() 新建"""
+        self._ensure_reaper()
+        deadline = time.monotonic() + self.acquire_timeout
+
+        with self._cond:
+            slot = self._slots.setdefault(key, _Slot())
+            while True:
+                if slot.idle:
+                    client, _ = slot.idle.pop()  # LIFO: 优先复用最热的连接
+                    slot.in_use += 1
+                    self._stats["hits"] += 1
+                    return client
+                if slot.in_use < self.max_size:
+                    slot.in_use += 1
+                    self._stats["misses"] += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolExhausted(f"客户端池已满: {key[0]} (max_size={self.max_size})")
+                self._stats["waits"] += 1
+                self._cond.wait(remaining)
+
+        # 在锁外创建客户端, 避免慢速初始化阻塞其他线程
+        try:
+            client = factory()
+        except BaseException:
+            with self._cond:
+                slot.in_use -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats["created"] += 1
+        return client
+
+    def release(self, key, client, discard=False):
+        """归还客户端; discard=True 时直接丢弃 (例如连接已损坏)"""
+        with self._cond:
+            slot = self._slots.setdefault(key, _Slot())
+            slot.in_use = max(0, slot.in_use - 1)
+            if discard:
+                self._stats["discarded"] += 1
+            else:
+                slot.idle.append((client, time.monotonic()))
+            self._cond.notify()
+        if discard:
+            _close_client(client)
+
+    @contextmanager
+    def lease(self, key, factory):
+        """with 语法: 借出客户端, 用完自动归还"""
+        client = self.acquire(key, factory)
+        try:
+            yield client
+        except (ConnectionError, OSError):
+            self.release(key, client, discard=True)
+            raise
+        except BaseException:
+            self.release(key, client)
+            raise
+        else:
+            self.release(key, client)
+
+    def reap_idle(self, now=None):
+        """关闭并移除空闲超时的客户端, 返回回收数量"""
+        now = time.monotonic() if now is None else now
+        expired = []
+        with self._cond:
+            for key, slot in list(self._slots.items()):
+                while slot.idle and now - slot.idle[0][1] > self.idle_timeout:
+                    expired.append(slot.idle.popleft()[0])
+                if not slot.idle and slot.in_use == 0:
+                    del self._slots[key]
+            self._stats["reaped"] += len(expired)
+        for client in expired:
+            _close_client(client)
+        return len(expired)
+
+    def close_all(self):
+        """关闭所有空闲客户端"""
+        with self._cond:
+            clients = [c for slot in self._slots.values() for c, _ in slot.idle]
+            for slot in self._slots.values():
+                slot.idle.clear()
+        for client in clients:
+            _close_client(client)
+
+    def stats(self):
+        """返回命中/未命中等统计信息"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats["idle"] = sum(len(s.idle) for s in self._slots.values())
+            stats["in_use"] = sum(s.in_use for s in self._slots.values())
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / total if total else 0.0
+        return stats
+
+    def _ensure_reaper(self):
+        if self.reap_interval <= 0 or self._reaper is not None:
+            return
+        with self._cond:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap_loop, name="client-pool-reaper",
+                                            daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(self.reap_interval)
+            self.reap_idle()
+
+
+def _close_client(client):
+    close = getattr(client, "close", None)
+    if callable(close):
+        try:
+            close()
+        except Exception:
+            pass
+
+
+def token_fingerprint(secret):
+    """Token 只以哈希形式出现在 key 中, 避免泄露到日志或统计里"""
+    if not secret:
+        return "anonymous"
+    return hashlib.sha256(secret.encode("utf-8")).hexdigest()[:12]
+
+
+# ============================================
+# 客户端工厂
+# ============================================
+
+_default_pool = ClientPool()
+
+
+def get_pool():
+    """获取进程内共享的默认连接池"""
+    return _default_pool
+
+
+def build_hf_client(token=None, base_url=None, timeout=None):
+    """创建 Hugging Face InferenceClient (不经过连接池)"""
+    from huggingface_hub import InferenceClient
+
+    kwargs = {}
+    if token:
+        kwargs["token"] = token
+    if base_url:
+        kwargs["base_url"] = base_url
+    if timeout:
+        kwargs["timeout"] = timeout
+    return InferenceClient(**kwargs)
+
+
+def build_aisuite_client(provider_configs=None):
+    """创建 aisuite Client (不经过连接池)"""
+    import aisuite as ai
+
+    if provider_configs:
+        return ai.Client(provider_configs)
+    return ai.Client()
+
+
+@contextmanager
+def hf_client(token=None, base_url=None, timeout=None, pool=None, rate_limit=True):
+    """
+    从连接池借出 Hugging Face 客户端
+
+    rate_limit=True 时先向共享令牌桶取得一个请求额度 (每次借出视为一次请求);
+    在 RetryPolicy 之内借出时, 客户端的 timeout 会缩短为重试 deadline 剩下的时间
+
+    用法:
+        with hf_client(HF_TOKEN) as client:
+            client.chat_completion(...)
+    """
+    pool = pool or _default_pool
+    key = ("huggingface", base_url or "default", token_fingerprint(token))
+    if rate_limit:
+        get_rate_limiter().acquire("huggingface", key[2])
+    with pool.lease(key, lambda: build_hf_client(token, base_url, timeout)) as client, \
+            budget_timeout(client):
+        yield client
+
+
+@contextmanager
+def aisuite_client(provider="groq", provider_configs=None, pool=None, rate_limit=True):
+    """
+    从连接池借出 aisuite 客户端
+
+    key 中包含该 provider 的 API Key 指纹, 换 Key 后不会复用旧连接;
+    rate_limit=True 时先向该 provider + API Key 的令牌桶取得请求额度
+    """
+    pool = pool or _default_pool
+    api_key = os.getenv(f"{provider.upper()}_API_KEY")
+    config = (provider_configs or {}).get(provider, {})
+    base_url = config.get("base_url", "default")
+    key = ("aisuite:" + provider, base_url, token_fingerprint(config.get("api_key") or api_key))
+    if rate_limit:
+        get_rate_limiter().acquire(provider, key[2])
+    with pool.lease(key, lambda: build_aisuite_client(provider_configs)) as client:
+        yield client
+
+
+def pool_stats():
+    """默认连接池的统计信息"""
+    return _default_pool.stats()
@@ -0,0 +1,251 @@
+"""
+磁盘持久化响应缓存 (SQLite)
+Streamlit Cloud 重启、多个 Gradio worker 之间共享同一份缓存:
+- WAL 模式, 多进程并发读写安全
+- 超过容量上限时按最近访问时间淘汰
+- 定期清理过期条目并压缩数据库文件 (在后台线程执行, 不阻塞写入的调用者)
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+# ============================================
+# 配置
+# ============================================
+
+DEFAULT_DB_PATH = os.getenv("LUCKY_VICKY_CACHE_DB", os.path.join(".cache", "lucky_vicky_cache.sqlite3"))
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024   # 50 MB
+DEFAULT_MAX_ENTRIES = 20000
+DEFAULT_TTL = 7 * 24 * 3600.0          # 7 天
+DEFAULT_COMPACT_INTERVAL = 3600.0      # 每小时最多压缩一次 (跨进程协调)
+EVICT_EVERY_N_WRITES = 50
+ACCESS_UPDATE_INTERVAL = 60.0          # 读取时最多每分钟更新一次访问时间, 减少写锁争用
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    expires REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed);
+CREATE INDEX IF NOT EXISTS idx_responses_expires ON responses(expires);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+"""
+
+
+class DiskCache:
+    """
+    SQLite 响应缓存, 接口与 ResponseCache 相同 (get / set / stats)
+
+    参数:
+        path: 数据库文件路径
+        max_bytes: 缓存内容总大小上限
+        max_entries: 条目数上限
+        ttl: 条目有效期 (秒)
+        compact_interval: 两次压缩之间的最短间隔 (秒)
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, max_bytes=DEFAULT_MAX_BYTES,
+                 max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL,
+                 compact_interval=DEFAULT_COMPACT_INTERVAL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.compact_interval = compact_interval
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._maintaining = False
+        self._stats = {"hits": 0, "misses": 0, "bypasses": 0, "writes": 0,
+                       "evictions": 0, "compactions": 0, "errors": 0}
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+
+    # ----------------------------------------
+    # 连接管理: 每个线程一条连接
+    # ----------------------------------------
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    # ----------------------------------------
+    # 读写
+    # ----------------------------------------
+
+    def get(self, key, fresh=False):
+        """读取缓存; 不存在、已过期或数据库忙碌时返回 None"""
+        if fresh:
+            self._count("bypasses")
+            return None
+        now = time.time()
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, expires, accessed FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] <= now:
+                self._count("misses")
+                return None
+            if now - row[2] > ACCESS_UPDATE_INTERVAL:
+                conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        except sqlite3.Error:
+            # 缓存故障不能影响生成, 当作未命中
+            self._count("errors")
+            self._count("misses")
+            return None
+        self._count("hits")
+        return row[0]
+
+    def set(self, key, value, ttl=None):
+        """写入缓存, 每隔若干次写入在后台检查容量并视需要压缩"""
+        now = time.time()
+        expires = now + (self.ttl if ttl is None else ttl)
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, expires, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, expires, now),
+            )
+        except sqlite3.Error:
+            self._count("errors")
+            return
+        self._count("writes")
+
+        with self._lock:
+            self._writes += 1
+            due = self._writes % EVICT_EVERY_N_WRITES == 0
+        if due:
+            self._schedule_maintenance()
+
+    def _schedule_maintenance(self):
+        """在后台线程执行淘汰与压缩 (VACUUM 可能要几秒, 同一时间最多一个)"""
+        with self._lock:
+            if self._maintaining:
+                return
+            self._maintaining = True
+        threading.Thread(target=self._maintain, name="disk-cache-maintenance", daemon=True).start()
+
+    def _maintain(self):
+        try:
+            self.evict()
+            self.maybe_compact()
+        finally:
+            with self._lock:
+                self._maintaining = False
+
+    def evict(self):
+        """删除过期条目, 再按最近访问时间淘汰直到满足容量上限, 返回删除数量"""
+        removed = 0
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                removed += conn.execute("DELETE FROM responses WHERE expires <= ?", (time.time(),)).rowcount
+                count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+                while count > self.max_entries or total > self.max_bytes:
+                    # 每轮淘汰约 10% 的最旧条目, 避免逐条删除
+                    batch = max(1, count // 10, count - self.max_entries)
+                    removed += conn.execute(
+                        "DELETE FROM responses WHERE key IN "
+                        "(SELECT key FROM responses ORDER BY accessed ASC LIMIT ?)", (batch,)
+                    ).rowcount
+                    count, total = conn.execute(
+                        "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+                    ).fetchone()
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            self._count("errors")
+            return removed
+        self._count("evictions", removed)
+        return removed
+
+    def maybe_compact(self, force=False):
+        """
+        定期压缩: 截断 WAL 并 VACUUM 回收空间
+
+        上次压缩时间记录在数据库里, 多个进程中只有一个会真正执行
+        """
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT value FROM meta WHERE name = 'last_compact'").fetchone()
+            if not force and row is not None and now - row[0] < self.compact_interval:
+                conn.execute("COMMIT")
+                return False
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('last_compact', ?)", (now,))
+            conn.execute("COMMIT")
+
+            conn.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.execute("VACUUM")
+        except sqlite3.Error:
+            # 其他进程正在读写时 VACUUM 可能失败, 下个周期再试
+            self._count("errors")
+            return False
+        self._count("compactions")
+        return True
+
+    def clear(self):
+        self._connect().execute("DELETE FROM responses")
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self):
+        """本进程的命中/未命中统计, 以及数据库目前的大小"""
+        with self._lock:
+            stats = dict(self._stats)
+        try:
+            count, total = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        except sqlite3.Error:
+            count, total = None, None
+        stats["size"] = count
+        stats["bytes"] = total
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+_default_disk_cache = None
+_default_lock = threading.Lock()
+
+
+def get_disk_cache(path=DEFAULT_DB_PATH):
+    """获取进程内共享的磁盘缓存 (首次调用时打开数据库)"""
+    global _default_disk_cache
+    if _default_disk_cache is None:
+        with _default_lock:
+            if _default_disk_cache is None:
+                _default_disk_cache = DiskCache(path)
+    return _default_disk_cache
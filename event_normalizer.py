@@ -0,0 +1,80 @@
+"""
+事件文字正规化 (只用于缓存 key)
+同一件事的不同写法折叠成同一个 key:
+- 全形 / 半形 (！ 与 !、全形空白、全形数字)
+- 前后与重复的空白
+- 繁体 / 简体 (常用字对照表, 统一折叠成简体)
+- emoji 与结尾的标点
+送给模型的仍然是使用者输入的原文
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+
+# ============================================
+# 繁简对照 (常用字, 繁 -> 简)
+# ============================================
+
+_TRAD_SIMP_PAIRS = (
+    "機机 腦脑 電电 灑洒 門门 記记 帶带 傘伞 結结 場场 試试 遲迟 鐘钟 錶表 裡里 裏里 "
+    "夠够 說说 話话 這这 個个 們们 來来 時时 間间 會会 後后 過过 還还 對对 沒没 讓让 "
+    "從从 頭头 車车 開开 關关 錢钱 買买 賣卖 東东 樣样 為为 麼么 嗎吗 點点 學学 習习 "
+    "業业 飯饭 廳厅 燈灯 愛爱 興兴 歡欢 樂乐 運运 氣气 壞坏 錯错 誤误 丟丢 發发 髮发 "
+    "現现 實实 際际 辦办 書书 筆笔 紙纸 貓猫 鳥鸟 魚鱼 雞鸡 馬马 飛飞 鐵铁 線线 網网 "
+    "絡络 號号 碼码 區区 醫医 藥药 處处 長长 張张 幫帮 寫写 讀读 聽听 見见 覺觉 遠远 "
+    "邊边 進进 與与 無无 雲云 風风 颱台 臺台 灣湾 國国 產产 單单 雙双 幾几 歲岁 師师 "
+    "員员 聯联 數数 據据 隊队 贏赢 輸输 題题 測测 驗验 壓压 應应 該该 錄录 鬧闹 夢梦 "
+    "準准 備备 戲戏 劇剧 視视 頻频 憶忆 鍵键 盤盘 螢萤 掃扫 傷伤 腳脚 臉脸 膠胶 襪袜 "
+    "褲裤 髒脏 濕湿 乾干 淨净 塊块 層层 樓楼 鑰钥 鎖锁 戶户 餅饼 麵面 湯汤 蘋苹 紅红 "
+    "綠绿 藍蓝 黃黄 顏颜 讚赞 謝谢 請请 問问 認认 識识 約约 遊游 館馆 園园 參参 觀观 "
+    "輛辆 達达 終终 於于 復复 雜杂 難难 簡简 總总 麗丽 體体 較较 盡尽 舊旧 嚇吓 隻只 "
+    "則则 專专 啟启 動动 務务 勞劳 懶懒 決决 計计 劃划 畫画 圖图 訊讯 傳传 給给 連连 "
+    "續续 斷断 掛挂 選选 擇择 溫温 熱热 鍋锅 壺壶 燒烧 煙烟 鬆松 緊紧 節节 慶庆 禮礼 "
+    "親亲 戀恋 婦妇 爺爷 媽妈 孫孙 鄰邻 闆板 獎奖 聞闻 報报 紀纪 態态 衝冲 塵尘 蟲虫 "
+    "蝦虾 貝贝 殼壳 寵宠 顧顾 護护 條条 術术 導导 搶抢 擠挤 擔担 憂忧 慮虑 驚惊 歎叹 "
+    "嘆叹 幣币 價价 貴贵 賺赚 虧亏 損损 郵邮 遞递 貨货 訂订 購购 優优 費费 稅税 帳账"
+)
+
+_TRAD_TO_SIMP = {}
+for _pair in _TRAD_SIMP_PAIRS.split():
+    _TRAD_TO_SIMP.setdefault(ord(_pair[0]), _pair[1])
+
+# ============================================
+# 其他规则 (模块载入时编译一次)
+# ============================================
+
+_EMOJI_RE = re.compile(
+    "["
+    "\U0001F000-\U0001FAFF"   # 表情、符号、交通、补充符号
+    "\u2600-\u27BF"           # 杂项符号与装饰符号
+    "\u2B00-\u2BFF"
+    "\u2300-\u23FF"
+    "\uFE0E\uFE0F"            # 变体选择符
+    "\u200D"                  # 零宽连接符
+    "\u20E3"                  # 组合用键帽
+    "]+"
+)
+_SPACE_RE = re.compile(r"\s+")
+_CJK_GAP_RE = re.compile(r"(?<=[^\x00-\x7f]) (?=[^\x00-\x7f])")
+_TRAILING_PUNCT = "!?.~,;:。、 "
+
+
+@lru_cache(maxsize=4096)
+def normalize_event(text):
+    """
+    把事件文字折叠成缓存用的标准形式
+
+    例如 "今天咖啡灑到電腦上了！ 😭" 与 "今天咖啡洒到电脑上了!" 得到相同结果
+    """
+    if not text:
+        return ""
+    # NFKC: 全形英数与标点 -> 半形, 全形空白 -> 一般空白
+    text = unicodedata.normalize("NFKC", text)
+    text = _EMOJI_RE.sub(" ", text)
+    text = text.translate(_TRAD_TO_SIMP)
+    text = _SPACE_RE.sub(" ", text).strip()
+    # 中文字之间的空白没有意义
+    text = _CJK_GAP_RE.sub("", text)
+    text = text.rstrip(_TRAILING_PUNCT)
+    return text.casefold()
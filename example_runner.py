@@ -0,0 +1,121 @@
+"""
+并发示例执行器
+把互相独立的示例 (各自调用远程模型) 放进线程池并行执行:
+- 并发数有上限, 避免触发 API 速率限制
+- 每个示例的 print 输出先写进自己的缓冲区, 再按原本顺序输出, 结果与顺序执行一致
+- 单个示例失败不影响其他示例
+- 最后报告总耗时 (wall time) 与各示例耗时总和
+"""
+
+import io
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MAX_CONCURRENCY = 4
+
+
+class _ThreadLocalStdout(io.TextIOBase):
+    """按线程分流的 stdout: 设置了缓冲区的线程写进缓冲区, 其余照常输出"""
+
+    def __init__(self, target):
+        self._target = target
+        self._local = threading.local()
+
+    def capture(self, buffer):
+        self._local.buffer = buffer
+
+    def write(self, text):
+        buffer = getattr(self._local, "buffer", None)
+        return (buffer if buffer is not None else self._target).write(text)
+
+    def flush(self):
+        if getattr(self._local, "buffer", None) is None:
+            self._target.flush()
+
+
+class ExampleResult:
+    """单个示例的执行结果"""
+
+    def __init__(self, name):
+        self.name = name
+        self.value = None
+        self.error = None
+        self.elapsed = 0.0
+        self.output = ""
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def run_concurrently(tasks, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """
+    并发执行示例, 按原本顺序打印输出
+
+    参数:
+        tasks: [(名称, 无参数的函数), ...]
+        max_concurrency: 同时执行的示例数上限
+
+    返回:
+        与 tasks 顺序相同的 [ExampleResult, ...]
+    """
+    results = [ExampleResult(name) for name, _ in tasks]
+    done = [threading.Event() for _ in tasks]
+    real_stdout = sys.stdout
+    proxy = _ThreadLocalStdout(real_stdout)
+
+    def work(index, fn):
+        result = results[index]
+        buffer = io.StringIO()
+        proxy.capture(buffer)
+        start = time.perf_counter()
+        try:
+            result.value = fn()
+        except Exception as e:
+            result.error = e
+            print(f"❌ {result.name} 失败: {e}")
+        finally:
+            result.elapsed = time.perf_counter() - start
+            proxy.capture(None)
+            result.output = buffer.getvalue()
+            done[index].set()
+
+    start = time.perf_counter()
+    sys.stdout = proxy
+    try:
+        with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="example") as executor:
+            for index, (_, fn) in enumerate(tasks):
+                executor.submit(work, index, fn)
+            # 按顺序等待: 前面的示例一完成就输出, 不必等全部结束
+            for index, result in enumerate(results):
+                done[index].wait()
+                real_stdout.write(result.output)
+                real_stdout.flush()
+    finally:
+        sys.stdout = real_stdout
+    wall = time.perf_counter() - start
+
+    print_timing(results, wall, max_concurrency)
+    return results
+
+
+def print_timing(results, wall, max_concurrency):
+    """输出各示例耗时、总和与实际总耗时"""
+    total = sum(result.elapsed for result in results)
+    print("=" * 50)
+    print(f"⏱️  耗时统计 (并发数 {max_concurrency})")
+    print("=" * 50)
+    for result in results:
+        status = "✅" if result.ok else "❌"
+        print(f"{status} {result.name:<20} {result.elapsed:6.2f}s")
+    print("-" * 50)
+    print(f"各示例耗时总和: {total:6.2f}s")
+    print(f"实际总耗时:     {wall:6.2f}s")
+    if wall > 0:
+        print(f"加速:           {total / wall:6.2f}x")
+    failed = sum(1 for result in results if not result.ok)
+    if failed:
+        print(f"⚠️  {failed} 个示例失败, 其余示例不受影响")
+    print()
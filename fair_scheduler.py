@@ -0,0 +1,174 @@
+"""
+公平调度器 (asyncio)
+- 全局并发上限: 同一时间最多 max_concurrency 个生成请求在调用远程模型
+- 每个 session 各自排队, session 之间轮流 (round robin) 取得执行名额,
+  一个使用者连按 Enter 也只会排在自己的队列里, 不会挤掉其他人
+- 队列总长度与每个 session 的排队数都有上限, 超过时立即拒绝
+- 可以查询排队位置与预计等待时间, 供界面显示
+"""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+
+# ============================================
+# 配置
+# ============================================
+
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_MAX_QUEUE = 32
+DEFAULT_MAX_PER_SESSION = 2
+DEFAULT_SERVICE_TIME = 8.0   # 还没有样本时假设每个请求需要的秒数
+_SERVICE_ALPHA = 0.2
+
+
+class QueueFull(RuntimeError):
+    """队列已满 (或该 session 排队数已达上限); retry_after 为建议的重试秒数"""
+
+    def __init__(self, message, retry_after):
+        self.retry_after = retry_after
+        super().__init__(message)
+
+
+class Ticket:
+    """一次排队; granted 之后持有一个执行名额, 用完必须 release"""
+
+    def __init__(self, session):
+        self.session = session
+        self.granted = False
+        self.released = False
+        self.started = None
+        self._event = asyncio.Event()
+
+    async def wait(self, timeout=None):
+        """等待取得名额; 超时返回 False (仍在队列中)"""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+class FairScheduler:
+    """
+    按 session 轮流的公平调度器; 所有方法都必须在同一个事件循环中调用
+
+    参数:
+        max_concurrency: 全局并发上限
+        max_queue: 全部 session 合计的排队上限
+        max_per_session: 每个 session 最多同时排队的请求数
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, max_queue=DEFAULT_MAX_QUEUE,
+                 max_per_session=DEFAULT_MAX_PER_SESSION):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_per_session = max_per_session
+        self._queues = OrderedDict()  # session -> deque[Ticket], 顺序即轮转顺序
+        self._running = 0
+        self._queued = 0
+        self._service_time = DEFAULT_SERVICE_TIME
+        self._stats = {"submitted": 0, "queued": 0, "rejected": 0, "completed": 0}
+
+    # ----------------------------------------
+    # 排队与释放
+    # ----------------------------------------
+
+    def submit(self, session):
+        """加入排队; 有空闲名额且没人排队时立即取得名额"""
+        ticket = Ticket(session)
+        self._stats["submitted"] += 1
+        if self._running < self.max_concurrency and self._queued == 0:
+            self._grant(ticket)
+            return ticket
+        queue = self._queues.get(session)
+        if self._queued >= self.max_queue:
+            self._stats["rejected"] += 1
+            raise QueueFull("排队人数已满", self.estimate_wait(self._queued))
+        if queue is not None and len(queue) >= self.max_per_session:
+            self._stats["rejected"] += 1
+            raise QueueFull("同一个 session 排队的请求过多", self.estimate_wait(self.position(queue[-1])))
+        if queue is None:
+            queue = self._queues[session] = deque()
+        queue.append(ticket)
+        self._queued += 1
+        self._stats["queued"] += 1
+        return ticket
+
+    def release(self, ticket):
+        """用完名额 (或放弃排队); 重复调用无副作用"""
+        if ticket.released:
+            return
+        ticket.released = True
+        if ticket.granted:
+            self._running -= 1
+            self._stats["completed"] += 1
+            elapsed = time.monotonic() - ticket.started
+            self._service_time += _SERVICE_ALPHA * (elapsed - self._service_time)
+        else:
+            queue = self._queues.get(ticket.session)
+            if queue is not None and ticket in queue:
+                queue.remove(ticket)
+                self._queued -= 1
+                if not queue:
+                    del self._queues[ticket.session]
+        self._dispatch()
+
+    async def acquire(self, session):
+        """submit + 等待取得名额 (被取消时自动退出队列)"""
+        ticket = self.submit(session)
+        try:
+            await ticket.wait()
+        except BaseException:
+            self.release(ticket)
+            raise
+        return ticket
+
+    def _grant(self, ticket):
+        ticket.granted = True
+        ticket.started = time.monotonic()
+        self._running += 1
+        ticket._event.set()
+
+    def _dispatch(self):
+        """有空闲名额时, 从轮转顺序中的下一个 session 取出最早的请求"""
+        while self._running < self.max_concurrency and self._queues:
+            session, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            self._queued -= 1
+            # 这个 session 移到轮转顺序的最后
+            del self._queues[session]
+            if queue:
+                self._queues[session] = queue
+            self._grant(ticket)
+
+    # ----------------------------------------
+    # 排队位置与预计等待
+    # ----------------------------------------
+
+    def _dispatch_order(self):
+        """按轮转规则模拟之后的出队顺序"""
+        queues = [list(queue) for queue in self._queues.values()]
+        order = []
+        depth = 0
+        while any(depth < len(queue) for queue in queues):
+            order.extend(queue[depth] for queue in queues if depth < len(queue))
+            depth += 1
+        return order
+
+    def position(self, ticket):
+        """前面还有几个请求 (0 表示下一个就轮到); 已取得名额时返回 0"""
+        if ticket.granted:
+            return 0
+        order = self._dispatch_order()
+        return order.index(ticket) if ticket in order else 0
+
+    def estimate_wait(self, position):
+        """排在第 position 位 (从 0 算起) 时的预计等待秒数"""
+        return (position // self.max_concurrency + 1) * self._service_time
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats.update(running=self._running, queued=self._queued,
+                     sessions=len(self._queues), service_time=self._service_time)
+        return stats
@@ -0,0 +1,238 @@
+"""
+模型 fallback 链 + 熔断器 (circuit breaker)
+按顺序尝试多个模型 (例如 Llama-3.2-3B -> Llama-3.2-1B -> Phi-3 -> Groq),
+前一个失败就自动换下一个, 使用者不必手动换模型重试
+
+每个模型各有一个熔断器:
+- 连续失败达到门槛后打开 (open), 冷却期间直接跳过, 不再浪费请求
+- 冷却结束后半开 (half-open), 只放行一个试探请求
+- 试探成功就关闭 (closed) 恢复正常, 失败则重新打开
+所以一个挂掉的模型在冷却期内只会花掉一次失败的请求, 而不是每个使用者各一次
+
+不是模型本身的问题 (我们自己的限流、事件太长) 不计入熔断器;
+被限流时, 同一个提供商 (共用同一个令牌桶) 的其他模型也直接跳过, 改试其他提供商
+"""
+
+import threading
+import time
+
+from prompt_templates import PromptTooLong
+from rate_limiter import RateLimitExceeded
+
+# ============================================
+# 配置
+# ============================================
+
+DEFAULT_FAILURE_THRESHOLD = 3   # 连续失败几次后打开熔断器
+DEFAULT_COOLDOWN = 30.0         # 打开后多久进入半开状态 (秒)
+
+# 这些异常与模型是否正常无关, 不计入熔断器
+NOT_MODEL_FAULT = (RateLimitExceeded, PromptTooLong)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class AllFallbacksFailed(RuntimeError):
+    """fallback 链上所有可用的模型都失败了 (或熔断器全部打开)"""
+
+    def __init__(self, errors):
+        self.errors = errors  # [(模型, 异常), ...]
+        if errors:
+            detail = "; ".join(f"{name}: {error}" for name, error in errors)
+        else:
+            detail = "所有模型的熔断器都处于打开状态, 请稍后再试"
+        super().__init__(detail)
+
+
+class CircuitBreaker:
+    """
+    单个模型的熔断器
+
+    参数:
+        failure_threshold: 连续失败几次后打开
+        cooldown: 打开后经过多少秒进入半开
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, cooldown=DEFAULT_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started = None
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    def _current_state(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+            self._state = HALF_OPEN
+            self._trial_started = None
+        return self._state
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def allow(self):
+        """这次请求能否发给该模型; 半开时同一时间只放行一个试探请求"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN:
+                # 试探请求若迟迟没有结果 (例如被取消), 超过冷却时间后再放行一个
+                now = time.monotonic()
+                if self._trial_started is None or now - self._trial_started >= self.cooldown:
+                    self._trial_started = now
+                    return True
+            self.stats["rejected"] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.stats["calls"] += 1
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["failures"] += 1
+            self._failures += 1
+            if self._current_state() == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.stats["opened"] += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._trial_started = None
+
+
+def model_provider(model):
+    """模型 ID 对应的提供商 (也是限流令牌桶名称的前缀): "groq:..." 为 Groq, 其余为 Hugging Face"""
+    if model.startswith("groq:"):
+        return "groq"
+    return "huggingface"
+
+
+class FallbackChain:
+    """
+    带熔断器的 fallback 链
+
+    参数:
+        models: 按优先顺序排列的模型 ID
+        failure_threshold / cooldown: 每个熔断器的设置
+        provider: 模型 ID -> 提供商名称 (与限流令牌桶的 provider 相同)
+    """
+
+    def __init__(self, models, failure_threshold=DEFAULT_FAILURE_THRESHOLD, cooldown=DEFAULT_COOLDOWN,
+                 provider=model_provider):
+        self.models = list(models)
+        self.provider = provider
+        self.breakers = {model: CircuitBreaker(failure_threshold, cooldown) for model in self.models}
+        self._failure_threshold = failure_threshold
+        self._cooldown = cooldown
+        self._lock = threading.Lock()
+        self._fallbacks = 0
+
+    def _breaker(self, model):
+        with self._lock:
+            breaker = self.breakers.get(model)
+            if breaker is None:
+                breaker = self.breakers[model] = CircuitBreaker(self._failure_threshold, self._cooldown)
+            return breaker
+
+    def order(self, start=None, fallback=True):
+        """使用者选的模型排第一, 之后按链上的顺序; fallback=False 时只有 start"""
+        if start is None:
+            return list(self.models)
+        if not fallback:
+            return [start]
+        return [start] + [model for model in self.models if model != start]
+
+    def candidates(self, start=None, fallback=True, blocked=None):
+        """
+        依序产出熔断器允许的模型 (惰性求值: 成功后就不会再占用后面的试探名额)
+
+        blocked: 被限流的提供商集合 (由 record_error 加入), 这些提供商的模型直接跳过
+        """
+        for index, model in enumerate(self.order(start, fallback)):
+            if blocked and self.provider(model) in blocked:
+                continue
+            if self._breaker(model).allow():
+                if index > 0:
+                    with self._lock:
+                        self._fallbacks += 1
+                yield model
+
+    def record(self, model, ok):
+        breaker = self._breaker(model)
+        if ok:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+
+    def record_error(self, model, error, blocked=None):
+        """
+        记录一次失败的调用
+
+        NOT_MODEL_FAULT 的异常不计入熔断器; 被限流时把该提供商加入 blocked,
+        之后的 candidates 会跳过同一个令牌桶的模型
+        """
+        if isinstance(error, RateLimitExceeded):
+            if blocked is not None:
+                blocked.add(error.bucket.split(":", 1)[0])
+            return
+        if isinstance(error, NOT_MODEL_FAULT):
+            return
+        self.record(model, ok=False)
+
+    def run(self, call, start=None, fallback=True):
+        """
+        依序调用 call(模型) 直到成功; fallback=False 时只经过 start 的熔断器, 不换模型
+
+        返回:
+            (结果, 实际使用的模型)
+        """
+        errors = []
+        blocked = set()
+        for model in self.candidates(start, fallback, blocked):
+            try:
+                result = call(model)
+            except Exception as e:
+                self.record_error(model, e, blocked)
+                errors.append((model, e))
+                continue
+            self.record(model, ok=True)
+            return result, model
+        raise AllFallbacksFailed(errors)
+
+    async def run_async(self, call, start=None, fallback=True):
+        """run 的异步版本, call(模型) 返回 awaitable"""
+        errors = []
+        blocked = set()
+        for model in self.candidates(start, fallback, blocked):
+            try:
+                result = await call(model)
+            except Exception as e:
+                self.record_error(model, e, blocked)
+                errors.append((model, e))
+                continue
+            self.record(model, ok=True)
+            return result, model
+        raise AllFallbacksFailed(errors)
+
+    def status(self):
+        """每个模型的熔断器状态"""
+        with self._lock:
+            breakers = list(self.breakers.items())
+        return [{"model": model, "state": breaker.state, **breaker.stats} for model, breaker in breakers]
+
+    @property
+    def fallbacks(self):
+        """不是使用者首选模型而改用后备模型的次数 (包含尝试)"""
+        with self._lock:
+            return self._fallbacks
@@ -0,0 +1,179 @@
+"""
+对冲请求 (hedged requests)
+先把请求发给主要提供商; 若超过它最近的 p95 延迟仍未响应,
+再向备用提供商 (或同一个提供商) 发出第二个请求,
+采用先回来的结果并取消另一个, 用少量额外请求换掉长尾延迟
+"""
+
+import asyncio
+import threading
+from collections import deque
+
+from async_engine import run_sync
+
+# ============================================
+# 配置
+# ============================================
+
+DEFAULT_WINDOW = 200          # 每个提供商保留最近多少笔延迟样本
+DEFAULT_QUANTILE = 95         # 用第几百分位数作为对冲延迟
+DEFAULT_MIN_SAMPLES = 10      # 样本不足时使用默认延迟
+DEFAULT_DELAY = 2.0           # 秒
+DEFAULT_MIN_DELAY = 0.2       # 秒, 避免 p95 很小时几乎每次都对冲
+
+
+class LatencyTracker:
+    """
+    按名称 (提供商 / 模型) 记录最近的请求延迟
+
+    被取消的请求 (对冲时落败的一方) 没有真正的延迟, 只知道「至少这么久」,
+    以下限记录 (censored); 不记录的话慢的请求永远不会进入样本, p95 会越来越低
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self._samples = {}
+        self._censored = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, censored=False):
+        """censored=True 表示请求被取消, seconds 只是实际延迟的下限"""
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+                self._censored[name] = deque(maxlen=self.window)
+            samples.append(seconds)
+            self._censored[name].append(censored)
+
+    def count(self, name):
+        with self._lock:
+            return len(self._samples.get(name, ()))
+
+    def percentile(self, name, q):
+        """第 q 百分位数 (最近邻法, 被取消的样本以下限计入); 没有样本时返回 None"""
+        with self._lock:
+            samples = sorted(self._samples.get(name, ()))
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, int(round(q / 100 * len(samples))) - 1))
+        return samples[index]
+
+    def summary(self):
+        with self._lock:
+            names = list(self._samples)
+        return {name: {"count": self.count(name),
+                       "censored": self.censored(name),
+                       "p50": self.percentile(name, 50),
+                       "p95": self.percentile(name, 95)} for name in names}
+
+    def censored(self, name):
+        """最近的样本中有几笔是被取消的请求 (下限值)"""
+        with self._lock:
+            return sum(self._censored.get(name, ()))
+
+
+class Hedger:
+    """
+    对冲请求执行器
+
+    参数:
+        tracker: 延迟记录 (可与其他组件共用)
+        quantile: 对冲延迟使用的百分位数
+        default_delay: 样本不足时的对冲延迟 (秒)
+        min_delay: 对冲延迟下限 (秒)
+        min_samples: 开始使用百分位数所需的样本数
+    """
+
+    def __init__(self, tracker=None, quantile=DEFAULT_QUANTILE, default_delay=DEFAULT_DELAY,
+                 min_delay=DEFAULT_MIN_DELAY, min_samples=DEFAULT_MIN_SAMPLES):
+        self.tracker = tracker or LatencyTracker()
+        self.quantile = quantile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "hedged": 0, "primary_wins": 0, "hedge_wins": 0, "failures": 0}
+
+    def hedge_delay(self, name):
+        """主要提供商等待多久还没响应就发出对冲请求"""
+        if self.tracker.count(name) < self.min_samples:
+            return self.default_delay
+        return max(self.min_delay, self.tracker.percentile(name, self.quantile))
+
+    async def _timed(self, name, factory):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            # 另一个请求先回来了: 这一个至少花了这么久, 以下限计入样本
+            self.tracker.record(name, loop.time() - start, censored=True)
+            raise
+        self.tracker.record(name, loop.time() - start)
+        return result
+
+    def _count(self, *names):
+        with self._lock:
+            for name in names:
+                self._stats[name] += 1
+
+    async def run(self, primary, backup):
+        """
+        执行对冲请求
+
+        参数:
+            primary: (名称, 工厂函数), 工厂函数返回 awaitable
+            backup: (名称, 工厂函数), 主要请求超时未响应或失败时才会调用
+
+        返回:
+            (结果, 获胜者名称)
+        """
+        primary_name, primary_factory = primary
+        backup_name, backup_factory = backup
+        self._count("requests")
+
+        names = {"primary": primary_name, "backup": backup_name}
+        tasks = {asyncio.ensure_future(self._timed(primary_name, primary_factory)): "primary"}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay(primary_name))
+            if done:
+                task = next(iter(done))
+                if task.exception() is None:
+                    self._count("primary_wins")
+                    return task.result(), primary_name
+                # 主要请求很快就失败了: 不再等待, 直接改用备用请求
+                tasks.pop(task)
+                last_error = task.exception()
+
+            self._count("hedged")
+            tasks[asyncio.ensure_future(self._timed(backup_name, backup_factory))] = "backup"
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        role = tasks[task]
+                        self._count("hedge_wins" if role == "backup" else "primary_wins")
+                        return task.result(), names[role]
+                    last_error = task.exception()
+            self._count("failures")
+            raise last_error
+        finally:
+            # 取消还在进行的那一个 (同步 SDK 在线程里执行时, 结果会被直接丢弃)
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def run_sync(self, primary, backup, timeout=None):
+        """同步版本, 在共享后台事件循环中执行 (Jupyter 中也可以使用)"""
+        return run_sync(self.run(primary, backup), timeout)
+
+    def stats(self):
+        """hedge_win_rate: 发出对冲请求后由备用请求获胜的比例"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["hedge_rate"] = stats["hedged"] / stats["requests"] if stats["requests"] else 0.0
+        stats["hedge_win_rate"] = stats["hedge_wins"] / stats["hedged"] if stats["hedged"] else 0.0
+        stats["latency"] = self.tracker.summary()
+        return stats
@@ -13,9 +13,14 @@ Hugging Face Inference API 示例
 # ============================================
 # 第二步:导入库并设置 API Token
 # ============================================
-from huggingface_hub import InferenceClient
 import os
 
+from client_pool import build_hf_client, hf_client
+from example_runner import run_concurrently
+from prompt_templates import LUCKY_VICKY
+from retry_policy import call_with_retry
+from stream_utils import StreamAssembler
+
 # 如果在 Google Colab 中使用:
 # from google.colab import userdata
 # hf_token = userdata.get('HuggingFace')  # 从 Colab Secrets 读取
@@ -39,11 +44,8 @@ def create_hf_client(token=None):
     返回:
         InferenceClient 实例
     """
-    if token:
-        return InferenceClient(token=token)
-    else:
-        # 不使用 token,只能访问公开模型
-        return InferenceClient()
+    # 统一由共享客户端工厂创建; 不使用 token 时只能访问公开模型
+    return build_hf_client(token)
 
 
 # ============================================
@@ -58,7 +60,8 @@ def example_1_text_generation(client, prompt="你好,请介绍一下自己"):
     print("示例 1: 基础文本生成")
     print("=" * 50)
     
-    response = client.text_generation(
+    response = call_with_retry(
+        client.text_generation,
         prompt=prompt,
         model="Qwen/Qwen2.5-1.5B-Instruct",  # 使用轻量级模型
         max_new_tokens=200,
@@ -90,7 +93,8 @@ def example_2_chat_completion(client, user_message="什么是机器学习?"):
         }
     ]
     
-    response = client.chat_completion(
+    response = call_with_retry(
+        client.chat_completion,
         messages=messages,
         model="Qwen/Qwen2.5-7B-Instruct",  # 中文能力强的模型
         max_tokens=500,
@@ -111,18 +115,10 @@ def example_3_lucky_vicky(client, event="今天咖啡灑到電腦上了!"):
     print("示例 3: 員瑛式思考生成器")
     print("=" * 50)
     
-    system_prompt = """請用台灣習慣的中文來寫這段 po 文:
-請用員瑛式思考, 也就是什麼都正向思維任何使用者寫的事情,
-用我的第一人稱、社群媒體 po 文的口吻說一次,
-說為什麼這是一件超幸運的事, 並且以「完全是 Lucky Vicky 呀!」結尾。
-可以適度的加上 emoji。"""
+    messages = LUCKY_VICKY.build(event, "Qwen/Qwen2.5-7B-Instruct", max_tokens=500)
     
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": event}
-    ]
-    
-    response = client.chat_completion(
+    response = call_with_retry(
+        client.chat_completion,
         messages=messages,
         model="Qwen/Qwen2.5-7B-Instruct",
         max_tokens=500,
@@ -157,7 +153,8 @@ def example_4_sentiment_analysis(client, text="今天天氣真好!"):
         }
     ]
     
-    response = client.chat_completion(
+    response = call_with_retry(
+        client.chat_completion,
         messages=messages,
         model="Qwen/Qwen2.5-1.5B-Instruct",
         max_tokens=50
@@ -190,7 +187,8 @@ def example_5_translation(client, text="Hello, how are you?", target_lang="繁
         }
     ]
     
-    response = client.chat_completion(
+    response = call_with_retry(
+        client.chat_completion,
         messages=messages,
         model="Qwen/Qwen2.5-7B-Instruct",
         max_tokens=200
@@ -217,34 +215,43 @@ def example_6_streaming_response(client, prompt="請講一個有趣的故事"):
         {"role": "user", "content": prompt}
     ]
     
-    full_response = ""
-    
-    for token in client.chat_completion(
+    # 用 StreamAssembler 收集文本: 不会反复复制字符串, 也会跳过空的 role/finish chunk
+    assembler = StreamAssembler(label="Qwen/Qwen2.5-1.5B-Instruct")
+    stream = call_with_retry(
+        client.chat_completion,
         messages=messages,
         model="Qwen/Qwen2.5-1.5B-Instruct",
         max_tokens=300,
         stream=True
-    ):
-        chunk = token.choices[0].delta.content
+    )
+    
+    for chunk in assembler.iter_text(stream):
         print(chunk, end="", flush=True)
-        full_response += chunk
     
     print("\n")
-    return full_response
+    print(assembler.stats.summary())
+    print()
+    return assembler.text
 
 
 # ============================================
 # 第五步:主函数 - 运行所有示例
 # ============================================
-def run_all_examples(token=None):
+def run_all_examples(token=None, concurrent=False, max_concurrency=4):
     """
     运行所有示例
     
     参数:
         token: Hugging Face API token (可选)
+        concurrent: 是否并发执行 (输出顺序不变, 单个示例失败不影响其他示例)
+        max_concurrency: 并发模式下同时执行的示例数
     """
     print("\n🚀 开始运行 Hugging Face Inference API 示例\n")
     
+    if concurrent:
+        run_all_examples_concurrently(token, max_concurrency)
+        return
+    
     # 创建客户端
     client = create_hf_client(token)
     
@@ -277,6 +284,37 @@ def run_all_examples(token=None):
         print("3. 检查网络连接")
 
 
+def run_all_examples_concurrently(token=None, max_concurrency=4):
+    """
+    并发运行所有示例
+    
+    每个示例从连接池借用自己的客户端, 总耗时约等于最慢的那个示例
+    """
+    def with_client(example, *args):
+        def run():
+            with hf_client(token) as client:
+                return example(client, *args)
+        return run
+    
+    tasks = [
+        ("示例 1: 基础文本生成", with_client(example_1_text_generation, "台灣最有名的小吃是什麼?")),
+        ("示例 2: 对话补全", with_client(example_2_chat_completion, "請推薦三個台北的旅遊景點")),
+        ("示例 3: Lucky Vicky", with_client(example_3_lucky_vicky, "今天出門忘記帶傘,結果下大雨")),
+        ("示例 4: 情感分析", with_client(example_4_sentiment_analysis, "這個產品真的太棒了!")),
+        ("示例 5: 翻译", with_client(example_5_translation, "Machine learning is amazing!", "繁體中文")),
+    ]
+    results = run_concurrently(tasks, max_concurrency)
+    
+    if all(result.ok for result in results):
+        print("✅ 所有示例运行完成!")
+    else:
+        print("💡 提示:")
+        print("1. 确保已安装 huggingface_hub: pip install huggingface_hub")
+        print("2. 某些模型可能需要 API token")
+        print("3. 检查网络连接")
+    return results
+
+
 # ============================================
 # 使用说明
 # ============================================
@@ -296,6 +334,9 @@ example_3_lucky_vicky(client, "今天遲到了10分鐘")
 
 # 或运行所有示例
 run_all_examples(token="your_token_here")
+
+# 并发运行所有示例 (总耗时约等于最慢的示例)
+run_all_examples(token="your_token_here", concurrent=True)
 """
 
 
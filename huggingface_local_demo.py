@@ -1,11 +1,19 @@
-y"""
+"""
 Hugging Face Inference API - 本地 Windows 版本
 可以直接在本地 Python 环境中运行
+
+加上 --local (或设置 LUCKY_VICKY_BACKEND=local) 时改用本地 CPU 推理后端 (local_backend.py),
+不需要网络与 Token
 """
 
-from huggingface_hub import InferenceClient
 import os
 
+from client_pool import build_hf_client, hf_client
+from example_runner import run_concurrently
+from local_backend import build_local_client
+from prompt_templates import LUCKY_VICKY
+from retry_policy import call_with_retry
+
 # ============================================
 # 配置部分 - 请在这里设置您的 Token
 # ============================================
@@ -28,17 +36,26 @@ try:
 except FileNotFoundError:
     pass
 
+# 推理后端: "hf" (Inference API) 或 "local" (本地 CPU, 模型目录见 LUCKY_VICKY_LOCAL_MODEL)
+BACKEND = os.getenv("LUCKY_VICKY_BACKEND", "hf")
+
 # ============================================
 # 创建客户端
 # ============================================
 
-def create_client(token=None):
-    """创建 Hugging Face Inference Client"""
-    if token:
-        return InferenceClient(token=token)
-    else:
+def create_client(token=None, backend=BACKEND):
+    """
+    创建客户端 (两种后端都提供相同的 chat_completion 接口)
+    
+    参数:
+        token: Hugging Face Token (本地后端不需要)
+        backend: "hf" 或 "local"
+    """
+    if backend == "local":
+        return build_local_client()
+    if not token:
         print("⚠️  警告: 未提供 token,只能使用公开模型")
-        return InferenceClient()
+    return build_hf_client(token)
 
 
 # ============================================
@@ -57,7 +74,8 @@ def example_1_basic_chat(client):
     ]
     
     try:
-        response = client.chat_completion(
+        response = call_with_retry(
+            client.chat_completion,
             messages=messages,
             model="Qwen/Qwen2.5-7B-Instruct",
             max_tokens=200
@@ -78,19 +96,11 @@ def example_2_lucky_vicky(client, event="今天咖啡灑到電腦上了!"):
     print("示例 2: Lucky Vicky 生成器")
     print("="*60)
     
-    system_prompt = """請用台灣習慣的中文來寫這段 po 文:
-請用員瑛式思考, 也就是什麼都正向思維任何使用者寫的事情,
-用我的第一人稱、社群媒體 po 文的口吻說一次,
-說為什麼這是一件超幸運的事, 並且以「完全是 Lucky Vicky 呀!」結尾。
-可以適度的加上 emoji。"""
-    
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": event}
-    ]
+    messages = LUCKY_VICKY.build(event, "Qwen/Qwen2.5-7B-Instruct", max_tokens=500)
     
     try:
-        response = client.chat_completion(
+        response = call_with_retry(
+            client.chat_completion,
             messages=messages,
             model="Qwen/Qwen2.5-7B-Instruct",
             max_tokens=500,
@@ -119,7 +129,8 @@ def example_3_translation(client, text="Hello, how are you?"):
     ]
     
     try:
-        response = client.chat_completion(
+        response = call_with_retry(
+            client.chat_completion,
             messages=messages,
             model="Qwen/Qwen2.5-7B-Instruct",
             max_tokens=200
@@ -147,7 +158,8 @@ def example_4_sentiment(client, text="這個產品真的太棒了!"):
     ]
     
     try:
-        response = client.chat_completion(
+        response = call_with_retry(
+            client.chat_completion,
             messages=messages,
             model="Qwen/Qwen2.5-1.5B-Instruct",
             max_tokens=20
@@ -167,14 +179,21 @@ def example_4_sentiment(client, text="這個產品真的太棒了!"):
 # 主程序
 # ============================================
 
-def main():
-    """主函数"""
+def main(concurrent=False, max_concurrency=4, backend=BACKEND):
+    """
+    主函数
+    
+    参数:
+        concurrent: 是否并发执行所有示例 (输出顺序不变)
+        max_concurrency: 并发模式下同时执行的示例数
+        backend: "hf" 或 "local"
+    """
     print("\n" + "🤗 "*20)
     print("Hugging Face Inference API - 本地演示")
     print("🤗 "*20 + "\n")
     
-    # 检查 Token
-    if not HF_TOKEN:
+    # 检查 Token (本地后端不需要)
+    if backend != "local" and not HF_TOKEN:
         print("⚠️  未找到 Hugging Face Token!")
         print("\n请选择以下方法之一设置 Token:\n")
         print("方法 1: 在代码中直接设置")
@@ -194,9 +213,14 @@ def main():
             print("\n程序退出。")
             return
     
+    # 并发模式下每个示例自己借客户端
+    if concurrent:
+        run_examples_concurrently(max_concurrency, backend)
+        return
+    
     # 创建客户端
-    print("正在创建 Hugging Face 客户端...")
-    client = create_client(HF_TOKEN)
+    print("正在创建客户端..." if backend == "local" else "正在创建 Hugging Face 客户端...")
+    client = create_client(HF_TOKEN, backend)
     print("✅ 客户端创建成功!\n")
     
     # 运行示例
@@ -226,22 +250,56 @@ def main():
         print("\n请检查后重试。\n")
 
 
+def run_examples_concurrently(max_concurrency=4, backend=BACKEND):
+    """
+    并发运行所有示例, 最后输出耗时统计
+    
+    每个示例从连接池借用自己的客户端; 本地后端则先建好一个客户端给所有示例共用
+    (模型是只读的, 也避免多个线程同时去建迷你模型)
+    """
+    local_client = create_client(backend=backend) if backend == "local" else None
+
+    def with_client(example, *args):
+        def run():
+            if local_client is not None:
+                return example(local_client, *args)
+            with hf_client(HF_TOKEN) as client:
+                return example(client, *args)
+        return run
+    
+    tasks = [
+        ("示例 1: 基础对话", with_client(example_1_basic_chat)),
+        ("示例 2: Lucky Vicky", with_client(example_2_lucky_vicky, "今天出門忘記帶傘,結果下大雨")),
+        ("示例 3: 翻译", with_client(example_3_translation, "Machine learning is amazing!")),
+        ("示例 4: 情感分析", with_client(example_4_sentiment, "這個產品真的太棒了!")),
+    ]
+    results = run_concurrently(tasks, max_concurrency)
+    
+    print("="*60)
+    if all(result.ok and result.value is not None for result in results):
+        print("✅ 所有示例运行完成!")
+    else:
+        print("⚠️  部分示例失败, 请检查 Token、网络连接或 API 速率限制")
+    print("="*60 + "\n")
+    return results
+
+
 # ============================================
 # 交互式模式
 # ============================================
 
-def interactive_mode():
+def interactive_mode(backend=BACKEND):
     """交互式 Lucky Vicky 生成器"""
     print("\n" + "🌈 "*20)
     print("Lucky Vicky 生成器 - 交互模式")
     print("🌈 "*20 + "\n")
     
-    if not HF_TOKEN:
+    if backend != "local" and not HF_TOKEN:
         print("❌ 需要 Hugging Face Token 才能使用交互模式")
         print("请先设置 Token (参考上面的说明)")
         return
     
-    client = create_client(HF_TOKEN)
+    client = create_client(HF_TOKEN, backend)
     print("✅ 客户端已就绪!\n")
     print("输入发生的事件,我会用 Lucky Vicky 的方式重新诠释!")
     print("输入 'quit' 或 'exit' 退出\n")
@@ -266,14 +324,18 @@ def interactive_mode():
 if __name__ == "__main__":
     import sys
     
+    # --local: 使用本地 CPU 推理后端
+    backend = "local" if '--local' in sys.argv else BACKEND
+    
     # 检查命令行参数
-    if len(sys.argv) > 1 and sys.argv[1] == '--interactive':
-        interactive_mode()
+    if '--interactive' in sys.argv:
+        interactive_mode(backend)
     else:
-        main()
+        # --concurrent: 并发执行所有示例
+        main(concurrent='--concurrent' in sys.argv, backend=backend)
         
         # 询问是否进入交互模式
         print("\n是否进入交互式 Lucky Vicky 模式? (y/n): ", end="")
         choice = input()
         if choice.lower() == 'y':
-            interactive_mode()
+            interactive_mode(backend)
@@ -0,0 +1,782 @@
+"""
+本地 CPU 推理后端 (NumPy)
+不依赖网络与 Inference API 额度, 直接在 CPU 上运行 Llama 架构的小型指令模型
+(例如 SmolLM2-135M/360M-Instruct、Llama-3.2-1B-Instruct):
+- 权重量化成 int8 (每个输出行一个 float32 缩放系数), 每个张量存成一个 .npy 文件
+- 用 np.load(mmap_mode="r") 载入: 多个 worker 进程共用同一份只读页面, 同一进程内只载入一次
+- chat_completion 的参数与返回结构和 huggingface_hub.InferenceClient 相同, 支持 stream=True
+- create_random_model 生成随机初始化的迷你模型, 不必下载任何东西就能测试
+- 前缀 KV 缓存: 每个请求都带着同样的 system prompt, 这段前缀的 key / value 每个模型只算一次,
+  之后的请求只需要 prefill 使用者输入的事件 (效能测试见 bench_prefix_cache.py)
+
+模型目录:
+    config.json            模型结构与对话格式
+    tokenizer.json         (可选) Hugging Face tokenizers 格式; 没有时使用 byte-level tokenizer
+    <张量名>.q.npy + <张量名>.scale.npy   int8 权重与缩放系数
+    <张量名>.npy                         float32 权重 (RMSNorm)
+
+用法:
+    python local_backend.py random .cache/local_model_tiny
+    python local_backend.py convert <Hugging Face 模型目录> .cache/local_model
+    python local_backend.py chat "你好!" --model-dir .cache/local_model
+"""
+
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import numpy as np
+
+# ============================================
+# 配置
+# ============================================
+
+DEFAULT_MODEL_DIR = os.getenv("LUCKY_VICKY_LOCAL_MODEL", os.path.join(".cache", "local_model"))
+TINY_MODEL_DIR = os.path.join(".cache", "local_model_tiny")
+DEFAULT_MAX_TOKENS = 500
+MATMUL_BLOCK_ROWS = 4096  # 反量化时每次处理的输出行数, 控制临时内存
+DEFAULT_PREFIX_CACHE_SIZE = 8  # 每个模型最多保留几个不同前缀的 KV 快照
+
+# 随机迷你模型: 搭配 byte-level tokenizer (256 个字节 + <bos> + <eos>)
+TINY_CONFIG = {
+    "vocab_size": 258,
+    "dim": 64,
+    "n_layers": 2,
+    "n_heads": 4,
+    "n_kv_heads": 2,
+    "hidden_dim": 176,
+    "max_seq_len": 2048,
+    "rope_theta": 10000.0,
+    "rope_scaling": None,
+    "norm_eps": 1e-5,
+    "chat_format": "plain",
+    "eos_tokens": ["<eos>"],
+}
+
+# 对话格式: (每条消息的模板, 开头, 助手回覆的开头)
+CHAT_FORMATS = {
+    "plain": ("<{role}>\n{content}\n", "<bos>", "<assistant>\n"),
+    "chatml": ("<|im_start|>{role}\n{content}<|im_end|>\n", "", "<|im_start|>assistant\n"),
+    "llama3": ("<|start_header_id|>{role}<|end_header_id|>\n\n{content}<|eot_id|>", "<|begin_of_text|>",
+               "<|start_header_id|>assistant<|end_header_id|>\n\n"),
+}
+
+
+# ============================================
+# Tokenizer
+# ============================================
+
+class ByteTokenizer:
+    """byte-level tokenizer: 0-255 为 UTF-8 字节, 之后是特殊 token"""
+
+    SPECIAL_TOKENS = ["<bos>", "<eos>"]
+
+    def __init__(self):
+        self._special = {name: 256 + i for i, name in enumerate(self.SPECIAL_TOKENS)}
+
+    def encode(self, text):
+        ids = []
+        for i, piece in enumerate(text.split("<bos>")):
+            if i:
+                ids.append(self._special["<bos>"])
+            ids.extend(piece.encode("utf-8"))
+        return ids
+
+    def decode(self, ids):
+        return bytes(i for i in ids if i < 256).decode("utf-8", errors="replace")
+
+    def token_to_id(self, token):
+        return self._special.get(token)
+
+
+class HFTokenizer:
+    """包装 tokenizers.Tokenizer (tokenizer.json), 特殊 token 直接写在模板文字里"""
+
+    def __init__(self, path):
+        from tokenizers import Tokenizer  # 只有使用真实模型时才需要
+        self._tokenizer = Tokenizer.from_file(path)
+
+    def encode(self, text):
+        return self._tokenizer.encode(text, add_special_tokens=False).ids
+
+    def decode(self, ids):
+        return self._tokenizer.decode(ids, skip_special_tokens=True)
+
+    def token_to_id(self, token):
+        return self._tokenizer.token_to_id(token)
+
+
+class StreamDecoder:
+    """逐个 token 解码; 多字节字符还没收齐 (结尾是 U+FFFD) 时先不输出"""
+
+    def __init__(self, tokenizer):
+        self._tokenizer = tokenizer
+        self._ids = []
+        self._emitted = ""
+
+    def push(self, token_id):
+        self._ids.append(token_id)
+        text = self._tokenizer.decode(self._ids)
+        if text.endswith("�"):
+            return ""
+        delta = text[len(self._emitted):]
+        self._emitted = text
+        return delta
+
+    def flush(self):
+        """生成结束时输出剩下的文字 (包括不完整的字符)"""
+        text = self._tokenizer.decode(self._ids)
+        delta = text[len(self._emitted):]
+        self._emitted = text
+        return delta
+
+
+# ============================================
+# 量化与权重文件
+# ============================================
+
+class QuantizedMatrix:
+    """int8 权重 + 每行缩放系数; 乘法时才临时反量化, 常驻内存的只有 mmap 的 int8 页面"""
+
+    def __init__(self, q, scale):
+        self.q = q            # (out, in) int8
+        self.scale = scale    # (out,) float32
+
+    @property
+    def shape(self):
+        return self.q.shape
+
+    def matmul(self, x):
+        """x: (T, in) -> (T, out); 分块反量化, 临时内存不超过 MATMUL_BLOCK_ROWS 行"""
+        rows = self.q.shape[0]
+        out = np.empty((x.shape[0], rows), dtype=np.float32)
+        for start in range(0, rows, MATMUL_BLOCK_ROWS):
+            block = self.q[start:start + MATMUL_BLOCK_ROWS]
+            out[:, start:start + MATMUL_BLOCK_ROWS] = x @ block.T.astype(np.float32)
+        return out * self.scale
+
+    def rows(self, ids):
+        """取出若干行并反量化 (embedding 查表)"""
+        return self.q[ids].astype(np.float32) * self.scale[ids, None]
+
+
+def quantize_int8(weight):
+    """对称 int8 量化, 每个输出行 (第 0 维) 一个缩放系数"""
+    weight = np.asarray(weight, dtype=np.float32)
+    scale = np.abs(weight).max(axis=1) / 127.0
+    scale[scale == 0] = 1.0
+    q = np.clip(np.rint(weight / scale[:, None]), -127, 127).astype(np.int8)
+    return q, scale.astype(np.float32)
+
+
+def _save_tensor(out_dir, name, weight):
+    """二维权重存成 int8, 一维 (RMSNorm) 保留 float32"""
+    if weight.ndim == 2:
+        q, scale = quantize_int8(weight)
+        np.save(os.path.join(out_dir, f"{name}.q.npy"), q)
+        np.save(os.path.join(out_dir, f"{name}.scale.npy"), scale)
+    else:
+        np.save(os.path.join(out_dir, f"{name}.npy"), np.asarray(weight, dtype=np.float32))
+
+
+def _load_tensor(model_dir, name):
+    path = os.path.join(model_dir, name)
+    if os.path.exists(path + ".q.npy"):
+        return QuantizedMatrix(np.load(path + ".q.npy", mmap_mode="r"),
+                               np.load(path + ".scale.npy", mmap_mode="r"))
+    return np.load(path + ".npy", mmap_mode="r")
+
+
+def create_random_model(out_dir=TINY_MODEL_DIR, config=None, seed=0):
+    """生成随机初始化的迷你模型 (输出是乱码, 用来测试整条推理流程), 返回模型目录"""
+    config = {**TINY_CONFIG, **(config or {})}
+    rng = np.random.default_rng(seed)
+    dim, hidden = config["dim"], config["hidden_dim"]
+    head_dim = dim // config["n_heads"]
+    kv_dim = config["n_kv_heads"] * head_dim
+
+    def normal(*shape):
+        return rng.normal(0.0, 0.02, size=shape).astype(np.float32)
+
+    os.makedirs(out_dir, exist_ok=True)
+    _save_tensor(out_dir, "tok_embeddings", normal(config["vocab_size"], dim))
+    _save_tensor(out_dir, "norm", np.ones(dim, dtype=np.float32))
+    for i in range(config["n_layers"]):
+        for name, shape in (("wq", (dim, dim)), ("wk", (kv_dim, dim)), ("wv", (kv_dim, dim)),
+                            ("wo", (dim, dim)), ("w1", (hidden, dim)), ("w2", (dim, hidden)),
+                            ("w3", (hidden, dim))):
+            _save_tensor(out_dir, f"layers.{i}.{name}", normal(*shape))
+        _save_tensor(out_dir, f"layers.{i}.attention_norm", np.ones(dim, dtype=np.float32))
+        _save_tensor(out_dir, f"layers.{i}.ffn_norm", np.ones(dim, dtype=np.float32))
+    with open(os.path.join(out_dir, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    return out_dir
+
+
+# ============================================
+# 转换 Hugging Face checkpoint
+# ============================================
+
+_SAFETENSORS_DTYPES = {"F32": np.float32, "F16": np.float16, "BF16": np.uint16}
+
+_HF_LAYER_NAMES = {
+    "self_attn.q_proj": "wq", "self_attn.k_proj": "wk", "self_attn.v_proj": "wv",
+    "self_attn.o_proj": "wo", "mlp.gate_proj": "w1", "mlp.down_proj": "w2", "mlp.up_proj": "w3",
+    "input_layernorm": "attention_norm", "post_attention_layernorm": "ffn_norm",
+}
+
+
+def _read_safetensors(path):
+    """读取 .safetensors (不依赖 safetensors / torch 套件); bf16 转成 float32"""
+    with open(path, "rb") as f:
+        header_size = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_size))
+    data = np.memmap(path, dtype=np.uint8, mode="r", offset=8 + header_size)
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = _SAFETENSORS_DTYPES.get(info["dtype"])
+        if dtype is None:
+            raise ValueError(f"不支持的 dtype: {info['dtype']} ({name})")
+        start, end = info["data_offsets"]
+        array = data[start:end].view(dtype).reshape(info["shape"])
+        if info["dtype"] == "BF16":
+            array = (array.astype(np.uint32) << 16).view(np.float32)
+        tensors[name] = array
+    return tensors
+
+
+def _detect_chat_format(model_dir):
+    try:
+        with open(os.path.join(model_dir, "tokenizer_config.json"), encoding="utf-8") as f:
+            template = json.load(f).get("chat_template") or ""
+    except FileNotFoundError:
+        template = ""
+    if "<|start_header_id|>" in template:
+        return "llama3", ["<|eot_id|>", "<|end_of_text|>"]
+    if "<|im_start|>" in template:
+        return "chatml", ["<|im_end|>"]
+    return "plain", ["<eos>"]
+
+
+def convert_hf_checkpoint(model_dir, out_dir=DEFAULT_MODEL_DIR):
+    """把 Hugging Face 的 Llama 架构 checkpoint (safetensors) 转成 int8 的本地模型目录"""
+    with open(os.path.join(model_dir, "config.json"), encoding="utf-8") as f:
+        hf_config = json.load(f)
+    if hf_config.get("model_type") != "llama":
+        raise ValueError(f"只支持 Llama 架构的模型, 收到: {hf_config.get('model_type')}")
+
+    chat_format, eos_tokens = _detect_chat_format(model_dir)
+    config = {
+        "vocab_size": hf_config["vocab_size"],
+        "dim": hf_config["hidden_size"],
+        "n_layers": hf_config["num_hidden_layers"],
+        "n_heads": hf_config["num_attention_heads"],
+        "n_kv_heads": hf_config.get("num_key_value_heads", hf_config["num_attention_heads"]),
+        "hidden_dim": hf_config["intermediate_size"],
+        "max_seq_len": min(hf_config.get("max_position_embeddings", 2048), 8192),
+        "rope_theta": hf_config.get("rope_theta", 10000.0),
+        "rope_scaling": hf_config.get("rope_scaling"),
+        "norm_eps": hf_config.get("rms_norm_eps", 1e-5),
+        "chat_format": chat_format,
+        "eos_tokens": eos_tokens,
+    }
+
+    os.makedirs(out_dir, exist_ok=True)
+    saved = set()
+    for filename in sorted(os.listdir(model_dir)):
+        if not filename.endswith(".safetensors"):
+            continue
+        print(f"🔄 转换 {filename}...")
+        for name, weight in _read_safetensors(os.path.join(model_dir, filename)).items():
+            if name == "model.embed_tokens.weight":
+                target = "tok_embeddings"
+            elif name == "model.norm.weight":
+                target = "norm"
+            elif name == "lm_head.weight":
+                target = "output"
+            elif name.startswith("model.layers."):
+                index, _, rest = name[len("model.layers."):].partition(".")
+                key = rest.rsplit(".", 1)[0]
+                if key not in _HF_LAYER_NAMES:
+                    continue
+                target = f"layers.{index}.{_HF_LAYER_NAMES[key]}"
+            else:
+                continue
+            _save_tensor(out_dir, target, weight)
+            saved.add(target)
+    if "tok_embeddings" not in saved:
+        raise ValueError(f"{model_dir} 里没有找到 safetensors 权重")
+
+    with open(os.path.join(out_dir, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    tokenizer_path = os.path.join(model_dir, "tokenizer.json")
+    if os.path.exists(tokenizer_path):
+        shutil.copy(tokenizer_path, os.path.join(out_dir, "tokenizer.json"))
+    print(f"✅ 已转换 {len(saved)} 个张量 -> {out_dir}")
+    return out_dir
+
+
+# ============================================
+# 模型
+# ============================================
+
+def _rms_norm(x, weight, eps):
+    return x / np.sqrt(np.mean(x * x, axis=-1, keepdims=True) + eps) * weight
+
+
+def _silu(x):
+    with np.errstate(over="ignore"):
+        return x / (1.0 + np.exp(-x))
+
+
+def _rotate_half(x):
+    half = x.shape[-1] // 2
+    return np.concatenate([-x[..., half:], x[..., :half]], axis=-1)
+
+
+def _rope_frequencies(head_dim, theta, scaling):
+    inv_freq = 1.0 / (theta ** (np.arange(0, head_dim, 2, dtype=np.float64) / head_dim))
+    if scaling and scaling.get("rope_type", scaling.get("type")) == "llama3":
+        # Llama 3.1/3.2 的长上下文频率调整
+        factor = scaling["factor"]
+        low, high = scaling.get("low_freq_factor", 1.0), scaling.get("high_freq_factor", 4.0)
+        original = scaling.get("original_max_position_embeddings", 8192)
+        wavelen = 2 * np.pi / inv_freq
+        smooth = np.clip((original / wavelen - low) / (high - low), 0.0, 1.0)
+        scaled = np.where(wavelen > original / low, inv_freq / factor, inv_freq)
+        mid = (wavelen <= original / low) & (wavelen >= original / high)
+        inv_freq = np.where(mid, (1 - smooth) * inv_freq / factor + smooth * inv_freq, scaled)
+    return inv_freq
+
+
+class KVCache:
+    """每一层的 key / value (按需扩容); length 为已处理的 token 数"""
+
+    def __init__(self, n_layers, n_kv_heads, head_dim, capacity=256):
+        shape = (capacity, n_kv_heads, head_dim)
+        self.k = [np.zeros(shape, dtype=np.float32) for _ in range(n_layers)]
+        self.v = [np.zeros(shape, dtype=np.float32) for _ in range(n_layers)]
+        self.length = 0
+
+    def reserve(self, length):
+        capacity = self.k[0].shape[0]
+        if length <= capacity:
+            return
+        while capacity < length:
+            capacity *= 2
+        for layer in range(len(self.k)):
+            for store in (self.k, self.v):
+                grown = np.zeros((capacity,) + store[layer].shape[1:], dtype=np.float32)
+                grown[:self.length] = store[layer][:self.length]
+                store[layer] = grown
+
+    def copy(self, extra=256):
+        """复制已处理的部分, 另外预留 extra 个位置给之后的 token"""
+        n_kv_heads, head_dim = self.k[0].shape[1:]
+        clone = KVCache(len(self.k), n_kv_heads, head_dim, capacity=max(1, self.length + extra))
+        for source, target in ((self.k, clone.k), (self.v, clone.v)):
+            for layer in range(len(source)):
+                target[layer][:self.length] = source[layer][:self.length]
+        clone.length = self.length
+        return clone
+
+
+class PrefixCache:
+    """
+    前缀 token -> 算好的 KV 快照 (LRU, 线程安全)
+
+    快照本身不会被修改, 每个请求拿到的是复制出来的 KVCache,
+    复制只是内存拷贝, 比重新计算整段前缀便宜得多
+    """
+
+    def __init__(self, model, max_entries=DEFAULT_PREFIX_CACHE_SIZE):
+        self.model = model
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._computing = {}  # 前缀 -> 正在计算它的锁 (每个前缀一个)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "reused_tokens": 0, "computed_tokens": 0}
+
+    def _lookup(self, key):
+        """在 self._lock 内调用; 命中时更新 LRU 顺序与统计"""
+        snapshot = self._entries.get(key)
+        if snapshot is not None:
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            self._stats["reused_tokens"] += len(key)
+        return snapshot
+
+    def fork(self, prefix_ids):
+        """返回已经处理完 prefix_ids 的 KVCache (可以直接接着 forward 后面的 token)"""
+        key = tuple(prefix_ids)
+        with self._lock:
+            snapshot = self._lookup(key)
+            if snapshot is None:
+                key_lock = self._computing.setdefault(key, threading.Lock())
+        if snapshot is None:
+            # 只锁这一个前缀: 同一个前缀被并发请求时只算一次, 其他前缀的命中不必等待
+            with key_lock:
+                with self._lock:
+                    snapshot = self._lookup(key)
+                if snapshot is None:
+                    # forward 失败也要移除这个前缀的锁, 否则 _computing 会一直留着它
+                    try:
+                        snapshot = self.model.new_cache()
+                        self.model.forward(prefix_ids, snapshot)
+                        snapshot = snapshot.copy(extra=0)
+                        with self._lock:
+                            self._entries[key] = snapshot
+                            if len(self._entries) > self.max_entries:
+                                self._entries.popitem(last=False)
+                            self._stats["misses"] += 1
+                            self._stats["computed_tokens"] += len(key)
+                    finally:
+                        with self._lock:
+                            self._computing.pop(key, None)
+        return snapshot.copy()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+
+class LocalModel:
+    """从模型目录载入 (mmap) 的 Llama 架构模型; 只读, 可以被多个线程同时使用"""
+
+    def __init__(self, model_dir):
+        with open(os.path.join(model_dir, "config.json"), encoding="utf-8") as f:
+            self.config = json.load(f)
+        self.model_dir = model_dir
+        self.name = os.path.basename(os.path.normpath(model_dir))
+        config = self.config
+        self.n_heads = config["n_heads"]
+        self.n_kv_heads = config["n_kv_heads"]
+        self.head_dim = config["dim"] // self.n_heads
+        self.max_seq_len = config["max_seq_len"]
+        self.eps = config["norm_eps"]
+
+        self.tok_embeddings = _load_tensor(model_dir, "tok_embeddings")
+        self.norm = _load_tensor(model_dir, "norm")
+        has_output = os.path.exists(os.path.join(model_dir, "output.q.npy"))
+        self.output = _load_tensor(model_dir, "output") if has_output else self.tok_embeddings
+        self.layers = [
+            {name: _load_tensor(model_dir, f"layers.{i}.{name}")
+             for name in ("wq", "wk", "wv", "wo", "w1", "w2", "w3", "attention_norm", "ffn_norm")}
+            for i in range(config["n_layers"])
+        ]
+        self.inv_freq = _rope_frequencies(self.head_dim, config["rope_theta"], config.get("rope_scaling"))
+
+        tokenizer_path = os.path.join(model_dir, "tokenizer.json")
+        self.tokenizer = HFTokenizer(tokenizer_path) if os.path.exists(tokenizer_path) else ByteTokenizer()
+        self.chat_format = CHAT_FORMATS[config.get("chat_format", "plain")]
+        self.eos_ids = {self.tokenizer.token_to_id(token) for token in config.get("eos_tokens", [])} - {None}
+        self.prefix_cache = PrefixCache(self)
+
+    # ----------------------------------------
+    # Prompt
+    # ----------------------------------------
+
+    def encode_prompt(self, messages):
+        """
+        按对话格式把消息转成 token, 拆成 (固定前缀, 其余部分)
+
+        固定前缀 = 开头 + 最前面的 system 消息; 逐条编码, 同样的前缀永远得到同样的 token
+        """
+        template, begin, assistant = self.chat_format
+        prefix = self.tokenizer.encode(begin) if begin else []
+        rest = []
+        for message in messages:
+            ids = self.tokenizer.encode(template.format(role=message["role"], content=message["content"]))
+            if message["role"] == "system" and not rest:
+                prefix += ids
+            else:
+                rest += ids
+        return prefix, rest + self.tokenizer.encode(assistant)
+
+    def encode_messages(self, messages):
+        """完整的 prompt token"""
+        prefix, rest = self.encode_prompt(messages)
+        return prefix + rest
+
+    # ----------------------------------------
+    # 前向计算
+    # ----------------------------------------
+
+    def new_cache(self):
+        return KVCache(len(self.layers), self.n_kv_heads, self.head_dim)
+
+    def _rope(self, start, length):
+        angles = np.arange(start, start + length, dtype=np.float64)[:, None] * self.inv_freq[None, :]
+        angles = np.concatenate([angles, angles], axis=-1)
+        return np.cos(angles).astype(np.float32)[:, None, :], np.sin(angles).astype(np.float32)[:, None, :]
+
+    def forward(self, tokens, cache):
+        """处理一批新 token (写进 cache), 返回最后一个位置的 logits"""
+        tokens = np.asarray(tokens, dtype=np.int64)
+        count = len(tokens)
+        start = cache.length
+        end = start + count
+        if end > self.max_seq_len:
+            raise ValueError(f"超过模型的上下文长度 ({end} > {self.max_seq_len})")
+        cache.reserve(end)
+
+        cos, sin = self._rope(start, count)
+        # 因果遮罩: 第 t 个新 token 只看得到位置 <= start + t 的 key
+        mask = np.where(np.arange(end)[None, :] > np.arange(start, end)[:, None], -np.inf, 0.0)
+        mask = mask.astype(np.float32)
+        group = self.n_heads // self.n_kv_heads
+        scale = 1.0 / np.sqrt(self.head_dim)
+
+        x = self.tok_embeddings.rows(tokens)
+        for i, layer in enumerate(self.layers):
+            h = _rms_norm(x, layer["attention_norm"], self.eps)
+            q = layer["wq"].matmul(h).reshape(count, self.n_heads, self.head_dim)
+            k = layer["wk"].matmul(h).reshape(count, self.n_kv_heads, self.head_dim)
+            v = layer["wv"].matmul(h).reshape(count, self.n_kv_heads, self.head_dim)
+            q = q * cos + _rotate_half(q) * sin
+            k = k * cos + _rotate_half(k) * sin
+            cache.k[i][start:end] = k
+            cache.v[i][start:end] = v
+
+            # grouped-query attention: 每 group 个 query head 共用一个 kv head
+            keys, values = cache.k[i][:end], cache.v[i][:end]
+            q = q.reshape(count, self.n_kv_heads, group, self.head_dim)
+            scores = np.einsum("tkgd,skd->kgts", q, keys) * scale + mask
+            scores = np.exp(scores - scores.max(axis=-1, keepdims=True))
+            scores /= scores.sum(axis=-1, keepdims=True)
+            attention = np.einsum("kgts,skd->tkgd", scores, values).reshape(count, -1)
+            x = x + layer["wo"].matmul(attention)
+
+            h = _rms_norm(x, layer["ffn_norm"], self.eps)
+            x = x + layer["w2"].matmul(_silu(layer["w1"].matmul(h)) * layer["w3"].matmul(h))
+
+        cache.length = end
+        return self.output.matmul(_rms_norm(x[-1:], self.norm, self.eps))[0]
+
+    # ----------------------------------------
+    # 生成
+    # ----------------------------------------
+
+    @staticmethod
+    def _sample(logits, temperature, top_p, rng):
+        if not temperature:
+            return int(np.argmax(logits))
+        logits = (logits - logits.max()) / temperature
+        probs = np.exp(logits)
+        probs /= probs.sum()
+        if top_p is not None and top_p < 1.0:
+            order = np.argsort(-probs)
+            keep = order[:int(np.searchsorted(np.cumsum(probs[order]), top_p)) + 1]
+            kept = np.zeros_like(probs)
+            kept[keep] = probs[keep]
+            probs = kept / kept.sum()
+        return int(rng.choice(len(probs), p=probs))
+
+    def prefill(self, prompt_ids, prefix_len=0):
+        """
+        处理整个 prompt, 返回 (KVCache, 最后一个位置的 logits)
+
+        prefix_len > 0 时前 prefix_len 个 token 从前缀缓存取得, 只计算后面的部分
+        """
+        if 0 < prefix_len < len(prompt_ids):
+            cache = self.prefix_cache.fork(prompt_ids[:prefix_len])
+        else:
+            cache, prefix_len = self.new_cache(), 0
+        return cache, self.forward(prompt_ids[prefix_len:], cache)
+
+    def generate(self, prompt_ids, max_tokens=DEFAULT_MAX_TOKENS, temperature=1.0, top_p=None, seed=None,
+                 prefix_len=0):
+        """
+        逐个产出新 token (生成器); 遇到 eos 或达到 max_tokens / 上下文长度时停止
+
+        结束后生成器的返回值 (StopIteration.value) 是 finish_reason: "stop" 或 "length"
+        """
+        rng = np.random.default_rng(seed)
+        cache, logits = self.prefill(prompt_ids, prefix_len)
+        for _ in range(max_tokens):
+            token = self._sample(logits, temperature, top_p, rng)
+            if token in self.eos_ids:
+                return "stop"
+            yield token
+            if cache.length >= self.max_seq_len:
+                break
+            logits = self.forward([token], cache)
+        return "length"
+
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_local_model(model_dir=DEFAULT_MODEL_DIR):
+    """同一进程内每个模型目录只载入一次"""
+    key = os.path.abspath(model_dir)
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            start = time.perf_counter()
+            model = _models[key] = LocalModel(model_dir)
+            print(f"📦 本地模型已载入 (mmap): {model_dir} ({time.perf_counter() - start:.2f}s)")
+        return model
+
+
+# ============================================
+# 与 InferenceClient 相同的接口
+# ============================================
+
+class LocalInferenceClient:
+    """
+    本地推理客户端, chat_completion 的参数与返回结构和 InferenceClient 相同
+
+    参数:
+        model_dir: 本地模型目录 (见 convert_hf_checkpoint / create_random_model)
+        prefix_cache: 是否重复使用 system prompt 的 KV 快照
+    """
+
+    def __init__(self, model_dir=DEFAULT_MODEL_DIR, prefix_cache=True):
+        self.model_dir = model_dir
+        self.local_model = get_local_model(model_dir)
+        self.prefix_cache = prefix_cache
+
+    def chat_completion(self, messages, model=None, max_tokens=None, temperature=None, top_p=None,
+                        seed=None, stop=None, stream=False, **kwargs):
+        """
+        model 参数只为相容而保留 (总是使用载入的本地模型); 其他不认识的参数忽略
+
+        stop: 字串列表, 生成的文字出现其中之一就停止 (与 OpenAI 相同, 不包含 stop 字串本身)
+
+        返回:
+            stream=False: 带有 choices[0].message.content 的响应
+            stream=True: 逐块产出带有 choices[0].delta.content 的 chunk
+        """
+        prefix_ids, rest_ids = self.local_model.encode_prompt(messages)
+        prompt_ids = prefix_ids + rest_ids
+        tokens = self.local_model.generate(
+            prompt_ids,
+            max_tokens=max_tokens or DEFAULT_MAX_TOKENS,
+            temperature=1.0 if temperature is None else temperature,
+            top_p=top_p,
+            seed=seed,
+            prefix_len=len(prefix_ids) if self.prefix_cache else 0,
+        )
+        state = {"finish_reason": None, "completion_tokens": 0}
+        texts = self._texts(tokens, [stop] if isinstance(stop, str) else list(stop or []), state)
+        if stream:
+            return self._stream(texts, state)
+        return self._complete(texts, state, len(prompt_ids))
+
+    def _texts(self, tokens, stop, state):
+        """
+        把 token 解码成文字增量; 文字里出现 stop 字串时截断并停止生成 (不再计算后面的 token)
+
+        可能是 stop 字串开头的部分先保留不输出, 确定不是之后才放行
+        """
+        decoder = StreamDecoder(self.local_model.tokenizer)
+        holdback = max((len(s) for s in stop), default=1) - 1
+        text = ""
+        emitted = 0
+        while True:
+            try:
+                text += decoder.push(next(tokens))
+                state["completion_tokens"] += 1
+            except StopIteration as result:
+                text += decoder.flush()
+                state["finish_reason"] = result.value
+                break
+            hits = [index for index in (text.find(s, max(0, emitted - holdback)) for s in stop) if index >= 0]
+            if hits:
+                tokens.close()
+                state["finish_reason"] = "stop"
+                text = text[:min(hits)]
+                break
+            if len(text) - holdback > emitted:
+                yield text[emitted:len(text) - holdback]
+                emitted = len(text) - holdback
+        if len(text) > emitted:
+            yield text[emitted:]
+
+    def _complete(self, texts, state, prompt_tokens):
+        message = SimpleNamespace(role="assistant", content="".join(texts))
+        completion_tokens = state["completion_tokens"]
+        return SimpleNamespace(
+            id=f"local-{uuid.uuid4().hex[:12]}",
+            model=self.local_model.name,
+            created=int(time.time()),
+            choices=[SimpleNamespace(index=0, message=message, finish_reason=state["finish_reason"])],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                  total_tokens=prompt_tokens + completion_tokens),
+        )
+
+    def _stream(self, texts, state):
+        def chunk(content, finish_reason=None):
+            delta = SimpleNamespace(role="assistant", content=content)
+            return SimpleNamespace(model=self.local_model.name,
+                                   choices=[SimpleNamespace(index=0, delta=delta, finish_reason=finish_reason)])
+
+        for text in texts:
+            yield chunk(text)
+        yield chunk(None, state["finish_reason"])
+
+    def close(self):
+        """权重由进程内所有客户端共用, 这里不需要释放"""
+
+
+def build_local_client(model_dir=DEFAULT_MODEL_DIR, prefix_cache=True):
+    """模型目录不存在时, 改用随机初始化的迷你模型 (方便在没有下载权重时测试)"""
+    if not os.path.exists(os.path.join(model_dir, "config.json")):
+        print(f"⚠️  未找到本地模型 {model_dir}, 改用随机初始化的迷你模型 (输出是乱码, 仅供测试)")
+        if not os.path.exists(os.path.join(TINY_MODEL_DIR, "config.json")):
+            create_random_model(TINY_MODEL_DIR)
+        model_dir = TINY_MODEL_DIR
+    return LocalInferenceClient(model_dir, prefix_cache)
+
+
+# ============================================
+# 命令行
+# ============================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Lucky Vicky 本地 CPU 推理后端")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    random_parser = commands.add_parser("random", help="生成随机初始化的迷你模型")
+    random_parser.add_argument("out_dir", nargs="?", default=TINY_MODEL_DIR)
+    random_parser.add_argument("--seed", type=int, default=0)
+
+    convert_parser = commands.add_parser("convert", help="把 Hugging Face Llama checkpoint 转成 int8")
+    convert_parser.add_argument("model_dir")
+    convert_parser.add_argument("out_dir", nargs="?", default=DEFAULT_MODEL_DIR)
+
+    chat_parser = commands.add_parser("chat", help="用本地模型回覆一句话 (流式输出)")
+    chat_parser.add_argument("prompt")
+    chat_parser.add_argument("--model-dir", default=DEFAULT_MODEL_DIR)
+    chat_parser.add_argument("--max-tokens", type=int, default=200)
+
+    args = parser.parse_args()
+    if args.command == "random":
+        print(f"✅ 已生成迷你模型: {create_random_model(args.out_dir, seed=args.seed)}")
+    elif args.command == "convert":
+        convert_hf_checkpoint(args.model_dir, args.out_dir)
+    else:
+        client = build_local_client(args.model_dir)
+        messages = [{"role": "user", "content": args.prompt}]
+        start = time.perf_counter()
+        for chunk in client.chat_completion(messages, max_tokens=args.max_tokens, stream=True):
+            print(chunk.choices[0].delta.content or "", end="", flush=True)
+        print(f"\n\n⏱️  {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
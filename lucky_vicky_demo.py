@@ -4,8 +4,24 @@
 """
 
 import gradio as gr
-from huggingface_hub import InferenceClient
+import asyncio
 import os
+import time
+
+from async_engine import acquire_hf_quota, chat_completion_async, chat_completion_stream_async
+from client_pool import aisuite_client, hf_client
+from disk_cache import get_disk_cache
+from fair_scheduler import FairScheduler, QueueFull
+from fallback import AllFallbacksFailed, FallbackChain
+from model_router import SCOREBOARD_HEADERS, ModelRouter
+from prewarm import Prewarmer
+from prompt_templates import GENERATION_PARAMS, LUCKY_VICKY
+from response_cache import TieredCache, get_response_cache, make_cache_key
+from retry_policy import retrying
+from semantic_cache import get_semantic_cache
+from stop_sequences import SignOffCutter, cut_stream_async, finish_response, stop_params, supports_stop
+from stream_utils import StreamAssembler, stream_telemetry
+from variant_pool import RefillPaused, VariantPool
 
 # ============================================
 # 配置
@@ -26,67 +42,312 @@ except FileNotFoundError:
 if not HF_TOKEN:
     HF_TOKEN = os.getenv('HF_TOKEN')
 
-# 创建客户端
+# 客户端按需从共享连接池借出, 每个 Gradio 线程各自持有一个 keep-alive 连接
 if HF_TOKEN:
-    client = InferenceClient(token=HF_TOKEN)
-    print("✅ Hugging Face 客户端已创建")
+    print("✅ Hugging Face Token 已载入")
 else:
-    client = None
     print("⚠️  未找到 Token,某些功能可能不可用")
 
 # ============================================
 # Lucky Vicky 生成函数
 # ============================================
 
-def generate_lucky_vicky(event, model_choice="Meta Llama 3.2-3B"):
-    """生成員瑛式思考貼文"""
+# system prompt 只在 prompt_templates.py 定义一次 (也用于缓存 key)
+SYSTEM_PROMPT = LUCKY_VICKY.system
+
+# 根据选择的模型
+MODEL_MAP = {
+    "Meta Llama 3.2-3B": "meta-llama/Llama-3.2-3B-Instruct",
+    "Meta Llama 3.2-1B": "meta-llama/Llama-3.2-1B-Instruct",
+    "Microsoft Phi-3": "microsoft/Phi-3-mini-4k-instruct"
+}
+
+DEFAULT_MODEL = "meta-llama/Llama-3.2-3B-Instruct"
+
+# 自动路由: 按各模型的延迟与错误率 EWMA 选择目前最快的模型
+AUTO_CHOICE = "⚡ Auto (最快)"
+router = ModelRouter(MODEL_MAP)
+
+# fallback 链: 首选模型失败时依序改用下一个, 每个模型各有熔断器
+# (设置了 GROQ_API_KEY 时, 最后一站是 Groq)
+GROQ_FALLBACK_MODEL = "groq:llama-3.3-70b-versatile"
+FALLBACK_CHAIN = list(MODEL_MAP.values()) + ([GROQ_FALLBACK_MODEL] if os.getenv("GROQ_API_KEY") else [])
+fallback_chain = FallbackChain(FALLBACK_CHAIN)
+
+# 采样参数 GENERATION_PARAMS 与其他入口共用 (见 prompt_templates.py);
+# 调用时另外带上结尾语 stop, 见 stop_sequences.py
+
+# 响应缓存: 内存 LRU 在前, SQLite 磁盘缓存在后 (多个 worker 与重启之后都能共用)
+response_cache = TieredCache(get_response_cache(), get_disk_cache())
+
+# 语义缓存: 意思相近的事件 (例如「手機掉到水裡了」与「手機不小心掉進水裡」) 共用贴文
+# (默认不启用, 设置 LUCKY_VICKY_SEMANTIC_CACHE=1 才启用, 见 semantic_cache.py)
+semantic_cache = get_semantic_cache()
+
+# 公平调度: 全局最多 MAX_CONCURRENCY 个生成同时进行, 各 session 轮流取得名额,
+# 排队总数超过 MAX_QUEUE 时直接请使用者稍后再试
+MAX_CONCURRENCY = int(os.getenv("LUCKY_VICKY_MAX_CONCURRENCY", "4"))
+MAX_QUEUE = int(os.getenv("LUCKY_VICKY_MAX_QUEUE", "32"))
+QUEUE_POLL_INTERVAL = 1.0  # 排队时多久刷新一次位置 (秒)
+scheduler = FairScheduler(max_concurrency=MAX_CONCURRENCY, max_queue=MAX_QUEUE)
+
+
+def resolve_model(model_choice):
+    """下拉选单的选项 -> 模型 ID; Auto 时交给路由器决定"""
+    if model_choice == AUTO_CHOICE:
+        return router.choose()
+    return MODEL_MAP.get(model_choice, DEFAULT_MODEL)
+
+
+def routing_report():
+    """路由记分板与最近一次的路由决定 (给运维人员看请求为什么被送到某个模型)"""
+    decision = router.last_decision
+    if decision is None:
+        note = "尚未有 Auto 请求"
+    else:
+        note = f"最近一次 Auto 路由: **{decision['name']}** ({decision['reason']})"
+    queue = scheduler.stats()
+    note += (f"\n\n排队状况: 执行中 {queue['running']}/{MAX_CONCURRENCY}, "
+             f"等待 {queue['queued']}/{MAX_QUEUE}, 已拒绝 {queue['rejected']}, "
+             f"平均耗时 {queue['service_time']:.1f}s")
+    # 首字延迟 (TTFT) 由 StreamAssembler.finish 登记, 这里只读汇总
+    telemetry = stream_telemetry()
+    if telemetry["ttft_p50"] is not None:
+        note += (f"\n\n首字延迟 (最近 {telemetry['streams']} 次流式生成): "
+                 f"中位数 {telemetry['ttft_p50']:.2f}s, 最慢 {telemetry['ttft_max']:.2f}s, "
+                 f"平均 {telemetry['tokens_per_second']:.1f} tok/s")
+    return router.scoreboard_table(), note
+
+
+def session_of(request):
+    """取得调度用的 session 标识 (API 调用没有 session_hash 时改用客户端 IP)"""
+    if request is None:
+        return "anonymous"
+    if request.session_hash:
+        return request.session_hash
+    return request.client.host if request.client else "anonymous"
+
+
+def build_messages(event, model):
+    """组装对话消息 (事件超过该模型的上下文窗口时截断)"""
+    return LUCKY_VICKY.build(event, model, GENERATION_PARAMS["max_tokens"])
+
+
+def cache_key(event, model):
+    """同一事件 + 模型 + 采样参数 共用一个缓存条目"""
+    return make_cache_key(SYSTEM_PROMPT, event, model, **GENERATION_PARAMS)
+
+
+def lookup_cache(event, model, fresh=False):
+    """先查精确缓存, 再查语义相似缓存; fresh=True 时两者都跳过"""
+    cached = response_cache.get(cache_key(event, model), fresh=fresh)
+    if cached is None:
+        cached = semantic_cache.get(event, cache_key("", model), fresh=fresh)
+    return cached
+
+
+def store_cache(event, model, result):
+    """生成成功后写入精确缓存与语义缓存"""
+    response_cache.set(cache_key(event, model), result)
+    semantic_cache.set(event, cache_key("", model), result)
+
+
+def serve_cached(event, model, fresh=False):
+    """热门事件优先从变体池取一篇没出现过的版本, 否则查缓存"""
+    variant = variant_pool.draw(event, model) if HF_TOKEN else None
+    if variant is not None:
+        return variant
+    return lookup_cache(event, model, fresh)
+
+
+def format_error(error, model_choice):
+    """把异常转换成给使用者看的提示"""
+    error_msg = str(error)
     
-    if not event or not event.strip():
-        return "❌ 请输入发生的事件!"
+    if "not_supported" in error_msg or "doesn't support" in error_msg:
+        return f"❌ 模型 '{model_choice}' 在免费账户中不可用\n\n💡 建议:\n1. 尝试其他模型\n2. 升级 Hugging Face 账户\n3. 或使用 Groq API (见 Notebook)"
+    elif "401" in error_msg or "Invalid token" in error_msg:
+        return "❌ Token 无效或已过期\n\n请检查:\n1. Token 是否正确\n2. Token 是否有 'Read' 权限\n3. 在 https://huggingface.co/settings/tokens 重新生成"
+    else:
+        return f"❌ 错误: {error_msg}\n\n💡 可能的原因:\n1. 网络连接问题\n2. API 速率限制\n3. 模型暂时不可用"
+
+
+@retrying()
+def generate_post(event, model):
+    """直接调用模型生成贴文 (不经过缓存; 暂时性错误自动重试, 仍失败时抛出异常)"""
+    started = time.perf_counter()
+    # 事件太长 (PromptTooLong) 不是模型的问题, 在计时之前检查
+    messages = build_messages(event, model)
+    # hf_client 先在令牌桶排队取得额度, 之后才开始计时 (限流等待不算进模型延迟)
+    with hf_client(HF_TOKEN) as client, router.track(model):
+        response = client.chat_completion(
+            messages=messages,
+            model=model,
+            **stop_params(event, model, GENERATION_PARAMS)
+        )
+    return finish_response(response, GENERATION_PARAMS["max_tokens"], time.perf_counter() - started, model)
+
+
+@retrying()
+async def generate_post_async(event, model):
+    """generate_post 的异步版本"""
+    started = time.perf_counter()
+    messages = build_messages(event, model)
+    await acquire_hf_quota(HF_TOKEN)
+    with router.track(model):
+        response = await chat_completion_async(
+            messages,
+            model,
+            token=HF_TOKEN,
+            rate_limit=False,
+            **stop_params(event, model, GENERATION_PARAMS)
+        )
+    return finish_response(response, GENERATION_PARAMS["max_tokens"], time.perf_counter() - started, model)
+
+
+@retrying()
+def generate_post_groq(event, model=GROQ_FALLBACK_MODEL):
+    """通过 aisuite 调用 Groq (fallback 链的最后一站)"""
+    started = time.perf_counter()
+    with aisuite_client("groq") as client:
+        response = client.chat.completions.create(
+            model=model,
+            messages=build_messages(event, model),
+            **stop_params(event, model, GENERATION_PARAMS)
+        )
+    return finish_response(response, GENERATION_PARAMS["max_tokens"], time.perf_counter() - started, model)
+
+
+async def call_model_async(event, model):
+    """按模型 ID 选择 Hugging Face 或 Groq (Groq 的 SDK 是同步的, 放进线程执行)"""
+    if model.startswith("groq:"):
+        return await asyncio.to_thread(generate_post_groq, event, model)
+    return await generate_post_async(event, model)
+
+
+# 变体池补充也经过公平调度 (算作一个独立的 session) 与熔断器;
+# 调度器只能在 Gradio 的事件循环中使用, 处理函数第一次执行时记下这个循环
+VARIANT_POOL_SESSION = "variant-pool"
+generation_loop = None
+
+
+def bind_generation_loop():
+    """记下 Gradio 处理函数所在的事件循环 (变体池的后台线程要把补充请求交给它)"""
+    global generation_loop
+    generation_loop = asyncio.get_running_loop()
+
+
+def refill_paused():
+    """有使用者在排队时暂停补充 (只读计数, 不需要在事件循环中)"""
+    return scheduler.stats()["queued"] > 0
+
+
+async def generate_variant_async(event, model):
+    """变体池补充: 与使用者请求共用调度器与熔断器, 不换模型 (池子是按模型分的)"""
+    if refill_paused():
+        raise RefillPaused()
+    ticket = await scheduler.acquire(VARIANT_POOL_SESSION)
+    try:
+        result, _ = await fallback_chain.run_async(
+            lambda candidate: generate_post_async(event, candidate), start=model, fallback=False
+        )
+        return result
+    finally:
+        scheduler.release(ticket)
+
+
+def generate_variant(event, model):
+    """在变体池的后台线程中调用: 把补充请求交给 Gradio 的事件循环执行"""
+    loop = generation_loop
+    if loop is None:
+        raise RefillPaused()
+    return asyncio.run_coroutine_threadsafe(generate_variant_async(event, model), loop).result()
+
+
+# 热门事件变体池: 重复点击也能立即拿到不同版本, 由后台线程补充 (有人排队时暂停)
+variant_pool = VariantPool(generate_variant, paused=refill_paused)
+
+
+async def stream_lucky_vicky(event, model_choice="Meta Llama 3.2-3B", fresh=False,
+                             request: gr.Request = None):
+    """
+    流式生成員瑛式思考貼文 (异步生成器)
     
-    system_prompt = """請用台灣習慣的中文來寫這段 po 文:
-請用員瑛式思考, 也就是什麼都正向思維任何使用者寫的事情,
-用我的第一人稱、社群媒體 po 文的口吻說一次,
-說為什麼這是一件超幸運的事, 並且以「完全是 Lucky Vicky 呀!」結尾。
-可以適度的加上 emoji。"""
+    每收到一段文字就 yield 目前累积的完整贴文, Gradio 会即时刷新输出框;
+    缓存命中时直接一次 yield 完整贴文;
+    需要调用远程模型时先经过公平调度, 排队期间显示排队位置与预计等待时间;
+    还没有输出任何文字就失败时, 沿 fallback 链改用下一个模型
+    """
     
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": event}
-    ]
+    if not event or not event.strip():
+        yield "❌ 请输入发生的事件!"
+        return
     
-    # 根据选择的模型
-    model_map = {
-        "Meta Llama 3.2-3B": "meta-llama/Llama-3.2-3B-Instruct",
-        "Meta Llama 3.2-1B": "meta-llama/Llama-3.2-1B-Instruct",
-        "Microsoft Phi-3": "microsoft/Phi-3-mini-4k-instruct"
-    }
+    bind_generation_loop()
+    model = resolve_model(model_choice)
+    cached = await asyncio.to_thread(serve_cached, event, model, fresh)
+    if cached is not None:
+        yield cached
+        return
     
-    model = model_map.get(model_choice, "meta-llama/Llama-3.2-3B-Instruct")
+    if not HF_TOKEN:
+        yield "❌ 错误: 未配置 Hugging Face Token\n\n请在 .env 文件中设置 HF_TOKEN"
+        return
     
     try:
-        if not client:
-            return "❌ 错误: 未配置 Hugging Face Token\n\n请在 .env 文件中设置 HF_TOKEN"
-        
-        response = client.chat_completion(
-            messages=messages,
-            model=model,
-            max_tokens=500,
-            temperature=0.8
-        )
-        
-        result = response.choices[0].message.content
-        return result
-        
-    except Exception as e:
-        error_msg = str(e)
+        ticket = scheduler.submit(session_of(request))
+    except QueueFull as e:
+        yield f"🚦 {e}, 请约 {e.retry_after:.0f} 秒后再试"
+        return
+    
+    assembler = StreamAssembler(label=model)
+    errors = []
+    blocked = set()
+    try:
+        while not ticket.granted:
+            position = scheduler.position(ticket)
+            yield (f"⏳ 排队中: 前面还有 {position} 个请求, "
+                   f"预计等待约 {scheduler.estimate_wait(position):.0f} 秒...")
+            await ticket.wait(QUEUE_POLL_INTERVAL)
         
-        if "not_supported" in error_msg or "doesn't support" in error_msg:
-            return f"❌ 模型 '{model_choice}' 在免费账户中不可用\n\n💡 建议:\n1. 尝试其他模型\n2. 升级 Hugging Face 账户\n3. 或使用 Groq API (见 Notebook)"
-        elif "401" in error_msg or "Invalid token" in error_msg:
-            return "❌ Token 无效或已过期\n\n请检查:\n1. Token 是否正确\n2. Token 是否有 'Read' 权限\n3. 在 https://huggingface.co/settings/tokens 重新生成"
-        else:
-            return f"❌ 错误: {error_msg}\n\n💡 可能的原因:\n1. 网络连接问题\n2. API 速率限制\n3. 模型暂时不可用"
+        for candidate in fallback_chain.candidates(model, blocked=blocked):
+            try:
+                if candidate.startswith("groq:"):
+                    assembler.feed(await call_model_async(event, candidate))
+                    yield assembler.text
+                else:
+                    # 读到结尾语就关闭连接 (提供商不支持 stop 时也不会继续生成)
+                    await acquire_hf_quota(HF_TOKEN)
+                    # 流结束时 finish_reason 写进 cutter.meta, 停在 stop 字串上就补回结尾语
+                    cutter = SignOffCutter(GENERATION_PARAMS["max_tokens"], stop=supports_stop(candidate))
+                    stream = chat_completion_stream_async(
+                        build_messages(event, candidate),
+                        candidate,
+                        token=HF_TOKEN,
+                        rate_limit=False,
+                        meta=cutter.meta,
+                        **stop_params(event, candidate, GENERATION_PARAMS)
+                    )
+                    with router.track(candidate):
+                        async for chunk in cut_stream_async(stream, cutter):
+                            assembler.feed(chunk)
+                            yield assembler.text
+            except Exception as e:
+                fallback_chain.record_error(candidate, e, blocked)
+                if assembler.text:
+                    # 已经输出一部分了, 换模型会得到另一篇不相关的贴文, 直接报错
+                    yield assembler.text + "\n\n" + format_error(e, model_choice)
+                    return
+                errors.append((candidate, e))
+                continue
+            fallback_chain.record(candidate, ok=True)
+            if assembler.text:
+                await asyncio.to_thread(store_cache, event, candidate, assembler.text)
+            return
+        yield format_error(AllFallbacksFailed(errors), model_choice)
+    finally:
+        scheduler.release(ticket)
+        assembler.finish()
 
 # ============================================
 # 示例数据
@@ -100,6 +361,13 @@ examples = [
     ["手機掉到水裡了", "Microsoft Phi-3"],
 ]
 
+
+def start_prewarm():
+    """在后台预热所有范例 (优先读快照, 并发数有限), 不阻塞 Gradio 启动"""
+    pairs = [(event, MODEL_MAP[choice]) for event, choice in examples]
+    prewarmer = Prewarmer(pairs, generate_post, store_cache, lookup=lookup_cache)
+    return prewarmer.start()
+
 # ============================================
 # Gradio 界面
 # ============================================
@@ -196,11 +464,18 @@ with gr.Blocks(
                 choices=[
                     "Meta Llama 3.2-3B",
                     "Meta Llama 3.2-1B",
-                    "Microsoft Phi-3"
+                    "Microsoft Phi-3",
+                    AUTO_CHOICE
                 ],
                 value="Meta Llama 3.2-3B",
                 label="🤖 選擇 AI 模型",
-                info="推薦使用 Meta Llama 3.2-3B (免費且效果好)"
+                info="推薦使用 Meta Llama 3.2-3B (免費且效果好); Auto 會自動選擇目前最快的模型"
+            )
+            
+            # 不使用缓存, 强制产生新版本
+            fresh_variant = gr.Checkbox(
+                label="🎲 產生新版本 (不使用快取)",
+                value=False
             )
             
             # 生成按钮
@@ -224,24 +499,38 @@ with gr.Blocks(
         examples=examples,
         inputs=[event_input, model_choice],
         outputs=output,
-        fn=generate_lucky_vicky,
+        fn=stream_lucky_vicky,
         cache_examples=False,
         label="💡 試試這些例子"
     )
     
-    # 绑定事件
+    # 路由记分板
+    with gr.Accordion("📊 Auto 路由記分板", open=False):
+        routing_note = gr.Markdown()
+        scoreboard = gr.Dataframe(headers=SCOREBOARD_HEADERS, interactive=False)
+        refresh_btn = gr.Button("🔄 重新整理", size="sm")
+    
+    # 绑定事件 (生成结束后顺便刷新记分板)
+    # 两个入口共用同一个并发组; trigger_mode="once": 上一次还没结束时忽略重复触发
     generate_btn.click(
-        fn=generate_lucky_vicky,
-        inputs=[event_input, model_choice],
-        outputs=output
-    )
+        fn=stream_lucky_vicky,
+        inputs=[event_input, model_choice, fresh_variant],
+        outputs=output,
+        concurrency_id="generate",
+        trigger_mode="once"
+    ).then(fn=routing_report, outputs=[scoreboard, routing_note])
     
     # 也支持按 Enter 键
     event_input.submit(
-        fn=generate_lucky_vicky,
-        inputs=[event_input, model_choice],
-        outputs=output
-    )
+        fn=stream_lucky_vicky,
+        inputs=[event_input, model_choice, fresh_variant],
+        outputs=output,
+        concurrency_id="generate",
+        trigger_mode="once"
+    ).then(fn=routing_report, outputs=[scoreboard, routing_note])
+    
+    refresh_btn.click(fn=routing_report, outputs=[scoreboard, routing_note])
+    demo.load(fn=routing_report, outputs=[scoreboard, routing_note])
     
     # 页脚
     gr.HTML("""
@@ -267,10 +556,21 @@ if __name__ == "__main__":
         print("⚠️  未找到 Token")
         print("請在 .env 文件中設置 HF_TOKEN")
     
+    if HF_TOKEN:
+        print("🔥 正在後台預熱範例貼文...")
+        start_prewarm()
+    
     print("\n正在啟動 Gradio 應用...")
     print("應用將在瀏覽器中自動打開")
     print("\n按 Ctrl+C 停止應用\n")
     
+    # Gradio 队列只负责收下请求 (缓存命中不必排队), 真正的并发上限与公平排序交给 scheduler;
+    # 所以 Gradio 的并发数要比 scheduler 的名额加上排队上限还大, 排队的请求才能显示位置
+    demo.queue(
+        default_concurrency_limit=MAX_CONCURRENCY + MAX_QUEUE,
+        max_size=2 * (MAX_CONCURRENCY + MAX_QUEUE)
+    )
+    
     # 启动应用
     # 云端部署时使用默认配置，本地运行时可以指定端口
     demo.launch(
@@ -4,6 +4,7 @@ Lucky Vicky 生成器 - 使用 Groq (无需 Hugging Face Token)
 """
 
 import os
+import time
 
 print("="*60)
 print("🌈 Lucky Vicky 生成器")
@@ -14,6 +15,12 @@ print("如果您想使用 Hugging Face,请确保 Token 有效\n")
 # 检查是否安装了 aisuite
 try:
     import aisuite as ai
+    from client_pool import aisuite_client
+    from disk_cache import get_disk_cache
+    from prompt_templates import GENERATION_PARAMS, LUCKY_VICKY
+    from response_cache import make_cache_key
+    from retry_policy import call_with_retry
+    from stop_sequences import finish_response, stop_params
     print("✅ AISuite 已安装")
 except ImportError:
     print("❌ 未找到 AISuite")
@@ -21,29 +28,39 @@ except ImportError:
     input("\n按 Enter 退出...")
     exit()
 
-# 系统提示
-system = """請用台灣習慣的中文來寫這段 po 文:
-請用員瑛式思考, 也就是什麼都正向思維任何使用者寫的事情,
-用我的第一人稱、社群媒體 po 文的口吻說一次,
-說為什麼這是一件超幸運的事, 並且以「完全是 Lucky Vicky 呀!」結尾。
-可以適度的加上 emoji。"""
+# 系统提示 (与其他入口共用 prompt_templates.py 中的同一份)
+system = LUCKY_VICKY.system
 
-def lucky_vicky_groq(event):
-    """使用 Groq 的 Lucky Vicky 生成器"""
+MODEL = "groq:llama-3.3-70b-versatile"
+
+# 磁盘缓存: 与 Streamlit / Gradio 共用同一个 SQLite 文件
+cache = get_disk_cache()
+
+def lucky_vicky_groq(event, fresh=False):
+    """使用 Groq 的 Lucky Vicky 生成器 (相同事件直接读取磁盘缓存)"""
+    key = make_cache_key(system, event, MODEL, **GENERATION_PARAMS)
+    cached = cache.get(key, fresh=fresh)
+    if cached is not None:
+        return cached
+    
     try:
-        client = ai.Client()
-        
-        messages = [
-            {"role": "system", "content": system},
-            {"role": "user", "content": event}
-        ]
+        # 事件超过上下文窗口时截断
+        messages = LUCKY_VICKY.build(event, MODEL, GENERATION_PARAMS["max_tokens"])
         
-        response = client.chat.completions.create(
-            model="groq:llama-3.3-70b-versatile",
-            messages=messages
-        )
+        # 5xx / 429 / 连接重置会自动重试 (指数退避 + jitter, 总时间不超过 deadline)
+        # 读到结尾语「完全是 Lucky Vicky 呀!」就停止, 不让模型继续讲下去
+        started = time.perf_counter()
+        with aisuite_client("groq") as client:
+            response = call_with_retry(
+                client.chat.completions.create,
+                model=MODEL,
+                messages=messages,
+                **stop_params(event, MODEL, GENERATION_PARAMS)
+            )
         
-        return response.choices[0].message.content
+        result = finish_response(response, GENERATION_PARAMS["max_tokens"], time.perf_counter() - started, MODEL)
+        cache.set(key, result)
+        return result
         
     except Exception as e:
         return f"❌ 错误: {e}"
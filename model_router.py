@@ -0,0 +1,161 @@
+"""
+延迟感知的模型路由 ("Auto (最快)")
+为每个模型维护延迟与错误率的指数移动平均 (EWMA),
+每个请求选择预期耗时最短的模型, 并保留一小部分流量随机探索其他模型,
+让变快的模型有机会被重新发现
+
+失败的模型进入退避期 (连续失败次数越多退避越久), 退避期间不参与路由;
+从来没有成功过的模型按 FAILURE_LATENCY 计算预期耗时, 不会一直被当作「尚无数据」优先选择
+"""
+
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# ============================================
+# 配置
+# ============================================
+
+DEFAULT_ALPHA = 0.2           # EWMA 权重, 越大越重视最新样本
+DEFAULT_EXPLORE_RATE = 0.1    # 探索流量比例
+MIN_SUCCESS_RATE = 0.05       # 计算预期耗时时成功率的下限
+FAILURE_LATENCY = 10.0        # 从未成功的模型的假设延迟 (秒)
+FAILURE_BACKOFF = 5.0         # 失败后暂停路由的秒数, 连续失败时加倍
+MAX_FAILURE_BACKOFF = 300.0
+
+
+class _ModelScore:
+    def __init__(self):
+        self.latency = None   # 成功请求的延迟 EWMA (秒)
+        self.error_rate = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.routed = 0
+        self.explored = 0
+        self.last_used = None
+        self.consecutive_failures = 0
+        self.retry_at = 0.0   # time.monotonic() 早于此值时处于退避期
+
+
+class ModelRouter:
+    """
+    按 EWMA 延迟与错误率选择模型
+
+    参数:
+        models: 显示名称 -> 模型 ID 的映射 (与 MODEL_MAP 相同)
+        alpha: EWMA 权重
+        explore_rate: 随机探索其他模型的比例
+        rng: random.Random 实例 (测试时可固定种子)
+
+    预期耗时 = 延迟 EWMA / (1 - 错误率 EWMA), 即把失败重试的代价也算进去
+    """
+
+    def __init__(self, models, alpha=DEFAULT_ALPHA, explore_rate=DEFAULT_EXPLORE_RATE, rng=None):
+        self.models = dict(models)
+        self.alpha = alpha
+        self.explore_rate = explore_rate
+        self._rng = rng or random.Random()
+        self._scores = {model: _ModelScore() for model in self.models.values()}
+        self._names = {model: name for name, model in self.models.items()}
+        self._lock = threading.Lock()
+        self.last_decision = None
+
+    def _expected(self, score):
+        if score.requests == 0:
+            return None
+        latency = FAILURE_LATENCY if score.latency is None else score.latency
+        return latency / max(1.0 - score.error_rate, MIN_SUCCESS_RATE)
+
+    def choose(self):
+        """选择这次请求要使用的模型 ID"""
+        with self._lock:
+            now = time.monotonic()
+            # 退避中的模型不参与路由 (全部都在退避时, 选最早结束退避的那一个)
+            eligible = [model for model, score in self._scores.items() if score.retry_at <= now]
+            if not eligible:
+                eligible = [min(self._scores, key=lambda m: self._scores[m].retry_at)]
+            unmeasured = [model for model in eligible if self._scores[model].requests == 0]
+            if unmeasured:
+                # 还没有数据的模型优先各试一次 (失败过的模型已经有数据, 不会再进来)
+                model = min(unmeasured, key=lambda m: self._scores[m].routed)
+                reason = "尚无延迟数据"
+            else:
+                ranked = sorted(eligible, key=lambda m: self._expected(self._scores[m]))
+                model = ranked[0]
+                reason = f"预期耗时最短 ({self._expected(self._scores[model]):.2f}s)"
+                if len(ranked) > 1 and self._rng.random() < self.explore_rate:
+                    model = self._rng.choice(ranked[1:])
+                    reason = "随机探索"
+                    self._scores[model].explored += 1
+            self._scores[model].routed += 1
+            self.last_decision = {"model": model, "name": self._names[model],
+                                  "reason": reason, "time": time.time()}
+            return model
+
+    def record(self, model, latency, ok=True):
+        """记录一次请求结果; 失败的请求更新错误率并进入退避, 不更新延迟"""
+        with self._lock:
+            score = self._scores.get(model)
+            if score is None:
+                return
+            score.requests += 1
+            score.last_used = time.time()
+            score.error_rate += self.alpha * ((0.0 if ok else 1.0) - score.error_rate)
+            if ok:
+                score.latency = latency if score.latency is None else \
+                    score.latency + self.alpha * (latency - score.latency)
+                score.consecutive_failures = 0
+                score.retry_at = 0.0
+            else:
+                score.errors += 1
+                score.consecutive_failures += 1
+                backoff = FAILURE_BACKOFF * 2 ** (score.consecutive_failures - 1)
+                score.retry_at = time.monotonic() + min(backoff, MAX_FAILURE_BACKOFF)
+
+    @contextmanager
+    def track(self, model):
+        """
+        计时一段调用并记录结果, 例外会继续抛出
+
+        限流排队要放在这段之外 (先取得额度再进入), 否则我们自己的节流会被算成模型变慢
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.record(model, time.perf_counter() - start, ok=False)
+            raise
+        self.record(model, time.perf_counter() - start)
+
+    def scoreboard(self):
+        """每个模型的路由依据, 按预期耗时排序 (没有数据的排在最后)"""
+        with self._lock:
+            rows = []
+            for model, score in self._scores.items():
+                expected = self._expected(score)
+                rows.append({
+                    "name": self._names[model],
+                    "model": model,
+                    "latency_ewma": score.latency,
+                    "error_rate": score.error_rate,
+                    "expected": expected,
+                    "requests": score.requests,
+                    "errors": score.errors,
+                    "routed": score.routed,
+                    "explored": score.explored,
+                })
+        rows.sort(key=lambda row: (row["expected"] is None, row["expected"] or 0.0))
+        return rows
+
+    def scoreboard_table(self):
+        """scoreboard 转成表格行 (给 Gradio Dataframe / Streamlit table 使用)"""
+        def fmt(value, pattern):
+            return "-" if value is None else pattern.format(value)
+
+        return [[row["name"], fmt(row["latency_ewma"], "{:.2f}s"), fmt(row["error_rate"], "{:.0%}"),
+                 fmt(row["expected"], "{:.2f}s"), row["requests"], row["routed"], row["explored"]]
+                for row in self.scoreboard()]
+
+
+SCOREBOARD_HEADERS = ["模型", "延迟 EWMA", "错误率", "预期耗时", "请求数", "路由次数", "探索次数"]
@@ -12,18 +12,30 @@
 # ============================================
 # Cell 2: 导入并设置
 # ============================================
-from huggingface_hub import InferenceClient
 from google.colab import userdata
+import asyncio
 import os
 
+# 以下模块来自本项目, 请先把这些文件全部上传到 Colab 工作目录 (包含它们互相依赖的模块):
+#   async_engine.py, client_pool.py, event_normalizer.py, hedging.py, prompt_templates.py,
+#   rate_limiter.py, response_cache.py, retry_policy.py, stop_sequences.py, stream_utils.py
+# Lucky Vicky 的 system prompt 与采样参数统一放在 prompt_templates.py
+from async_engine import chat_completion_async
+from client_pool import hf_client
+from hedging import Hedger
+from prompt_templates import GENERATION_PARAMS, LUCKY_VICKY
+from response_cache import get_response_cache, make_cache_key
+
+response_cache = get_response_cache()
+
+# 对冲请求: 主要提供商超过 p95 延迟仍未响应时, 向另一个提供商发出备用请求
+hedger = Hedger()
+
 # 从 Colab Secrets 读取 token
 # 请先在左侧 🔑 图标添加名为 'HuggingFace' 的 Secret
 hf_token = userdata.get('HuggingFace')
 
-# 创建客户端
-client = InferenceClient(token=hf_token)
-
-print("✅ Hugging Face 客户端创建成功!")
+print("✅ Hugging Face Token 已载入, 客户端将从连接池借出")
 
 
 # ============================================
@@ -35,11 +47,12 @@ messages = [
     {"role": "user", "content": "你好!请介绍一下自己"}
 ]
 
-response = client.chat_completion(
-    messages=messages,
-    model="Qwen/Qwen2.5-7B-Instruct",
-    max_tokens=200
-)
+with hf_client(hf_token) as client:
+    response = client.chat_completion(
+        messages=messages,
+        model="Qwen/Qwen2.5-7B-Instruct",
+        max_tokens=200
+    )
 
 print(response.choices[0].message.content)
 
@@ -47,29 +60,30 @@ print(response.choices[0].message.content)
 # ============================================
 # Cell 4: Lucky Vicky 函数 (Hugging Face 版本)
 # ============================================
-def lucky_post_hf(event):
+def lucky_post_hf(event, fresh=False):
     """
     使用 Hugging Face 的員瑛式思考生成器
-    """
-    system_prompt = """請用台灣習慣的中文來寫這段 po 文:
-請用員瑛式思考, 也就是什麼都正向思維任何使用者寫的事情,
-用我的第一人稱、社群媒體 po 文的口吻說一次,
-說為什麼這是一件超幸運的事, 並且以「完全是 Lucky Vicky 呀!」結尾。
-可以適度的加上 emoji。"""
     
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": event}
-    ]
+    相同事件会直接返回缓存结果; fresh=True 时强制产生新版本
+    """
+    # 与其他入口共用同一组采样参数, 缓存 key 才会相同
+    params = GENERATION_PARAMS
+    messages = LUCKY_VICKY.build(event, "Qwen/Qwen2.5-7B-Instruct", params["max_tokens"])
+    key = make_cache_key(LUCKY_VICKY.system, event, "Qwen/Qwen2.5-7B-Instruct", **params)
+    cached = response_cache.get(key, fresh=fresh)
+    if cached is not None:
+        return cached
     
-    response = client.chat_completion(
-        messages=messages,
-        model="Qwen/Qwen2.5-7B-Instruct",
-        max_tokens=500,
-        temperature=0.8
-    )
+    with hf_client(hf_token) as client:
+        response = client.chat_completion(
+            messages=messages,
+            model="Qwen/Qwen2.5-7B-Instruct",
+            **params
+        )
     
-    return response.choices[0].message.content
+    result = response.choices[0].message.content
+    response_cache.set(key, result)
+    return result
 
 
 # ============================================
@@ -89,35 +103,75 @@ for event in test_events:
     result = lucky_post_hf(event)
     print(f"\n📣 員瑛式貼文:\n{result}\n")
 
+print(f"缓存统计: {response_cache.stats()}")
+
 
 # ============================================
 # Cell 6: 多提供商版本 (整合 Groq 和 Hugging Face)
 # ============================================
-def lucky_post_multi(prompt, provider="huggingface"):
+def provider_call(provider, prompt, template=LUCKY_VICKY):
+    """
+    返回调用某个提供商的协程工厂 (hedged 模式使用)
+    
+    Hugging Face 走 AsyncInferenceClient, 落败时可以真正取消;
+    Groq 的 reply() 是同步函数, 放进线程执行, 落败时结果直接丢弃
+    """
+    if provider == "huggingface":
+        # 与其他入口相同, 经过模板的上下文窗口检查
+        messages = template.build(prompt, "Qwen/Qwen2.5-7B-Instruct", GENERATION_PARAMS["max_tokens"])
+        
+        async def call():
+            response = await chat_completion_async(
+                messages,
+                "Qwen/Qwen2.5-7B-Instruct",
+                token=hf_token,
+                **GENERATION_PARAMS
+            )
+            return response.choices[0].message.content
+        return call
+    
+    return lambda: asyncio.to_thread(reply, system=template.system, prompt=prompt,
+                                     provider="groq", model="openai/gpt-oss-120b")
+
+
+def hedged_post(prompt, primary="huggingface", backup=None):
+    """
+    对冲请求: 先发给 primary, 超过它的 p95 延迟还没响应再发给 backup
+    
+    backup 默认为另一个提供商, 也可以与 primary 相同 (同一提供商发两次)
+    返回先完成的结果, 另一个请求会被取消
+    """
+    backup = backup or ("groq" if primary == "huggingface" else "huggingface")
+    result, _ = hedger.run_sync(
+        (primary, provider_call(primary, prompt)),
+        (backup, provider_call(backup, prompt))
+    )
+    return result
+
+
+def lucky_post_multi(prompt, provider="huggingface", hedge=False, backup=None):
     """
     支持多个 AI 提供商的 Lucky Vicky
     
     参数:
         prompt: 事件描述
-        provider: "huggingface" 或 "groq"
+        provider: "huggingface" 或 "groq" (hedge=True 时为主要提供商)
+        hedge: 是否使用对冲请求
+        backup: 对冲请求的备用提供商 (默认为另一个提供商)
     """
-    system = """請用台灣習慣的中文來寫這段 po 文:
-請用員瑛式思考, 也就是什麼都正向思維任何使用者寫的事情,
-用我的第一人稱、社群媒體 po 文的口吻說一次,
-說為什麼這是一件超幸運的事, 並且以「完全是 Lucky Vicky 呀!」結尾。
-可以適度的加上 emoji。"""
+    system = LUCKY_VICKY.system
+    
+    if hedge:
+        return hedged_post(prompt, provider.lower(), backup)
     
     if provider.lower() == "huggingface":
-        messages = [
-            {"role": "system", "content": system},
-            {"role": "user", "content": prompt}
-        ]
-        response = client.chat_completion(
-            messages=messages,
-            model="Qwen/Qwen2.5-7B-Instruct",
-            max_tokens=500,
-            temperature=0.8
-        )
+        messages = LUCKY_VICKY.build(prompt, "Qwen/Qwen2.5-7B-Instruct", GENERATION_PARAMS["max_tokens"])
+        with hf_client(hf_token) as client:
+            response = client.chat_completion(
+                messages=messages,
+                model="Qwen/Qwen2.5-7B-Instruct",
+                **GENERATION_PARAMS
+            )
         return response.choices[0].message.content
     
     elif provider.lower() == "groq":
@@ -140,6 +194,15 @@ print("\n" + "="*60 + "\n")
 print("使用 Groq:")
 print(lucky_post_multi(event, "groq"))
 
+print("\n" + "="*60 + "\n")
+
+print("对冲请求 (Hugging Face 优先, Groq 备用):")
+print(lucky_post_multi(event, "huggingface", hedge=True))
+
+stats = hedger.stats()
+print(f"\n对冲统计: 请求 {stats['requests']} / 发出对冲 {stats['hedged']} / "
+      f"对冲获胜 {stats['hedge_wins']} ({stats['hedge_win_rate']:.0%})")
+
 
 # ============================================
 # Cell 7: Gradio App (整合版)
@@ -147,32 +210,28 @@ print(lucky_post_multi(event, "groq"))
 import gradio as gr
 
 # 系统提示
-system = """請用台灣習慣的中文來寫這段 po 文:
-請用員瑛式思考, 也就是什麼都正向思維任何使用者寫的事情,
-用我的第一人稱、社群媒體 po 文的口吻說一次,
-說為什麼這是一件超幸運的事, 並且以「完全是 Lucky Vicky 呀!」結尾。
-可以適度的加上 emoji。"""
+system = LUCKY_VICKY.system
 
 def lucky_vicky_app(prompt, provider_choice):
     """Gradio 应用的主函数"""
     
     if provider_choice == "🤗 Hugging Face":
-        messages = [
-            {"role": "system", "content": system},
-            {"role": "user", "content": prompt}
-        ]
-        response = client.chat_completion(
-            messages=messages,
-            model="Qwen/Qwen2.5-7B-Instruct",
-            max_tokens=500,
-            temperature=0.8
-        )
+        messages = LUCKY_VICKY.build(prompt, "Qwen/Qwen2.5-7B-Instruct", GENERATION_PARAMS["max_tokens"])
+        with hf_client(hf_token) as client:
+            response = client.chat_completion(
+                messages=messages,
+                model="Qwen/Qwen2.5-7B-Instruct",
+                **GENERATION_PARAMS
+            )
         return response.choices[0].message.content
     
     elif provider_choice == "⚡ Groq":
         return reply(system=system, prompt=prompt, 
                     provider="groq", model="openai/gpt-oss-120b")
     
+    elif provider_choice == "🏁 最快回應 (Hedged)":
+        return hedged_post(prompt, "huggingface", "groq")
+    
     else:
         return "请选择一个 AI 提供商"
 
@@ -204,7 +263,7 @@ with gr.Blocks(
         with gr.Column(scale=1):
             # 模型选择
             provider_dropdown = gr.Dropdown(
-                choices=["🤗 Hugging Face", "⚡ Groq"],
+                choices=["🤗 Hugging Face", "⚡ Groq", "🏁 最快回應 (Hedged)"],
                 value="🤗 Hugging Face",
                 label="🤖 選擇 AI 模型"
             )
@@ -248,6 +307,7 @@ with gr.Blocks(
     💡 **提示**: 
     - Hugging Face 使用 Qwen 2.5 模型,中文能力强
     - Groq 速度更快,使用 GPT-OSS 模型
+    - 最快回應: 先問 Hugging Face, 太慢時同時問 Groq, 用先回來的答案
     - 可以尝试不同模型,看看哪个更符合你的期待!
     """)
 
@@ -265,11 +325,12 @@ def hf_sentiment(text):
         {"role": "system", "content": "你是情感分析专家。分析文本情感,只回答:正面、负面或中性。"},
         {"role": "user", "content": f"分析情感: {text}"}
     ]
-    response = client.chat_completion(
-        messages=messages,
-        model="Qwen/Qwen2.5-1.5B-Instruct",
-        max_tokens=20
-    )
+    with hf_client(hf_token) as client:
+        response = client.chat_completion(
+            messages=messages,
+            model="Qwen/Qwen2.5-1.5B-Instruct",
+            max_tokens=20
+        )
     return response.choices[0].message.content
 
 # 功能 2: 翻译
@@ -278,11 +339,12 @@ def hf_translate(text, target_lang="繁體中文"):
         {"role": "system", "content": f"你是专业翻译。将文本翻译成{target_lang}。"},
         {"role": "user", "content": text}
     ]
-    response = client.chat_completion(
-        messages=messages,
-        model="Qwen/Qwen2.5-7B-Instruct",
-        max_tokens=200
-    )
+    with hf_client(hf_token) as client:
+        response = client.chat_completion(
+            messages=messages,
+            model="Qwen/Qwen2.5-7B-Instruct",
+            max_tokens=200
+        )
     return response.choices[0].message.content
 
 # 功能 3: 摘要生成
@@ -291,11 +353,12 @@ def hf_summarize(text):
         {"role": "system", "content": "请用繁体中文总结以下内容,保持简洁。"},
         {"role": "user", "content": text}
     ]
-    response = client.chat_completion(
-        messages=messages,
-        model="Qwen/Qwen2.5-7B-Instruct",
-        max_tokens=300
-    )
+    with hf_client(hf_token) as client:
+        response = client.chat_completion(
+            messages=messages,
+            model="Qwen/Qwen2.5-7B-Instruct",
+            max_tokens=300
+        )
     return response.choices[0].message.content
 
 # 测试这些功能
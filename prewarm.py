@@ -0,0 +1,143 @@
+"""
+启动预热
+应用启动时在后台为每个 (范例事件, 模型) 组合准备好贴文:
+- 优先从快照文件载入 (不花任何 API 额度)
+- 缓存里已经有的跳过
+- 其余的以有限并发数在后台生成, 不阻塞应用启动
+完成后把结果写回快照, 下次启动 (例如 Streamlit Cloud 重启) 直接载入
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# ============================================
+# 配置
+# ============================================
+
+DEFAULT_SNAPSHOT_PATH = os.getenv("LUCKY_VICKY_PREWARM_SNAPSHOT",
+                                  os.path.join(".cache", "prewarm_snapshot.json"))
+DEFAULT_MAX_CONCURRENCY = 2  # 免费额度有限, 预热时最多同时发出的请求数
+
+
+def _snapshot_key(event, model):
+    return f"{model}\t{event}"
+
+
+def load_snapshot(path=DEFAULT_SNAPSHOT_PATH):
+    """读取快照, 文件不存在或损坏时返回空 dict"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_snapshot(entries, path=DEFAULT_SNAPSHOT_PATH):
+    """原子写入快照 (先写临时文件再改名, 避免其他进程读到一半)"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+class Prewarmer:
+    """
+    范例预热器
+
+    参数:
+        pairs: [(事件, 模型 ID), ...]
+        generate: generate(event, model) -> 贴文, 失败时抛出异常
+        store: store(event, model, 贴文), 写入应用使用的缓存
+        lookup: lookup(event, model) -> 贴文或 None, 用来跳过已缓存的组合 (可选)
+        snapshot_path: 快照文件路径, None 表示不使用快照
+        max_concurrency: 同时进行的生成请求上限
+    """
+
+    def __init__(self, pairs, generate, store, lookup=None,
+                 snapshot_path=DEFAULT_SNAPSHOT_PATH, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self.pairs = list(dict.fromkeys(pairs))
+        self.generate = generate
+        self.store = store
+        self.lookup = lookup
+        self.snapshot_path = snapshot_path
+        self.max_concurrency = max_concurrency
+
+        self._thread = None
+        self._lock = threading.Lock()
+        self._status = {"total": len(self.pairs), "snapshot": 0, "cached": 0,
+                        "generated": 0, "failed": 0, "done": False, "elapsed": 0.0}
+
+    def start(self):
+        """在守护线程中开始预热, 立即返回"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name="lucky-vicky-prewarm",
+                                                daemon=True)
+                self._thread.start()
+        return self
+
+    def run(self):
+        """执行预热 (阻塞直到完成)"""
+        start = time.perf_counter()
+        snapshot = load_snapshot(self.snapshot_path) if self.snapshot_path else {}
+        results = {}
+        pending = []
+
+        for event, model in self.pairs:
+            key = _snapshot_key(event, model)
+            if key in snapshot:
+                self.store(event, model, snapshot[key])
+                results[key] = snapshot[key]
+                self._count("snapshot")
+                continue
+            cached = self.lookup(event, model) if self.lookup else None
+            if cached is not None:
+                results[key] = cached
+                self._count("cached")
+                continue
+            pending.append((event, model))
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                thread_name_prefix="prewarm") as executor:
+            for event, model, text in executor.map(lambda pair: self._generate_one(*pair), pending):
+                if text is not None:
+                    results[_snapshot_key(event, model)] = text
+
+        if self.snapshot_path and results and results != snapshot:
+            try:
+                save_snapshot({**snapshot, **results}, self.snapshot_path)
+            except OSError as e:
+                print(f"⚠️  预热快照写入失败: {e}")
+
+        with self._lock:
+            self._status["done"] = True
+            self._status["elapsed"] = time.perf_counter() - start
+        status = self.status()
+        print(f"🔥 预热完成: 快照 {status['snapshot']} / 已缓存 {status['cached']} / "
+              f"生成 {status['generated']} / 失败 {status['failed']} ({status['elapsed']:.1f}s)")
+        return status
+
+    def _generate_one(self, event, model):
+        try:
+            text = self.generate(event, model)
+        except Exception as e:
+            print(f"⚠️  预热失败 [{model}] {event}: {e}")
+            self._count("failed")
+            return event, model, None
+        self.store(event, model, text)
+        self._count("generated")
+        return event, model, text
+
+    def _count(self, name):
+        with self._lock:
+            self._status[name] += 1
+
+    def status(self):
+        """目前进度"""
+        with self._lock:
+            return dict(self._status)
@@ -0,0 +1,250 @@
+"""
+Prompt 模板注册表
+Lucky Vicky 的 system prompt 原本在每个入口各复制一份, 也没有人知道实际送出多少 token:
+- 每个模板只定义一次, 启动时预先组好 system 消息, 各入口共用同一份
+- 按模型的 tokenizer 计算 token 数; system prompt 的 token 数按 (模板, 模型) 缓存,
+  事件的 token 数用 LRU 缓存 (热门事件不会重复编码)
+- 事件 + system prompt + max_tokens 超过模型的上下文窗口时, 在送出之前截断事件或直接拒绝
+
+tokenizer 从 Hugging Face 本地缓存读取 tokenizer.json (需要 tokenizers 库);
+设置 LUCKY_VICKY_FETCH_TOKENIZERS=1 时允许下载, 否则读不到就改用保守的字数估计
+"""
+
+import math
+import os
+import threading
+from functools import lru_cache
+
+from stop_sequences import DEFAULT_MAX_TOKENS
+
+# ============================================
+# 配置
+# ============================================
+
+LUCKY_VICKY_SYSTEM_PROMPT = """請用台灣習慣的中文來寫這段 po 文:
+請用員瑛式思考, 也就是什麼都正向思維任何使用者寫的事情,
+用我的第一人稱、社群媒體 po 文的口吻說一次,
+說為什麼這是一件超幸運的事, 並且以「完全是 Lucky Vicky 呀!」結尾。
+可以適度的加上 emoji。"""
+
+# Lucky Vicky 贴文的采样参数 (也是缓存 key 的一部分): 所有入口都用这一份,
+# 才能共用同一个磁盘缓存里的贴文
+GENERATION_PARAMS = {"max_tokens": DEFAULT_MAX_TOKENS, "temperature": 0.8}
+
+# 各模型的上下文窗口 (token); 不在表中的模型按 DEFAULT_CONTEXT_WINDOW 保守处理
+CONTEXT_WINDOWS = {
+    "meta-llama/Llama-3.2-3B-Instruct": 131072,
+    "meta-llama/Llama-3.2-1B-Instruct": 131072,
+    "microsoft/Phi-3-mini-4k-instruct": 4096,
+    "Qwen/Qwen2.5-7B-Instruct": 32768,
+    "Qwen/Qwen2.5-1.5B-Instruct": 32768,
+    "groq:llama-3.3-70b-versatile": 131072,
+    "groq:openai/gpt-oss-120b": 131072,
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+
+# 不是 Hugging Face 模型 ID 的模型, 改用同一系列的 tokenizer
+TOKENIZER_ALIASES = {
+    "groq:llama-3.3-70b-versatile": "meta-llama/Llama-3.3-70B-Instruct",
+    "groq:openai/gpt-oss-120b": "openai/gpt-oss-120b",
+}
+
+# 对话格式的特殊 token (角色标记、分隔符) 每条消息约占的 token 数
+MESSAGE_OVERHEAD_TOKENS = 8
+
+# 超过上下文窗口时: "truncate" 截断事件, "reject" 抛出 PromptTooLong
+DEFAULT_OVERFLOW = os.getenv("LUCKY_VICKY_OVERFLOW", "truncate")
+FETCH_TOKENIZERS = os.getenv("LUCKY_VICKY_FETCH_TOKENIZERS") == "1"
+
+# 没有 tokenizer 时的估计: 中文等非 ASCII 字元按 1.5 token, ASCII 按 4 个字元 1 token (宁可高估)
+ESTIMATE_TOKENS_PER_NON_ASCII = 1.5
+ESTIMATE_ASCII_CHARS_PER_TOKEN = 4
+
+_EVENT_CACHE_SIZE = 4096
+
+
+class PromptTooLong(ValueError):
+    """事件放不进模型的上下文窗口 (overflow="reject" 时, 或连 system prompt 都放不下时)"""
+
+    def __init__(self, model, tokens, budget):
+        self.model = model
+        self.tokens = tokens
+        self.budget = budget
+        super().__init__(f"事件太长: {tokens} tokens, 模型 {model} 最多只能再放 {budget} tokens")
+
+
+# ============================================
+# Tokenizer
+# ============================================
+
+_tokenizers = {}
+_tokenizers_lock = threading.Lock()
+
+
+def _load_tokenizer(repo_id):
+    """从 Hugging Face 缓存 (或下载) 读取 tokenizer.json; 读不到时返回 None"""
+    try:
+        from huggingface_hub import hf_hub_download
+        from tokenizers import Tokenizer
+    except ImportError:
+        return None
+    try:
+        path = hf_hub_download(repo_id, "tokenizer.json", token=os.getenv("HF_TOKEN"),
+                               local_files_only=not FETCH_TOKENIZERS)
+        return Tokenizer.from_file(path)
+    except Exception as e:
+        if FETCH_TOKENIZERS:
+            print(f"⚠️  无法载入 {repo_id} 的 tokenizer, 改用字数估计: {e}")
+        return None
+
+
+def get_tokenizer(model):
+    """该模型的 tokenizer (每个模型只载入一次); 没有时返回 None"""
+    repo_id = TOKENIZER_ALIASES.get(model, model)
+    with _tokenizers_lock:
+        if repo_id not in _tokenizers:
+            _tokenizers[repo_id] = _load_tokenizer(repo_id)
+        return _tokenizers[repo_id]
+
+
+def estimate_tokens(text):
+    """没有 tokenizer 时的 token 数估计"""
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    ascii_chars = len(text) - non_ascii
+    return math.ceil(non_ascii * ESTIMATE_TOKENS_PER_NON_ASCII
+                     + ascii_chars / ESTIMATE_ASCII_CHARS_PER_TOKEN)
+
+
+@lru_cache(maxsize=_EVENT_CACHE_SIZE)
+def count_tokens(text, model):
+    """text 在该模型 tokenizer 下的 token 数 (不含特殊 token)"""
+    tokenizer = get_tokenizer(model)
+    if tokenizer is None:
+        return estimate_tokens(text)
+    return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def truncate_to_tokens(text, model, limit):
+    """只保留 text 开头的 limit 个 token"""
+    if limit <= 0:
+        return ""
+    tokenizer = get_tokenizer(model)
+    if tokenizer is not None:
+        encoding = tokenizer.encode(text, add_special_tokens=False)
+        if len(encoding.ids) <= limit:
+            return text
+        return text[:encoding.offsets[limit - 1][1]]
+    used = 0.0
+    for i, ch in enumerate(text):
+        used += ESTIMATE_TOKENS_PER_NON_ASCII if ord(ch) > 127 else 1 / ESTIMATE_ASCII_CHARS_PER_TOKEN
+        if math.ceil(used) > limit:
+            return text[:i]
+    return text
+
+
+def context_window(model):
+    """模型的上下文窗口 (token)"""
+    return CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+
+
+# ============================================
+# 模板
+# ============================================
+
+class PromptTemplate:
+    """
+    预先组好的对话模板: 固定的 system 消息 + 使用者的事件
+
+    参数:
+        name: 注册表中的名称
+        system: system prompt
+        overflow: 超过上下文窗口时的处理方式 ("truncate" 或 "reject")
+    """
+
+    def __init__(self, name, system, overflow=DEFAULT_OVERFLOW):
+        self.name = name
+        self.system = system
+        self.overflow = overflow
+        # 所有请求共用同一个 system 消息 (不要修改它)
+        self.system_message = {"role": "system", "content": system}
+        self._system_tokens = {}
+        self._lock = threading.Lock()
+        self._stats = {"built": 0, "truncated": 0, "rejected": 0}
+
+    def system_tokens(self, model):
+        """system prompt 在该模型下的 token 数 (含消息格式的开销), 按模型缓存"""
+        tokens = self._system_tokens.get(model)
+        if tokens is None:
+            tokens = count_tokens(self.system, model) + MESSAGE_OVERHEAD_TOKENS
+            self._system_tokens[model] = tokens
+        return tokens
+
+    def budget(self, model, max_tokens=DEFAULT_MAX_TOKENS):
+        """事件最多还能用的 token 数"""
+        return (context_window(model) - self.system_tokens(model)
+                - MESSAGE_OVERHEAD_TOKENS - max_tokens)
+
+    def fit(self, event, model, max_tokens=DEFAULT_MAX_TOKENS):
+        """
+        确认事件放得进上下文窗口, 放不进时按 overflow 截断
+
+        返回:
+            (事件, 事件的 token 数)
+        抛出:
+            PromptTooLong: overflow="reject" 且事件太长, 或连 system prompt 都放不下
+        """
+        budget = self.budget(model, max_tokens)
+        tokens = count_tokens(event, model)
+        if tokens <= budget:
+            return event, tokens
+        if self.overflow == "reject" or budget <= 0:
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise PromptTooLong(model, tokens, max(budget, 0))
+        with self._lock:
+            self._stats["truncated"] += 1
+        event = truncate_to_tokens(event, model, budget)
+        return event, count_tokens(event, model)
+
+    def build(self, event, model=None, max_tokens=DEFAULT_MAX_TOKENS):
+        """
+        组装对话消息; 指定 model 时先检查上下文窗口
+
+        返回:
+            [system 消息, user 消息]
+        """
+        if model is not None:
+            event, _ = self.fit(event, model, max_tokens)
+        with self._lock:
+            self._stats["built"] += 1
+        return [self.system_message, {"role": "user", "content": event}]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["system_tokens"] = dict(self._system_tokens)
+        return stats
+
+
+# ============================================
+# 注册表
+# ============================================
+
+_templates = {}
+
+
+def register(template):
+    """注册模板 (同名会覆盖), 返回模板本身"""
+    _templates[template.name] = template
+    return template
+
+
+def get_template(name):
+    """按名称取得模板"""
+    try:
+        return _templates[name]
+    except KeyError:
+        raise KeyError(f"未知的 prompt 模板: {name} (可用: {', '.join(sorted(_templates))})") from None
+
+
+LUCKY_VICKY = register(PromptTemplate("lucky_vicky", LUCKY_VICKY_SYSTEM_PROMPT))
@@ -0,0 +1,165 @@
+"""
+共享令牌桶限流器 (SQLite)
+Hugging Face 免费额度与 Groq 都按 API Key 限制请求速率,
+这里为每个 (提供商, API Key) 维护一个令牌桶, 状态放在 SQLite 里:
+- 同一台机器上的所有线程、Streamlit session、Gradio worker 进程共用同一个桶
+- 令牌不足时先预约 (令牌数可以暂时为负), 再等待到轮到自己, 先来先服务
+- 需要等待太久才抛出 RateLimitExceeded, 而不是直接被提供商回 429
+
+Hugging Face 与 Groq 的额度都是按帐号 (API Key) 计算, 不是按模型, 所以桶按 (提供商, Key) 分;
+RateLimitExceeded 会立即失败 (retry_policy 不重试), fallback 链接着跳过同一个桶的模型, 改用其他提供商
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+# ============================================
+# 配置
+# ============================================
+
+DEFAULT_DB_PATH = os.getenv("LUCKY_VICKY_RATE_DB", os.path.join(".cache", "lucky_vicky_ratelimit.sqlite3"))
+DEFAULT_MAX_WAIT = 10.0  # 最多排队多少秒
+
+# 提供商 -> (每分钟请求数, 突发容量); 可用环境变量覆盖, 例如 LUCKY_VICKY_RATE_GROQ=30/5
+DEFAULT_LIMITS = {
+    "huggingface": (60, 10),
+    "groq": (30, 5),
+}
+FALLBACK_LIMIT = (60, 10)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+
+class RateLimitExceeded(RuntimeError):
+    """排队时间会超过上限; retry_after 为预计还要等待的秒数"""
+
+    def __init__(self, bucket, retry_after):
+        self.bucket = bucket
+        self.retry_after = retry_after
+        super().__init__(f"rate limit: {bucket} 需要再等待 {retry_after:.1f}s")
+
+
+def _limit_from_env(provider, default):
+    value = os.getenv(f"LUCKY_VICKY_RATE_{provider.upper()}")
+    if not value:
+        return default
+    per_minute, _, burst = value.partition("/")
+    return float(per_minute), float(burst or per_minute)
+
+
+class RateLimiter:
+    """
+    跨线程、跨进程的令牌桶
+
+    参数:
+        path: SQLite 文件路径 (同一台机器上的进程共用)
+        limits: 提供商 -> (每分钟请求数, 突发容量)
+        max_wait: 默认最多排队秒数
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, limits=None, max_wait=DEFAULT_MAX_WAIT):
+        self.path = path
+        self.limits = {name: _limit_from_env(name, limit)
+                       for name, limit in {**DEFAULT_LIMITS, **(limits or {})}.items()}
+        self.max_wait = max_wait
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {"acquired": 0, "waited": 0, "wait_seconds": 0.0, "rejected": 0, "errors": 0}
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self):
+        # 每个线程一条连接 (与 disk_cache 相同)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    def _reserve(self, provider, key, max_wait):
+        """
+        在一个写事务里补充令牌并预约一个, 返回需要等待的秒数
+
+        等待时间超过 max_wait 时不预约, 直接抛出 RateLimitExceeded
+        """
+        per_minute, burst = self.limits.get(provider, FALLBACK_LIMIT)
+        rate = per_minute / 60.0
+        bucket = f"{provider}:{key}"
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (bucket,)).fetchone()
+                tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+                wait = max(0.0, (1.0 - tokens) / rate)
+                if wait > max_wait:
+                    conn.execute("ROLLBACK")
+                    self._count("rejected")
+                    raise RateLimitExceeded(bucket, wait)
+                conn.execute("INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                             (bucket, tokens - 1.0, now))
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            # 限流器故障不能挡住生成, 直接放行
+            self._count("errors")
+            return 0.0
+        self._count("acquired")
+        if wait > 0:
+            self._count("waited")
+            self._count("wait_seconds", wait)
+        return wait
+
+    def acquire(self, provider, key="anonymous", max_wait=None):
+        """取得一个令牌 (必要时阻塞等待), 返回等待的秒数"""
+        wait = self._reserve(provider, key, self.max_wait if max_wait is None else max_wait)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, provider, key="anonymous", max_wait=None):
+        """acquire 的异步版本: 数据库操作放进线程, 等待时不阻塞事件循环"""
+        wait = await asyncio.to_thread(self._reserve, provider, key,
+                                       self.max_wait if max_wait is None else max_wait)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+_default_limiter = None
+_default_lock = threading.Lock()
+
+
+def get_rate_limiter(path=DEFAULT_DB_PATH):
+    """获取进程内共享的限流器 (首次调用时打开数据库)"""
+    global _default_limiter
+    if _default_limiter is None:
+        with _default_lock:
+            if _default_limiter is None:
+                _default_limiter = RateLimiter(path)
+    return _default_limiter
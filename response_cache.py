@@ -0,0 +1,153 @@
+"""
+进程内响应缓存 (LRU + TTL)
+同一个 (system prompt, 事件, 模型 ID, 采样参数) 在有效期内只调用一次远程模型
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from event_normalizer import normalize_event
+
+# ============================================
+# 配置
+# ============================================
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL = 3600.0  # 秒
+
+
+def make_cache_key(system_prompt, event, model, normalize=True, **params):
+    """
+    生成缓存 key
+
+    参数:
+        system_prompt: 系统提示
+        event: 使用者输入的事件
+        model: 解析后的模型 ID (不是下拉选单上的显示名称)
+        normalize: 是否先正规化事件文字 (全半形、空白、繁简、emoji 视为相同)
+        **params: 采样参数, 例如 max_tokens / temperature
+    """
+    if normalize:
+        event = normalize_event(event)
+    payload = json.dumps(
+        {"system": system_prompt, "event": event, "model": model, "params": params},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    线程安全的 LRU + TTL 缓存
+
+    参数:
+        max_entries: 最多保留的条目数, 超出时淘汰最久未使用的
+        ttl: 条目有效期 (秒)
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "bypasses": 0, "evictions": 0, "expired": 0}
+
+    def get(self, key, fresh=False):
+        """
+        读取缓存; 不存在或已过期时返回 None
+
+        fresh=True 表示使用者想要新版本, 直接视为未命中
+        """
+        with self._lock:
+            if fresh:
+                self._stats["bypasses"] += 1
+                return None
+            entry = self._data.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._data.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """写入缓存 (覆盖旧值), 超出容量时淘汰最久未使用的条目"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def stats(self):
+        """命中/未命中等统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._data)
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / total if total else 0.0
+        return stats
+
+
+class TieredCache:
+    """
+    多层缓存: 依序查询每一层, 命中较慢的层时回填到较快的层
+
+    典型用法是 内存 LRU 在前、磁盘缓存 (disk_cache.DiskCache) 在后
+    """
+
+    def __init__(self, *layers):
+        self.layers = layers
+
+    def get(self, key, fresh=False):
+        for i, layer in enumerate(self.layers):
+            value = layer.get(key, fresh=fresh)
+            if value is not None:
+                for upper in self.layers[:i]:
+                    upper.set(key, value)
+                return value
+        return None
+
+    def set(self, key, value, ttl=None):
+        for layer in self.layers:
+            layer.set(key, value, ttl)
+
+    def stats(self):
+        """整体命中率 (任一层命中即算命中) 加上每一层各自的统计"""
+        layers = [layer.stats() for layer in self.layers]
+        hits = sum(layer["hits"] for layer in layers)
+        misses = layers[-1]["misses"]
+        return {
+            "hits": hits,
+            "misses": misses,
+            "size": layers[0]["size"],
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "layers": layers,
+        }
+
+
+_default_cache = ResponseCache()
+
+
+def get_response_cache():
+    """获取进程内共享的响应缓存"""
+    return _default_cache
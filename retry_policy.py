@@ -0,0 +1,304 @@
+"""
+共享重试策略
+远程模型偶尔会回 5xx、503 (模型载入中)、429, 或是连接被重置, 这些错误通常稍后重试就会成功:
+- 先把错误分类为可重试 / 不可重试 (401、404、模型不支持等重试也没用)
+- 指数退避 + full jitter, 避免大量请求在同一时间重试
+- 服务器给了 Retry-After (或 503 的 estimated_time) 就照着等
+- 我们自己的限流器拒绝 (RateLimitExceeded) 不重试: 它的等待时间就是令牌桶算出来的排队时间,
+  原地重试只会把请求卡住, 交给 fallback 链改用其他提供商
+- 整个请求 (含所有重试与等待) 不会超过 deadline: 每次尝试只给剩下的时间
+  (async 用 asyncio.wait_for, 同步则设为客户端的 timeout), 时间用完就不再重试
+- 全局计数器记录重试次数与放弃原因
+"""
+
+import asyncio
+import contextvars
+import email.utils
+import functools
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from rate_limiter import RateLimitExceeded
+
+# ============================================
+# 配置
+# ============================================
+
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_BASE_DELAY = 0.5   # 秒
+DEFAULT_MAX_DELAY = 8.0    # 秒, 单次等待上限 (Retry-After 不受此限制)
+DEFAULT_DEADLINE = 30.0    # 秒, 整个请求的总时间上限
+
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+FATAL_STATUS = {400, 401, 403, 404, 405, 413, 422}
+
+# 取不到状态码时, 从异常类名与消息判断
+_RETRYABLE_NAMES = ("Connection", "Timeout", "ServerDisconnected", "RemoteProtocol", "ReadError")
+_RETRYABLE_MESSAGES = ("Service Unavailable", "Bad Gateway", "Gateway Timeout", "currently loading",
+                       "Connection reset", "Connection aborted", "timed out", "Too Many Requests")
+_FATAL_MESSAGES = ("not_supported", "doesn't support", "Invalid token", "Unauthorized")
+
+_stats = {"calls": 0, "retries": 0, "succeeded_after_retry": 0,
+          "gave_up_fatal": 0, "gave_up_attempts": 0, "gave_up_deadline": 0}
+_reasons = {}
+_stats_lock = threading.Lock()
+
+# 目前这次请求的截止时间 (time.monotonic()); 嵌套的重试取较早的那个
+_deadline = contextvars.ContextVar("lucky_vicky_retry_deadline", default=None)
+
+
+def _count(name, reason=None):
+    with _stats_lock:
+        _stats[name] += 1
+        if reason is not None:
+            _reasons[reason] = _reasons.get(reason, 0) + 1
+
+
+def retry_stats():
+    """全局重试计数器 (所有使用 RetryPolicy 的入口共用)"""
+    with _stats_lock:
+        stats = dict(_stats)
+        stats["reasons"] = dict(_reasons)
+    return stats
+
+
+def remaining_budget():
+    """目前这次请求距离 deadline 还剩多少秒; 不在 RetryPolicy 之内时返回 None"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+@contextmanager
+def budget_timeout(client):
+    """
+    把客户端的 timeout 暂时缩短为剩余时间, 离开时还原 (同步 SDK 的单次请求不会超过 deadline)
+
+    client 没有 timeout 属性 (例如 aisuite) 或不在重试之内时什么都不做;
+    只能用在独占的客户端上 (例如从连接池借出的)
+    """
+    budget = remaining_budget()
+    if budget is None or client is None or not hasattr(client, "timeout"):
+        yield client
+        return
+    original = client.timeout
+    client.timeout = budget if original is None else min(original, budget)
+    try:
+        yield client
+    finally:
+        client.timeout = original
+
+
+@contextmanager
+def _deadline_scope(deadline):
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+# ============================================
+# 错误分类
+# ============================================
+
+def _status_code(error):
+    for source in (error, getattr(error, "response", None)):
+        if source is None:
+            continue
+        for attr in ("status_code", "status"):
+            value = getattr(source, attr, None)
+            if isinstance(value, int):
+                return value
+    return None
+
+
+def _parse_retry_after(value):
+    """Retry-After 可以是秒数, 也可以是 HTTP 日期"""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(str(value))
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def _retry_after(error):
+    """从异常中取出服务器建议的等待秒数"""
+    explicit = getattr(error, "retry_after", None)
+    if isinstance(explicit, (int, float)):
+        return float(explicit)
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or getattr(error, "headers", None)
+    if headers:
+        seconds = _parse_retry_after(headers.get("Retry-After") or headers.get("retry-after"))
+        if seconds is not None:
+            return seconds
+    # Hugging Face 模型载入中的 503 会附上 estimated_time
+    try:
+        body = response.json() if response is not None else None
+    except Exception:
+        body = None
+    if isinstance(body, dict) and isinstance(body.get("estimated_time"), (int, float)):
+        return float(body["estimated_time"])
+    return None
+
+
+def classify(error):
+    """
+    判断错误是否值得重试
+
+    返回:
+        (是否可重试, 原因, 建议等待秒数或 None)
+    """
+    if isinstance(error, RateLimitExceeded):
+        return False, "rate_limited", error.retry_after
+    status = _status_code(error)
+    message = str(error)
+    if status in FATAL_STATUS or any(text in message for text in _FATAL_MESSAGES):
+        return False, f"http_{status}" if status else "fatal", None
+    if status in RETRYABLE_STATUS:
+        return True, f"http_{status}", _retry_after(error)
+    if getattr(error, "retry_after", None) is not None:
+        return True, type(error).__name__, _retry_after(error)
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True, type(error).__name__, None
+    names = [cls.__name__ for cls in type(error).__mro__]
+    if any(part in name for name in names for part in _RETRYABLE_NAMES):
+        return True, type(error).__name__, None
+    if any(text in message for text in _RETRYABLE_MESSAGES):
+        return True, "transient", None
+    return False, "unknown", None
+
+
+# ============================================
+# 重试策略
+# ============================================
+
+class RetryPolicy:
+    """
+    指数退避 + full jitter 的重试策略
+
+    参数:
+        max_attempts: 最多尝试次数 (含第一次)
+        base_delay / max_delay: 第 n 次重试等待 uniform(0, min(max_delay, base_delay * 2**n)) 秒
+        deadline: 整个请求的总时间上限 (秒), 剩余时间不够等待时直接放弃;
+            每次尝试也只给剩下的时间, 超时后不再重试
+    """
+
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY, deadline=DEFAULT_DEADLINE, rng=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self._rng = rng or random.Random()
+
+    def backoff(self, attempt, retry_after=None):
+        """第 attempt 次失败后要等待的秒数"""
+        if retry_after is not None:
+            return retry_after
+        return self._rng.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _next_delay(self, error, attempt, started):
+        """返回下次重试前的等待秒数; 不应再重试时返回 None (并记录原因)"""
+        retryable, reason, retry_after = classify(error)
+        if not retryable:
+            _count("gave_up_fatal", reason)
+            return None
+        if time.monotonic() - started >= self.deadline:
+            # 这次尝试把剩下的时间用完了 (通常就是被 timeout 打断的)
+            _count("gave_up_deadline", reason)
+            return None
+        if attempt + 1 >= self.max_attempts:
+            _count("gave_up_attempts", reason)
+            return None
+        delay = self.backoff(attempt, retry_after)
+        if time.monotonic() - started + delay >= self.deadline:
+            _count("gave_up_deadline", reason)
+            return None
+        _count("retries", reason)
+        return delay
+
+    def call(self, fn, *args, **kwargs):
+        """
+        执行 fn, 遇到可重试的错误时按策略重试
+
+        fn 是客户端的方法时 (例如 client.chat_completion), 每次尝试把该客户端的 timeout 设为剩余时间;
+        fn 内部用 hf_client 借出的客户端也会自动套用 (见 client_pool.hf_client)
+        """
+        _count("calls")
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                with _deadline_scope(started + self.deadline), budget_timeout(getattr(fn, "__self__", None)):
+                    result = fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._next_delay(e, attempt, started)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            if attempt:
+                _count("succeeded_after_retry")
+            return result
+
+    async def call_async(self, fn, *args, **kwargs):
+        """call 的异步版本, fn 为 async 函数; 每次尝试用 asyncio.wait_for 限制在剩余时间内"""
+        _count("calls")
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                with _deadline_scope(started + self.deadline):
+                    result = await asyncio.wait_for(fn(*args, **kwargs), remaining_budget())
+            except Exception as e:
+                delay = self._next_delay(e, attempt, started)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            if attempt:
+                _count("succeeded_after_retry")
+            return result
+
+
+DEFAULT_POLICY = RetryPolicy()
+
+
+def call_with_retry(fn, *args, **kwargs):
+    """用默认策略执行一次调用, 例如 call_with_retry(client.chat_completion, messages=..., model=...)"""
+    return DEFAULT_POLICY.call(fn, *args, **kwargs)
+
+
+def retrying(policy=None):
+    """装饰器: 同步与 async 函数都适用"""
+    policy = policy or DEFAULT_POLICY
+
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                return await policy.call_async(fn, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return policy.call(fn, *args, **kwargs)
+        return wrapper
+
+    return decorator
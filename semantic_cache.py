@@ -0,0 +1,236 @@
+"""
+语义相似度缓存
+把事件文字编码成「哈希字元 n-gram」向量 (纯 NumPy, 不需要下载模型),
+用余弦相似度找出意思相近的历史事件, 超过门槛就直接返回当时生成的贴文
+
+例如 "手機掉到水裡了" 与 "手機不小心掉進水裡" 会命中同一条缓存
+
+字元 n-gram 分不出「很好 / 不太好」「早到 / 遲到」这类只差一两个字的反义,
+所以默认不启用 (LUCKY_VICKY_SEMANTIC_CACHE=1 才启用), 并且:
+- 否定词、程度词或反义字 (遲 / 早、贏 / 輸、大 / 小 ...) 不一致的事件一律不命中
+- 门槛比调参组上最像的不同义事件对至少高 THRESHOLD_MARGIN,
+  并在另一组没有参与调参的事件对 (保留组) 上确认没有误命中, 见 bench_semantic_cache.py
+"""
+
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from event_normalizer import normalize_event
+
+# ============================================
+# 配置
+# ============================================
+
+DEFAULT_DIM = 1024                    # 向量维度 (哈希桶数)
+DEFAULT_NGRAMS = {1: 1.0, 2: 0.5}     # 字元 n-gram 长度 -> 权重
+# 余弦相似度门槛: 调参组上最像的不同义事件对 (出門忘記帶傘 / 出門忘記帶錢包) 是 0.764,
+# 门槛至少要高出 THRESHOLD_MARGIN; 保留组最像的不同义事件对是 0.682 (见 bench_semantic_cache.py)
+THRESHOLD_MARGIN = 0.08
+DEFAULT_THRESHOLD = 0.85
+DEFAULT_MAX_ENTRIES = 5000            # 5000 x 1024 x float32 ≈ 20 MB
+SEMANTIC_CACHE_ENABLED = os.getenv("LUCKY_VICKY_SEMANTIC_CACHE", "0") == "1"
+
+# 语气词与副词几乎不影响事件内容, 编码前先去掉
+_FILLER_RE = re.compile("不小心|一下|居然|竟然|[了的呢啊吧呀喔耶啦欸]")
+
+# 否定词与程度词会反转或改变事件的意思, 两边不一致时不能互相借用贴文
+# (在 normalize_event 之后比对, 繁体已折叠成简体)
+_NEGATION_RE = re.compile("没有|没|不|未|别|无")
+_INTENSIFIER_RE = re.compile("很|非常")
+
+# 反义字: 同一组里两边各出现一边的事件 (例如「遲到」与「早到」) 字面几乎一样, 意思却相反;
+# 每个字占一个标记位, 标记不同就不命中 (简体, 与 _NEGATION_RE 相同在 normalize_event 之后比对)
+# 「快」(快下班)、「丢」(弄丢 = 不见) 这类常有别的意思的字不放进来, 免得同义的说法互相挡掉
+_ANTONYMS = [("迟", "早"), ("晚", "早"), ("赢", "输"), ("好", "坏"), ("大", "小"), ("多", "少"),
+             ("高", "低"), ("冷", "热"), ("胖", "瘦"), ("买到", "卖完")]
+_ANTONYM_WORDS = list(dict.fromkeys(word for pair in _ANTONYMS for word in pair))
+
+# n-gram 内每个位置使用不同的乘数, 再加上 n 区分长度, 避免 "水" 与 "水裡" 固定落在同一个桶
+_PRIMES = np.array([1000003, 998244353, 1000000007, 19260817], dtype=np.uint64)
+
+
+def _core_text(text):
+    """normalize_event (全半形、繁简、emoji) 之后再去掉空白与语气词"""
+    return _FILLER_RE.sub("", normalize_event(text).replace(" ", ""))
+
+
+def polarity(text):
+    """
+    事件的否定 / 程度 / 反义字标记 (位元组合): 1 否定, 2 程度词, 之后每个反义字各一位
+
+    只有标记相同的事件才能互相命中:
+    "考試考得不太好" 与 "考試沒考好" 都是否定 + 「好」(可以互相命中), "考試考得很好" 则不同;
+    "今天遲到了" 与 "今天早到了" 的反义字不同, 也不会命中
+    """
+    core = _core_text(text)
+    mark = bool(_NEGATION_RE.search(core)) + 2 * bool(_INTENSIFIER_RE.search(core))
+    for bit, word in enumerate(_ANTONYM_WORDS, start=2):
+        if word in core:
+            mark |= 1 << bit
+    return mark
+
+
+def embed_event(text, dim=DEFAULT_DIM, ngrams=DEFAULT_NGRAMS):
+    """
+    把事件编码成 L2 正规化的 float32 向量
+
+    先做 normalize_event 并去掉语气词, 再对字元 n-gram 做向量化哈希
+    """
+    text = _core_text(text)
+    vector = np.zeros(dim, dtype=np.float32)
+    if not text:
+        return vector
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    for n, weight in ngrams.items():
+        if len(codes) < n:
+            continue
+        # 多项式组合 n 个连续字元的码位, 一次算出整段文字所有 n-gram 的哈希
+        hashes = np.zeros(len(codes) - n + 1, dtype=np.uint64)
+        for j in range(n):
+            hashes = hashes * _PRIMES[j] + codes[j:len(codes) - n + 1 + j] + np.uint64(n)
+        buckets = (hashes % np.uint64(dim)).astype(np.int64)
+        vector += np.bincount(buckets, minlength=dim).astype(np.float32) * weight
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+class SemanticCache:
+    """
+    固定容量的向量索引 + LRU 淘汰
+
+    参数:
+        threshold: 余弦相似度门槛, 达到才算命中
+        max_entries: 最多保留的条目数 (内存上限 = max_entries * dim * 4 bytes)
+        dim: 向量维度
+        ttl: 条目有效期 (秒), None 表示不过期
+        enabled: False 时 get 一律返回 None, set 不做任何事
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, max_entries=DEFAULT_MAX_ENTRIES,
+                 dim=DEFAULT_DIM, ttl=None, enabled=True):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.dim = dim
+        self.ttl = ttl
+        self.enabled = enabled
+
+        self._vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self._namespaces = np.full(max_entries, -1, dtype=np.int64)  # -1 表示空位
+        self._polarity = np.zeros(max_entries, dtype=np.int64)
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._created = np.zeros(max_entries, dtype=np.float64)
+        self._events = [None] * max_entries
+        self._values = [None] * max_entries
+        self._keys = [None] * max_entries
+        self._slots = {}   # (namespace, 正规化事件) -> 位置, 同一事件只占一个位置
+        self._namespace_ids = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "bypasses": 0, "evictions": 0}
+
+    def _namespace_id(self, namespace):
+        # 不同模型 / 采样参数的贴文不能互相借用, 用 namespace 隔开
+        return self._namespace_ids.setdefault(namespace, len(self._namespace_ids))
+
+    def search(self, event, namespace, k=5):
+        """返回同一 namespace 中最相似的 k 条 [(相似度, 事件, 贴文)], 不影响统计"""
+        query = embed_event(event, self.dim)
+        with self._lock:
+            return [(score, self._events[i], self._values[i])
+                    for score, i in self._top_k(query, polarity(event), namespace, k)]
+
+    def _top_k(self, query, mark, namespace, k):
+        ns = self._namespace_ids.get(namespace)
+        if ns is None:
+            return []
+        mask = (self._namespaces == ns) & (self._polarity == mark)
+        if self.ttl is not None:
+            mask &= self._created > time.monotonic() - self.ttl
+        if not mask.any():
+            return []
+        scores = self._vectors @ query
+        scores[~mask] = -1.0
+        k = min(k, int(mask.sum()))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), int(i)) for i in top]
+
+    def get(self, event, namespace, fresh=False):
+        """最相似的历史事件超过门槛时返回其贴文, 否则返回 None"""
+        if not self.enabled:
+            return None
+        if fresh:
+            with self._lock:
+                self._stats["bypasses"] += 1
+            return None
+        query = embed_event(event, self.dim)
+        with self._lock:
+            best = self._top_k(query, polarity(event), namespace, 1)
+            if best and best[0][0] >= self.threshold:
+                index = best[0][1]
+                self._last_used[index] = time.monotonic()
+                self._stats["hits"] += 1
+                return self._values[index]
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, event, namespace, value):
+        """加入一条记录 (同一事件已存在时覆盖); 已满时淘汰最久未使用的一条"""
+        if not self.enabled:
+            return
+        vector = embed_event(event, self.dim)
+        mark = polarity(event)
+        now = time.monotonic()
+        with self._lock:
+            key = (namespace, normalize_event(event))
+            index = self._slots.get(key)
+            if index is None:
+                empty = np.flatnonzero(self._namespaces < 0)
+                if len(empty):
+                    index = int(empty[0])
+                else:
+                    index = int(np.argmin(self._last_used))
+                    del self._slots[self._keys[index]]
+                    self._stats["evictions"] += 1
+                self._slots[key] = index
+                self._keys[index] = key
+            self._vectors[index] = vector
+            self._polarity[index] = mark
+            self._namespaces[index] = self._namespace_id(namespace)
+            self._last_used[index] = now
+            self._created[index] = now
+            self._events[index] = event
+            self._values[index] = value
+
+    def __len__(self):
+        with self._lock:
+            return int((self._namespaces >= 0).sum())
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = int((self._namespaces >= 0).sum())
+        stats["enabled"] = self.enabled
+        stats["memory_bytes"] = self._vectors.nbytes
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / total if total else 0.0
+        return stats
+
+
+_default_semantic_cache = None
+_default_lock = threading.Lock()
+
+
+def get_semantic_cache():
+    """获取进程内共享的语义缓存 (首次调用时分配向量矩阵)"""
+    global _default_semantic_cache
+    if _default_semantic_cache is None:
+        with _default_lock:
+            if _default_semantic_cache is None:
+                _default_semantic_cache = SemanticCache(enabled=SEMANTIC_CACHE_ENABLED)
+    return _default_semantic_cache
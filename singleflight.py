@@ -0,0 +1,94 @@
+"""
+请求合并 (single-flight)
+热门范例常常在同一瞬间被多个 session 以相同的 (事件, 模型) 请求,
+第一个调用者负责真正调用远程模型, 其余相同 key 的调用者等待同一个结果
+
+- do(): 线程版本 (Gradio 同步处理函数、Streamlit 各个 session 线程)
+- do_async(): 协程版本; 内部同样使用 concurrent.futures.Future,
+  因此线程与协程、不同事件循环之间也能共用同一次请求
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    以 key 合并进行中的相同请求
+
+    领头的调用者执行函数, 结果 (或异常) 会原样交给所有等待者;
+    请求结束后 key 立即移除, 之后的调用会重新执行 (长期保存交给缓存)
+    """
+
+    def __init__(self):
+        self._calls = {}  # key -> Future
+        self._lock = threading.Lock()
+        self._stats = {"leaders": 0, "shared": 0}
+
+    def _join(self, key):
+        """返回 (future, 是否为领头者)"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self._stats["shared"] += 1
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            self._stats["leaders"] += 1
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn, *args, **kwargs):
+        """执行 fn(*args, **kwargs); 若相同 key 已在进行中则等待它的结果"""
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def do_async(self, key, fn, *args, **kwargs):
+        """协程版本: fn 为 async 函数"""
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await fn(*args, **kwargs)
+        except asyncio.CancelledError:
+            # 领头者被取消 (例如使用者关掉页面) 不应该让等待者也收到 CancelledError
+            self._finish(key, future, error=RuntimeError("合并的请求已被取消, 请重试"))
+            raise
+        except Exception as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    def stats(self):
+        """leaders: 实际发出的请求数; shared: 被合并而省下的请求数"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        total = stats["leaders"] + stats["shared"]
+        stats["shared_rate"] = stats["shared"] / total if total else 0.0
+        return stats
+
+
+_default_singleflight = SingleFlight()
+
+
+def get_singleflight():
+    """获取进程内共享的请求合并器"""
+    return _default_singleflight
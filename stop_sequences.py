@@ -0,0 +1,265 @@
+"""
+结尾语停止 (stop sequence)
+prompt 要求贴文以「完全是 Lucky Vicky 呀!」结尾, 但模型常常写完结尾语还继续讲,
+白白花掉 max_tokens=500 的额度与时间:
+- 提供商支持 stop 参数时直接带上 (半形 ! 与全形 ！ 两种写法)
+- 不支持时把 max_tokens 按事件长度调小, 流式输出在客户端读到结尾语就截断并关闭连接
+- 提供商按 OpenAI 惯例不回传 stop 字串本身时, 按 finish_reason 判断是停在 stop 字串上, 把结尾语补回去
+- 统计每个请求省下的 token 数与时间的上限 (假设没有 stop 时会一直写到 max_tokens, 实际通常更少);
+  只更新计数器, 不输出日志
+"""
+
+import os
+import re
+import threading
+import time
+
+# ============================================
+# 配置
+# ============================================
+
+SIGN_OFF = "完全是 Lucky Vicky 呀!"
+DEFAULT_MAX_TOKENS = 500  # 调用时没有指定 max_tokens 时, 计算节省的基准
+
+# 大部分提供商最多接受 4 个 stop 字串; 从 "Lucky Vicky" 开始比对, 「完全是」前后的变化都能覆盖
+STOP_SEQUENCES = ["Lucky Vicky 呀!", "Lucky Vicky 呀！", "Lucky Vicky呀!", "Lucky Vicky呀！"]
+
+# 不支持 stop 参数的模型 (逗号分隔), 例如 LUCKY_VICKY_NO_STOP_MODELS=some/model,other/model
+NO_STOP_MODELS = {name.strip() for name in os.getenv("LUCKY_VICKY_NO_STOP_MODELS", "").split(",") if name.strip()}
+
+# 不支持 stop 时的 max_tokens: 基础额度 + 事件每个字的额度, 不超过原本的 max_tokens
+ADAPTIVE_BASE_TOKENS = 280
+ADAPTIVE_TOKENS_PER_CHAR = 6
+
+_SIGN_OFF_RE = re.compile(r"Lucky\s*Vicky\s*呀\s*[!！]+")
+_SIGN_OFF_LEAD = "完全是"
+
+_stats = {"requests": 0, "stopped": 0, "client_cut": 0, "restored": 0,
+          "tokens": 0, "tokens_saved_upper_bound": 0, "seconds_saved_upper_bound": 0.0}
+_stats_lock = threading.Lock()
+
+
+def stop_stats():
+    """全局统计: 在结尾语停止的请求数, 与省下的 token / 秒数的上限"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+# ============================================
+# 文字处理
+# ============================================
+
+def cut_after_sign_off(text):
+    """
+    只保留到第一个结尾语为止
+
+    返回:
+        (截断后的文字, 是否找到结尾语)
+    """
+    match = _SIGN_OFF_RE.search(text)
+    if match is None:
+        return text, False
+    return text[:match.end()], True
+
+
+def stopped_by_sequence(finish_reason, matched=None):
+    """
+    提供商是否停在我们的 stop 字串上 (而不是模型自己结束)
+
+    参数:
+        finish_reason: 响应的 finish_reason; OpenAI 惯例下 stop 字串与 eos 都回报 "stop",
+            部分提供商 (TGI) 回报 "stop_sequence"
+        matched: 提供商回报的停止条件 (vLLM 的 stop_reason / SGLang 的 matched_stop),
+            字串表示 stop 字串、整数表示 eos token; 没有提供时为 None
+    """
+    if finish_reason == "stop_sequence":
+        return True
+    if finish_reason != "stop":
+        return False
+    # 无法区分时视为 stop 字串: prompt 要求以结尾语收尾, 没写出结尾语就结束的多半是被 stop 吃掉了
+    return matched is None or isinstance(matched, str)
+
+
+def _stop_details(choice):
+    """从响应的 choice 取出 (finish_reason, 命中的停止条件)"""
+    matched = getattr(choice, "stop_reason", None)
+    if matched is None:
+        matched = getattr(choice, "matched_stop", None)
+    return getattr(choice, "finish_reason", None), matched
+
+
+def _sign_off_tail(text):
+    """补在 text 后面的结尾语; 文字以空白结尾时不再多加空白"""
+    tail = SIGN_OFF[len(_SIGN_OFF_LEAD):]
+    return tail.lstrip() if text != text.rstrip() else tail
+
+
+def restore_sign_off(text, stopped=False):
+    """
+    提供商在 stop 字串处停止但没有回传它时, 把结尾语补回去
+
+    参数:
+        stopped: 提供商停在 stop 字串上 (见 stopped_by_sequence); 此时不论前面写的是不是「完全是」都补上
+            stop 字串吃掉的部分; 不知道时只在文字停在「完全是」时补上
+
+    返回:
+        (文字, 是否补上)
+    """
+    if not text.strip() or _SIGN_OFF_RE.search(text):
+        return text, False
+    if stopped or text.rstrip().endswith(_SIGN_OFF_LEAD):
+        return text + _sign_off_tail(text), True
+    return text, False
+
+
+def supports_stop(model):
+    """该模型 (提供商) 是否接受 stop 参数"""
+    return model not in NO_STOP_MODELS
+
+
+def adaptive_max_tokens(event, max_tokens):
+    """不支持 stop 时按事件长度决定 max_tokens (事件越长, 贴文通常越长)"""
+    budget = ADAPTIVE_BASE_TOKENS + ADAPTIVE_TOKENS_PER_CHAR * len(event.strip())
+    return min(max_tokens, budget)
+
+
+def stop_params(event, model, params):
+    """在采样参数上加上 stop; 不支持时改为按事件长度调整 max_tokens"""
+    if supports_stop(model):
+        return {**params, "stop": STOP_SEQUENCES}
+    return {**params, "max_tokens": adaptive_max_tokens(event, params.get("max_tokens", DEFAULT_MAX_TOKENS))}
+
+
+# ============================================
+# 统计
+# ============================================
+
+def _record(tokens, max_tokens, elapsed, stopped, cut, restored):
+    """记录一次请求; 返回省下的 (token 数, 秒数) 的上限"""
+    saved_tokens = max(0, max_tokens - tokens) if stopped else 0
+    saved_seconds = saved_tokens * elapsed / tokens if stopped and tokens and elapsed else 0.0
+    with _stats_lock:
+        _stats["requests"] += 1
+        _stats["tokens"] += tokens
+        _stats["stopped"] += stopped
+        _stats["client_cut"] += cut
+        _stats["restored"] += restored
+        _stats["tokens_saved_upper_bound"] += saved_tokens
+        _stats["seconds_saved_upper_bound"] += saved_seconds
+    return saved_tokens, saved_seconds
+
+
+def finish_response(response, max_tokens=DEFAULT_MAX_TOKENS, elapsed=None, model=None):
+    """
+    非流式响应的后处理: 截掉结尾语之后的内容、补回被 stop 吃掉的结尾语, 并记录节省
+
+    参数:
+        response: chat_completion 的响应 (choices[0].message.content, 可选的 usage 与 finish_reason)
+        max_tokens: 没有 stop 时会用到的 max_tokens (计算节省的基准)
+        elapsed: 请求耗时 (秒), 用来估计省下的时间
+        model: 请求使用的模型; 该模型不支持 stop 时 (没有带 stop 参数), finish_reason="stop" 只代表 eos
+    """
+    choice = response.choices[0]
+    content = choice.message.content or ""
+    usage = getattr(response, "usage", None)
+    tokens = getattr(usage, "completion_tokens", None) or len(content)  # 没有 usage 时粗估: 中文约一字一 token
+    text, found = cut_after_sign_off(content)
+    cut = found and text != content.rstrip()
+    restored = False
+    if not found:
+        stopped = (model is None or supports_stop(model)) and stopped_by_sequence(*_stop_details(choice))
+        text, restored = restore_sign_off(text, stopped)
+    _record(tokens, max_tokens, elapsed, found or restored, cut, restored)
+    return text
+
+
+class SignOffCutter:
+    """
+    流式输出的客户端截断: 读到结尾语就停止 (done=True), 之后的文字丢弃
+
+    每个 chunk 大约是一个 token, 用来估计生成了多少 token;
+    上游流结束时把 finish_reason (与提供商回报的停止条件) 写进 meta, finish 用来判断要不要补回结尾语
+    (见 async_engine.chat_completion_stream_async 的 meta 参数)
+
+    参数:
+        max_tokens: 计算节省上限的基准
+        stop: 这次请求有没有带 stop 参数 (stop_params 对不支持的模型不会带)
+    """
+
+    def __init__(self, max_tokens=DEFAULT_MAX_TOKENS, stop=True):
+        self.max_tokens = max_tokens
+        self.stop = stop
+        self.meta = {}
+        self.done = False
+        self.chunks = 0
+        self.saved_tokens_upper_bound = 0
+        self.saved_seconds_upper_bound = 0.0
+        self._text = ""
+        self._started = None
+        self._finished = False
+
+    def feed(self, text):
+        """返回这块可以输出的文字 (读到结尾语时只到结尾语为止)"""
+        if self.done or not text:
+            return ""
+        if self._started is None:
+            self._started = time.perf_counter()
+        self.chunks += 1
+        emitted = len(self._text)
+        self._text, found = cut_after_sign_off(self._text + text)
+        if found:
+            self.done = True
+        return self._text[emitted:]
+
+    def finish(self):
+        """流结束后调用; 返回需要补在最后的文字 (被 stop 吃掉的结尾语)"""
+        if self._finished:
+            return ""
+        self._finished = True
+        tail = ""
+        restored = False
+        if not self.done:
+            stopped = self.stop and stopped_by_sequence(self.meta.get("finish_reason"), self.meta.get("matched"))
+            text, restored = restore_sign_off(self._text, stopped)
+            tail = text[len(self._text):]
+        elapsed = time.perf_counter() - self._started if self._started is not None else None
+        self.saved_tokens_upper_bound, self.saved_seconds_upper_bound = _record(
+            self.chunks, self.max_tokens, elapsed, self.done or restored, self.done, restored
+        )
+        return tail
+
+
+def cut_stream(stream, cutter):
+    """包装同步的文字流: 读到结尾语就关闭上游 (停止生成), 结束时补上被吃掉的结尾语"""
+    try:
+        for text in stream:
+            piece = cutter.feed(text)
+            if piece:
+                yield piece
+            if cutter.done:
+                break
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+    tail = cutter.finish()
+    if tail:
+        yield tail
+
+
+async def cut_stream_async(stream, cutter):
+    """cut_stream 的异步版本"""
+    try:
+        async for text in stream:
+            piece = cutter.feed(text)
+            if piece:
+                yield piece
+            if cutter.done:
+                break
+    finally:
+        aclose = getattr(stream, "aclose", None)
+        if aclose is not None:
+            await aclose()
+    tail = cutter.finish()
+    if tail:
+        yield tail
@@ -0,0 +1,170 @@
+"""
+流式响应工具
+统一消费 chat_completion(stream=True) 的 chunk:
+- 文本块先放进列表, 最后只拼接一次, 不会反复复制字符串
+- 容忍 delta.content 为 None 的 role / finish chunk
+- 记录首字延迟 (TTFT)、字块间隔与每秒 token 数
+"""
+
+import threading
+import time
+from collections import deque
+
+# 最近的流式统计, 供运维查看整体表现
+_recent_streams = deque(maxlen=500)
+_recent_lock = threading.Lock()
+
+
+def chunk_text(chunk):
+    """取出单个 chunk 的文本增量; 没有内容时返回空字符串"""
+    choices = chunk.get("choices") if isinstance(chunk, dict) else getattr(chunk, "choices", None)
+    if not choices:
+        return ""
+    choice = choices[0]
+    delta = choice.get("delta") if isinstance(choice, dict) else getattr(choice, "delta", None)
+    if delta is None:
+        return ""
+    content = delta.get("content") if isinstance(delta, dict) else getattr(delta, "content", None)
+    return content or ""
+
+
+class StreamStats:
+    """单次流式响应的延迟统计 (以收到的文本块数近似 token 数)"""
+
+    def __init__(self, label=None):
+        self.label = label
+        self.start = time.perf_counter()
+        self.first_token_at = None
+        self.last_token_at = None
+        self.token_count = 0
+        self.gaps = []
+
+    def mark_token(self, now=None):
+        now = time.perf_counter() if now is None else now
+        if self.first_token_at is None:
+            self.first_token_at = now
+        else:
+            self.gaps.append(now - self.last_token_at)
+        self.last_token_at = now
+        self.token_count += 1
+
+    @property
+    def ttft(self):
+        """首字延迟 (秒), 尚未收到内容时为 None"""
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.start
+
+    @property
+    def tokens_per_second(self):
+        """首字之后的生成速度"""
+        if self.token_count < 2:
+            return 0.0
+        elapsed = self.last_token_at - self.first_token_at
+        return (self.token_count - 1) / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def mean_gap(self):
+        return sum(self.gaps) / len(self.gaps) if self.gaps else 0.0
+
+    @property
+    def max_gap(self):
+        return max(self.gaps) if self.gaps else 0.0
+
+    def as_dict(self):
+        return {
+            "label": self.label,
+            "ttft": self.ttft,
+            "tokens": self.token_count,
+            "tokens_per_second": self.tokens_per_second,
+            "mean_gap": self.mean_gap,
+            "max_gap": self.max_gap,
+            "total": (self.last_token_at or time.perf_counter()) - self.start,
+        }
+
+    def summary(self):
+        """一行文字摘要, 方便直接 print"""
+        if self.ttft is None:
+            return "⚠️ 没有收到任何内容"
+        return (f"⚡ TTFT {self.ttft:.2f}s | {self.token_count} tokens | "
+                f"{self.tokens_per_second:.1f} tok/s | 最大间隔 {self.max_gap:.2f}s")
+
+
+class StreamAssembler:
+    """
+    流式响应组装器
+
+    用法:
+        assembler = StreamAssembler(label=model)
+        for text in assembler.iter_text(client.chat_completion(..., stream=True)):
+            print(text, end="", flush=True)
+        full_response = assembler.text
+        print(assembler.stats.summary())
+    """
+
+    def __init__(self, label=None):
+        self.stats = StreamStats(label)
+        self._parts = []
+        self._text = ""
+        self._dirty = False
+        self._finished = False
+
+    def feed(self, text):
+        """加入一段文本增量; 空内容会被忽略, 返回是否真的加入"""
+        if not text:
+            return False
+        self.stats.mark_token()
+        self._parts.append(text)
+        self._dirty = True
+        return True
+
+    def iter_text(self, stream):
+        """同步迭代 chunk 流, 逐块 yield 非空文本"""
+        try:
+            for chunk in stream:
+                text = chunk_text(chunk)
+                if self.feed(text):
+                    yield text
+        finally:
+            self.finish()
+
+    async def aiter_text(self, stream):
+        """异步迭代 chunk 流, 逐块 yield 非空文本"""
+        try:
+            async for chunk in stream:
+                text = chunk_text(chunk)
+                if self.feed(text):
+                    yield text
+        finally:
+            self.finish()
+
+    def finish(self):
+        """结束这次流式响应并登记统计 (重复调用无副作用)"""
+        if self._finished:
+            return
+        self._finished = True
+        with _recent_lock:
+            _recent_streams.append(self.stats.as_dict())
+
+    @property
+    def text(self):
+        """目前为止的完整文本 (只有内容变化时才重新拼接)"""
+        if self._dirty:
+            self._text = "".join(self._parts)
+            self._parts = [self._text]
+            self._dirty = False
+        return self._text
+
+
+def stream_telemetry():
+    """最近流式响应的汇总: 数量、TTFT 中位数、平均 tok/s"""
+    with _recent_lock:
+        records = list(_recent_streams)
+    ttfts = sorted(r["ttft"] for r in records if r["ttft"] is not None)
+    speeds = [r["tokens_per_second"] for r in records if r["tokens_per_second"]]
+    return {
+        "streams": len(records),
+        "ttft_p50": ttfts[len(ttfts) // 2] if ttfts else None,
+        "ttft_max": ttfts[-1] if ttfts else None,
+        "tokens_per_second": sum(speeds) / len(speeds) if speeds else 0.0,
+    }
@@ -4,8 +4,26 @@
 """
 
 import streamlit as st
-from huggingface_hub import InferenceClient
+import asyncio
 import os
+import time
+
+from admission import NORMAL, Overloaded, get_admission_controller
+from async_engine import acquire_hf_quota, chat_completion_async, chat_completion_stream_async, iterate_sync, run_sync
+from client_pool import aisuite_client, pool_stats
+from disk_cache import get_disk_cache
+from fallback import AllFallbacksFailed, FallbackChain
+from model_router import ModelRouter
+from rate_limiter import get_rate_limiter
+from prewarm import Prewarmer
+from prompt_templates import GENERATION_PARAMS, LUCKY_VICKY
+from response_cache import TieredCache, get_response_cache, make_cache_key
+from retry_policy import retry_stats, retrying
+from semantic_cache import get_semantic_cache
+from singleflight import get_singleflight
+from stop_sequences import SignOffCutter, cut_stream_async, finish_response, stop_params, stop_stats, supports_stop
+from stream_utils import StreamAssembler, stream_telemetry
+from variant_pool import RefillPaused, VariantPool
 
 # ============================================
 # 頁面配置
@@ -69,8 +87,8 @@ st.markdown("""
 # ============================================
 
 @st.cache_resource
-def get_hf_client():
-    """獲取 Hugging Face 客戶端"""
+def get_hf_token():
+    """獲取 Hugging Face Token (客戶端由共享連接池提供)"""
     hf_token = None
     
     # 1. 優先從 Streamlit secrets 讀取
@@ -94,68 +112,365 @@ def get_hf_client():
         except FileNotFoundError:
             pass
     
-    if hf_token:
-        try:
-            return InferenceClient(token=hf_token), True
-        except Exception as e:
-            return None, False
-    else:
-        return None, False
+    return hf_token
 
 # ============================================
 # Lucky Vicky 生成函數
 # ============================================
 
-def generate_lucky_vicky(event, model_choice):
-    """生成員瑛式思考貼文"""
+# system prompt 只在 prompt_templates.py 定義一次 (也用於快取 key)
+SYSTEM_PROMPT = LUCKY_VICKY.system
+
+# 模型映射
+MODEL_MAP = {
+    "Meta Llama 3.2-3B (推薦)": "meta-llama/Llama-3.2-3B-Instruct",
+    "Meta Llama 3.2-1B": "meta-llama/Llama-3.2-1B-Instruct",
+    "Microsoft Phi-3": "microsoft/Phi-3-mini-4k-instruct"
+}
+
+DEFAULT_MODEL = "meta-llama/Llama-3.2-3B-Instruct"
+
+# 自動路由: 依各模型的延遲與錯誤率 EWMA 選擇目前最快的模型
+AUTO_CHOICE = "⚡ Auto (最快)"
+
+# fallback 鏈: 首選模型失敗時依序改用下一個 (設置了 GROQ_API_KEY 時, 最後一站是 Groq)
+GROQ_FALLBACK_MODEL = "groq:llama-3.3-70b-versatile"
+FALLBACK_CHAIN = list(MODEL_MAP.values()) + ([GROQ_FALLBACK_MODEL] if os.getenv("GROQ_API_KEY") else [])
+
+# 側邊欄範例事件 (啟動時會在背景預熱)
+EXAMPLES = [
+    "今天咖啡灑到電腦上了!",
+    "出門忘記帶傘,結果下大雨",
+    "考試考得不太好",
+    "今天遲到了10分鐘",
+    "手機掉到水裡了"
+]
+
+# 取樣參數 GENERATION_PARAMS 與其他入口共用 (見 prompt_templates.py);
+# 呼叫時另外帶上結尾語 stop, 見 stop_sequences.py
+
+
+@st.cache_resource
+def get_cache():
+    """所有 session 共用的回應快取: 記憶體 LRU + SQLite 磁碟快取 (重啟後仍保留)"""
+    return TieredCache(get_response_cache(), get_disk_cache())
+
+
+@st.cache_resource
+def get_router():
+    """所有 session 共用的模型路由器 (延遲與錯誤率統計跨 session 累積)"""
+    return ModelRouter(MODEL_MAP)
+
+
+@st.cache_resource
+def get_fallback_chain():
+    """所有 session 共用的 fallback 鏈與熔斷器 (壞掉的模型在冷卻期內只會花掉一次失敗的請求)"""
+    return FallbackChain(FALLBACK_CHAIN)
+
+
+def resolve_model(model_choice):
+    """選單選項 -> 模型 ID; Auto 時交給路由器決定"""
+    if model_choice == AUTO_CHOICE:
+        return get_router().choose()
+    return MODEL_MAP.get(model_choice, DEFAULT_MODEL)
+
+
+def build_messages(event, model, params=GENERATION_PARAMS):
+    """組裝對話訊息 (事件超過該模型的上下文視窗時截斷)"""
+    return LUCKY_VICKY.build(event, model, params["max_tokens"])
+
+
+def cache_key(event, model, params=GENERATION_PARAMS):
+    """同一事件 + 模型 + 取樣參數 共用一個快取條目 (降級縮短的貼文不會蓋掉完整版本)"""
+    return make_cache_key(SYSTEM_PROMPT, event, model, **params)
+
+
+def lookup_cache(event, model, fresh=False):
+    """先查精確快取, 再查語意相似快取; fresh=True 時兩者都略過"""
+    cached = get_cache().get(cache_key(event, model), fresh=fresh)
+    if cached is None:
+        cached = get_semantic_cache().get(event, cache_key("", model), fresh=fresh)
+    return cached
+
+
+def store_cache(event, model, result, params=GENERATION_PARAMS):
+    """生成成功後寫入精確快取與語意快取"""
+    get_cache().set(cache_key(event, model, params), result)
+    get_semantic_cache().set(event, cache_key("", model, params), result)
+
+
+def format_error(error, model_choice):
+    """把例外轉換成給使用者看的提示"""
+    error_msg = str(error)
+    
+    if "not_supported" in error_msg or "doesn't support" in error_msg:
+        return f"❌ 模型 '{model_choice}' 在免費帳戶中不可用\n\n💡 建議:\n1. 嘗試其他模型\n2. 升級 Hugging Face 帳戶"
+    elif "401" in error_msg or "Invalid token" in error_msg:
+        return "❌ Token 無效或已過期\n\n請檢查:\n1. Token 是否正確\n2. Token 是否有 'Read' 權限\n3. 在 https://huggingface.co/settings/tokens 重新生成"
+    else:
+        return f"❌ 錯誤: {error_msg}\n\n💡 可能的原因:\n1. 網路連接問題\n2. API 速率限制\n3. 模型暫時不可用"
+
+
+def busy_message(error):
+    """超過準入門檻時立即回給使用者的「忙碌中」提示"""
+    return f"🚦 目前使用人數過多 (排隊中 {error.backlog} 個請求)\n\n請約 {error.retry_after:.0f} 秒後再試一次 🙏"
+
+
+BROWNOUT_NOTES = {
+    "downgrade": "🟡 目前使用人數較多, 已暫時改用 Llama 3.2-1B 生成",
+    "shorten": "🟠 目前使用人數很多, 已暫時改用 Llama 3.2-1B 並縮短貼文長度",
+}
+
+
+@retrying()
+async def generate_post_async(event, model, params=GENERATION_PARAMS):
+    """直接呼叫模型生成貼文 (不經過快取; 暫時性錯誤自動重試, 仍失敗時拋出例外)"""
+    started = time.perf_counter()
+    # 事件太長 (PromptTooLong) 不是模型的問題, 在計時之前檢查
+    messages = build_messages(event, model, params)
+    # 先在令牌桶排隊取得額度, 再開始計時 (限流等待不算進模型延遲)
+    await acquire_hf_quota(hf_token)
+    with get_router().track(model):
+        response = await chat_completion_async(
+            messages,
+            model,
+            token=hf_token,
+            rate_limit=False,
+            **stop_params(event, model, params)
+        )
+    return finish_response(response, params["max_tokens"], time.perf_counter() - started, model)
+
+
+@retrying()
+def generate_post_groq(event, model=GROQ_FALLBACK_MODEL, params=GENERATION_PARAMS):
+    """透過 aisuite 呼叫 Groq (fallback 鏈的最後一站)"""
+    started = time.perf_counter()
+    with aisuite_client("groq") as client:
+        response = client.chat.completions.create(
+            model=model,
+            messages=build_messages(event, model, params),
+            **stop_params(event, model, params)
+        )
+    return finish_response(response, params["max_tokens"], time.perf_counter() - started, model)
+
+
+async def call_model_async(event, model, params=GENERATION_PARAMS):
+    """依模型 ID 選擇 Hugging Face 或 Groq (Groq 的 SDK 是同步的, 放進執行緒執行)"""
+    if model.startswith("groq:"):
+        return await asyncio.to_thread(generate_post_groq, event, model, params)
+    return await generate_post_async(event, model, params)
+
+
+async def generate_and_store_async(event, model, fresh=False, params=GENERATION_PARAMS):
+    """
+    呼叫模型並寫入快取; 非 fresh 時, 所有 session 相同 (事件, 模型) 的並行請求合併成一次
+    
+    首選模型失敗時沿 fallback 鏈改用下一個, 結果記在實際生成它的模型名下
+    """
+    async def call():
+        result, used = await get_fallback_chain().run_async(
+            lambda candidate: call_model_async(event, candidate, params), start=model
+        )
+        await asyncio.to_thread(store_cache, event, used, result, params)
+        return result
+    
+    if fresh:
+        return await call()
+    return await get_singleflight().do_async(cache_key(event, model, params), call)
+
+
+async def generate_variant_async(event, model):
+    """
+    變體池補充: 與使用者請求共用準入控制與熔斷器, 不換模型 (池子是按模型分的)
+
+    只在沒有降級時補充; 準入後才變成降級的話也放棄, 額度先留給使用者
+    """
+    controller = get_admission_controller()
+    if controller.current_level() != NORMAL:
+        raise RefillPaused()
+    try:
+        permit = controller.admit()
+    except Overloaded:
+        raise RefillPaused() from None
+    try:
+        if permit.level != NORMAL:
+            raise RefillPaused()
+        await permit.start()
+        result, _ = await get_fallback_chain().run_async(
+            lambda candidate: generate_post_async(event, candidate), start=model, fallback=False
+        )
+        return result
+    finally:
+        permit.release()
+
+
+@st.cache_resource
+def get_variant_pool():
+    """所有 session 共用的熱門事件變體池 (背景執行緒補充, 每篇只會被取出一次; 降級時暫停補充)"""
+    return VariantPool(
+        lambda event, model: run_sync(generate_variant_async(event, model)),
+        paused=lambda: get_admission_controller().current_level() != NORMAL
+    )
+
+
+def serve_cached(event, model, fresh=False):
+    """熱門事件優先從變體池取一篇沒出現過的版本, 否則查快取"""
+    variant = get_variant_pool().draw(event, model) if hf_token else None
+    if variant is not None:
+        return variant
+    return lookup_cache(event, model, fresh)
+
+
+async def generate_lucky_vicky_async(event, model_choice, fresh=False, status=None):
+    """
+    生成員瑛式思考貼文 (非同步版本, fresh=True 時略過快取)
+    
+    需要呼叫模型時先經過準入控制: 忙碌時降級或直接回覆「忙碌中」,
+    降級程度寫進 status["brownout"] 給介面顯示
+    """
     
     if not event or not event.strip():
         return "❌ 請輸入發生的事件!"
     
-    system_prompt = """請用台灣習慣的中文來寫這段 po 文:
-請用員瑛式思考, 也就是什麼都正向思維任何使用者寫的事情,
-用我的第一人稱、社群媒體 po 文的口吻說一次,
-說為什麼這是一件超幸運的事, 並且以「完全是 Lucky Vicky 呀!」結尾。
-可以適度的加上 emoji。"""
-    
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": event}
-    ]
-    
-    # 模型映射
-    model_map = {
-        "Meta Llama 3.2-3B (推薦)": "meta-llama/Llama-3.2-3B-Instruct",
-        "Meta Llama 3.2-1B": "meta-llama/Llama-3.2-1B-Instruct",
-        "Microsoft Phi-3": "microsoft/Phi-3-mini-4k-instruct"
-    }
+    model = resolve_model(model_choice)
+    # 快取讀寫可能碰到 SQLite 鎖, 放進執行緒執行, 不阻塞共用的事件迴圈
+    cached = await asyncio.to_thread(serve_cached, event, model, fresh)
+    if cached is not None:
+        return cached
     
-    model = model_map.get(model_choice, "meta-llama/Llama-3.2-3B-Instruct")
+    if not hf_token:
+        return "❌ 錯誤: 未配置 Hugging Face Token\n\n請在 Streamlit Cloud Secrets 中設置 HF_TOKEN"
     
     try:
-        if not client:
-            return "❌ 錯誤: 未配置 Hugging Face Token\n\n請在 Streamlit Cloud Secrets 中設置 HF_TOKEN"
-        
-        with st.spinner('🤔 Lucky Vicky 正在思考中...'):
-            response = client.chat_completion(
-                messages=messages,
-                model=model,
-                max_tokens=500,
-                temperature=0.8
-            )
-        
-        result = response.choices[0].message.content
-        return result
+        permit = get_admission_controller().admit()
+    except Overloaded as e:
+        return busy_message(e)
+    
+    try:
+        await permit.start()
+        model, params = permit.apply(model, GENERATION_PARAMS)
+        if status is not None:
+            status["brownout"] = permit.level
+        return await generate_and_store_async(event, model, fresh, params)
         
     except Exception as e:
-        error_msg = str(e)
+        return format_error(e, model_choice)
+    finally:
+        permit.release()
+
+
+@st.cache_resource
+def start_prewarm():
+    """每個行程只預熱一次: 在背景為每個 (範例, 模型) 組合準備貼文, 不阻塞頁面載入"""
+    pairs = [(event, model) for event in EXAMPLES for model in MODEL_MAP.values()]
+    prewarmer = Prewarmer(
+        pairs,
+        lambda event, model: run_sync(generate_post_async(event, model)),
+        store_cache,
+        lookup=lookup_cache
+    )
+    return prewarmer.start()
+
+
+def generate_lucky_vicky(event, model_choice, fresh=False, status=None):
+    """生成員瑛式思考貼文 (在共享的背景事件迴圈中執行, 所有 session 共用同一個迴圈)"""
+    with st.spinner('🤔 Lucky Vicky 正在思考中...'):
+        return run_sync(generate_lucky_vicky_async(event, model_choice, fresh, status))
+
+
+async def stream_lucky_vicky_async(event, model_choice, fresh=False, status=None):
+    """
+    串流生成員瑛式思考貼文, 逐塊 yield 文字 (快取命中時一次給完整貼文, 出錯時 yield 錯誤提示)
+    
+    需要呼叫模型時先經過準入控制 (同 generate_lucky_vicky_async);
+    還沒有輸出任何文字就失敗時, 沿 fallback 鏈改用下一個模型
+    """
+    
+    if not event or not event.strip():
+        yield "❌ 請輸入發生的事件!"
+        return
+    
+    model = resolve_model(model_choice)
+    cached = await asyncio.to_thread(serve_cached, event, model, fresh)
+    if cached is not None:
+        yield cached
+        return
+    
+    if not hf_token:
+        yield "❌ 錯誤: 未配置 Hugging Face Token\n\n請在 Streamlit Cloud Secrets 中設置 HF_TOKEN"
+        return
+    
+    try:
+        permit = get_admission_controller().admit()
+    except Overloaded as e:
+        yield busy_message(e)
+        return
+    
+    try:
+        await permit.start()
+        model, params = permit.apply(model, GENERATION_PARAMS)
+        if status is not None:
+            status["brownout"] = permit.level
         
-        if "not_supported" in error_msg or "doesn't support" in error_msg:
-            return f"❌ 模型 '{model_choice}' 在免費帳戶中不可用\n\n💡 建議:\n1. 嘗試其他模型\n2. 升級 Hugging Face 帳戶"
-        elif "401" in error_msg or "Invalid token" in error_msg:
-            return "❌ Token 無效或已過期\n\n請檢查:\n1. Token 是否正確\n2. Token 是否有 'Read' 權限\n3. 在 https://huggingface.co/settings/tokens 重新生成"
-        else:
-            return f"❌ 錯誤: {error_msg}\n\n💡 可能的原因:\n1. 網路連接問題\n2. API 速率限制\n3. 模型暫時不可用"
+        chain = get_fallback_chain()
+        parts = []
+        errors = []
+        blocked = set()
+        for candidate in chain.candidates(model, blocked=blocked):
+            try:
+                if candidate.startswith("groq:"):
+                    parts.append(await call_model_async(event, candidate, params))
+                    yield parts[-1]
+                else:
+                    # 讀到結尾語就關閉連線 (提供商不支援 stop 時也不會繼續生成)
+                    await acquire_hf_quota(hf_token)
+                    # 串流結束時 finish_reason 寫進 cutter.meta, 停在 stop 字串上就補回結尾語
+                    cutter = SignOffCutter(params["max_tokens"], stop=supports_stop(candidate))
+                    stream = chat_completion_stream_async(
+                        build_messages(event, candidate, params),
+                        candidate,
+                        token=hf_token,
+                        rate_limit=False,
+                        meta=cutter.meta,
+                        **stop_params(event, candidate, params)
+                    )
+                    with get_router().track(candidate):
+                        async for chunk in cut_stream_async(stream, cutter):
+                            parts.append(chunk)
+                            yield chunk
+            except Exception as e:
+                chain.record_error(candidate, e, blocked)
+                if parts:
+                    # 已經輸出一部分了, 換模型會得到另一篇不相關的貼文, 直接報錯
+                    yield "\n\n" + format_error(e, model_choice)
+                    return
+                errors.append((candidate, e))
+                continue
+            chain.record(candidate, ok=True)
+            if parts:
+                await asyncio.to_thread(store_cache, event, candidate, "".join(parts), params)
+            return
+        yield format_error(AllFallbacksFailed(errors), model_choice)
+    finally:
+        permit.release()
+
+
+def render_stream(event, model_choice, container, fresh=False, status=None):
+    """把串流結果逐塊畫進輸出區域, 回傳完整貼文與首字延遲 (秒)"""
+    placeholder = container.empty()
+    placeholder.markdown('<div class="output-box">🤔 Lucky Vicky 正在思考中...</div>', unsafe_allow_html=True)
+    
+    assembler = StreamAssembler(label=model_choice)
+    try:
+        for chunk in iterate_sync(stream_lucky_vicky_async(event, model_choice, fresh, status)):
+            assembler.feed(chunk)
+            placeholder.markdown(f'<div class="output-box">{assembler.text}▌</div>', unsafe_allow_html=True)
+    finally:
+        assembler.finish()
+    
+    result = assembler.text
+    placeholder.markdown(f'<div class="output-box">{result}</div>', unsafe_allow_html=True)
+    return result, assembler.stats.ttft
 
 # ============================================
 # 主界面
@@ -166,9 +481,10 @@ st.markdown('<h1 class="main-title">🌈 員瑛式思考生成器</h1>', unsafe_
 st.markdown('<p class="subtitle">Lucky Vicky - 把任何事情都變成幸運的事!</p>', unsafe_allow_html=True)
 
 # Token 狀態提示 (延遲載入)
-client, token_available = get_hf_client()
-if token_available:
+hf_token = get_hf_token()
+if hf_token:
     st.success("✅ Hugging Face Token 已配置")
+    start_prewarm()
 else:
     st.error("⚠️ 未找到 Hugging Face Token - 請在 Streamlit Cloud Secrets 中設置 HF_TOKEN")
 
@@ -205,15 +521,7 @@ with st.sidebar:
     st.divider()
     
     st.markdown("### 💡 範例事件")
-    examples = [
-        "今天咖啡灑到電腦上了!",
-        "出門忘記帶傘,結果下大雨",
-        "考試考得不太好",
-        "今天遲到了10分鐘",
-        "手機掉到水裡了"
-    ]
-    
-    for example in examples:
+    for example in EXAMPLES:
         if st.button(example, key=f"example_{example}", use_container_width=True):
             st.session_state.event_input = example
 
@@ -241,11 +549,16 @@ with col1:
         options=[
             "Meta Llama 3.2-3B (推薦)",
             "Meta Llama 3.2-1B",
-            "Microsoft Phi-3"
+            "Microsoft Phi-3",
+            AUTO_CHOICE
         ],
-        label_visibility="collapsed"
+        label_visibility="collapsed",
+        help="Auto 會依照即時延遲與錯誤率自動選擇目前最快的模型"
     )
     
+    stream_output = st.toggle("⚡ 串流輸出 (邊生成邊顯示)", value=True)
+    fresh_variant = st.checkbox("🎲 產生新版本 (不使用快取)", value=False)
+    
     generate_button = st.button("✨ 生成 Lucky Vicky 貼文", type="primary", use_container_width=True)
 
 with col2:
@@ -256,11 +569,21 @@ with col2:
     
     if generate_button:
         if event_input:
-            result = generate_lucky_vicky(event_input, model_choice)
+            generation_status = {}
+            if stream_output:
+                result, first_token_latency = render_stream(event_input, model_choice, output_container,
+                                                            fresh_variant, generation_status)
+                if first_token_latency is not None:
+                    output_container.caption(f"⚡ 首字延遲 {first_token_latency:.2f} 秒")
+            else:
+                result = generate_lucky_vicky(event_input, model_choice, fresh_variant, generation_status)
+                output_container.markdown(f'<div class="output-box">{result}</div>', unsafe_allow_html=True)
+            
+            brownout_note = BROWNOUT_NOTES.get(generation_status.get("brownout"))
+            if brownout_note:
+                output_container.caption(brownout_note)
             
             with output_container:
-                st.markdown(f'<div class="output-box">{result}</div>', unsafe_allow_html=True)
-                
                 # 複製按鈕
                 st.button("📋 複製貼文", key="copy_button")
         else:
@@ -294,3 +617,46 @@ if generate_button and event_input:
 with st.sidebar:
     st.divider()
     st.metric("已生成貼文數", st.session_state.generated_count)
+    stats = pool_stats()
+    st.caption(f"🔌 連接池: 命中 {stats['hits']} / 未命中 {stats['misses']} / 閒置 {stats['idle']}")
+    cache_stats = get_cache().stats()
+    st.caption(f"🗂️ 回應快取: 命中 {cache_stats['hits']} / 未命中 {cache_stats['misses']} / 條目 {cache_stats['size']}")
+    semantic_stats = get_semantic_cache().stats()
+    if semantic_stats["enabled"]:
+        st.caption(f"🧭 語意快取: 命中 {semantic_stats['hits']} / 未命中 {semantic_stats['misses']} / 條目 {semantic_stats['size']}")
+    else:
+        st.caption("🧭 語意快取: 未啟用 (LUCKY_VICKY_SEMANTIC_CACHE=1 啟用)")
+    limiter_stats = get_rate_limiter().stats()
+    st.caption(f"⏳ 限流: 排隊 {limiter_stats['waited']} 次 (共 {limiter_stats['wait_seconds']:.1f} 秒) / 拒絕 {limiter_stats['rejected']} 次")
+    admission_stats = get_admission_controller().stats()
+    st.caption(f"🚦 準入控制: 執行中 {admission_stats['in_flight']} / 排隊 {admission_stats['queued']} / "
+               f"降級 {admission_stats['downgrade'] + admission_stats['shorten']} / 拒絕 {admission_stats['rejected']}")
+    stops = stop_stats()
+    st.caption(f"✂️ 結尾語停止: {stops['stopped']}/{stops['requests']} 篇 / 最多省下 {stops['tokens_saved_upper_bound']} tokens "
+               f"({stops['seconds_saved_upper_bound']:.1f} 秒, 上限估計)")
+    telemetry = stream_telemetry()
+    if telemetry["ttft_p50"] is not None:
+        st.caption(f"⚡ 串流: 最近 {telemetry['streams']} 次 / 首字延遲中位數 {telemetry['ttft_p50']:.2f} 秒 "
+                   f"(最慢 {telemetry['ttft_max']:.2f} 秒) / 平均 {telemetry['tokens_per_second']:.1f} tok/s")
+    retries = retry_stats()
+    st.caption(f"🔁 重試: {retries['retries']} 次 / 重試後成功 {retries['succeeded_after_retry']} / 超過期限放棄 {retries['gave_up_deadline']}")
+    flight_stats = get_singleflight().stats()
+    st.caption(f"🤝 請求合併: 實際請求 {flight_stats['leaders']} / 合併 {flight_stats['shared']}")
+    variant_stats = get_variant_pool().stats()
+    st.caption(f"🎲 變體池: 命中 {variant_stats['hits']} / 熱門事件 {variant_stats['pools']} / 備用貼文 {variant_stats['variants']}")
+    
+    with st.expander("🧯 Fallback 熔斷器"):
+        states = {"closed": "🟢 正常", "open": "🔴 熔斷中", "half_open": "🟡 試探中"}
+        st.table([
+            {"模型": row["model"], "狀態": states[row["state"]], "呼叫": row["calls"],
+             "失敗": row["failures"], "略過": row["rejected"]}
+            for row in get_fallback_chain().status()
+        ])
+        st.caption(f"改用後備模型 {get_fallback_chain().fallbacks} 次")
+    
+    with st.expander("📊 Auto 路由記分板"):
+        router = get_router()
+        headers = ["模型", "延遲 EWMA", "錯誤率", "預期耗時", "請求數", "路由次數", "探索次數"]
+        st.table([dict(zip(headers, row)) for row in router.scoreboard_table()])
+        if router.last_decision:
+            st.caption(f"最近一次 Auto 路由: {router.last_decision['name']} ({router.last_decision['reason']})")
@@ -0,0 +1,134 @@
+"""
+本地推理后端 - 正确性测试 (用随机初始化的迷你模型, 不需要下载任何东西)
+1. 流式与非流式输出的文字与 finish_reason 相同
+2. 前缀 KV 缓存算出的 logits 与完整 prefill 相同
+3. stop 字串: 在第一次出现的位置截断, 不包含 stop 本身, finish_reason 为 "stop"
+4. 同一个前缀被并发请求时只计算一次, 计算失败时不会留下该前缀的锁
+
+执行: python -m pytest test_local_backend.py
+"""
+
+import threading
+
+import numpy as np
+import pytest
+
+from local_backend import LocalInferenceClient, LocalModel, create_random_model
+
+MESSAGES = [
+    {"role": "system", "content": "你是 Lucky Vicky, 用員瑛式思考把小事變成好事"},
+    {"role": "user", "content": "手機掉到水裡了"},
+]
+# 这个种子会一直生成到 max_tokens (不会提早遇到 eos), stop 的测试才有足够的文字可以截断
+PARAMS = {"max_tokens": 60, "temperature": 1.0, "seed": 2}
+
+
+@pytest.fixture(scope="module")
+def model_dir(tmp_path_factory):
+    return create_random_model(str(tmp_path_factory.mktemp("local_model_tiny")))
+
+
+@pytest.fixture(scope="module")
+def client(model_dir):
+    return LocalInferenceClient(model_dir)
+
+
+def stream_text(client, **kwargs):
+    """把流式 chunk 拼回完整文字, 返回 (文字, finish_reason)"""
+    parts, finish_reason = [], None
+    for chunk in client.chat_completion(MESSAGES, stream=True, **{**PARAMS, **kwargs}):
+        choice = chunk.choices[0]
+        parts.append(choice.delta.content or "")
+        finish_reason = choice.finish_reason or finish_reason
+    return "".join(parts), finish_reason
+
+
+def test_stream_matches_non_stream(client):
+    response = client.chat_completion(MESSAGES, **PARAMS)
+    text, finish_reason = stream_text(client)
+    assert text == response.choices[0].message.content
+    assert finish_reason == response.choices[0].finish_reason
+    assert response.usage.completion_tokens > 0
+
+
+@pytest.mark.parametrize("prefix_cache", [False, True])
+def test_prefix_cache_does_not_change_output(model_dir, prefix_cache):
+    expected = LocalInferenceClient(model_dir, prefix_cache=False).chat_completion(MESSAGES, **PARAMS)
+    response = LocalInferenceClient(model_dir, prefix_cache=prefix_cache).chat_completion(MESSAGES, **PARAMS)
+    assert response.choices[0].message.content == expected.choices[0].message.content
+
+
+def test_prefix_cache_logits_match_full_prefill(model_dir):
+    model = LocalModel(model_dir)
+    prefix_ids, rest_ids = model.encode_prompt(MESSAGES)
+    prompt_ids = prefix_ids + rest_ids
+
+    full_cache, full_logits = model.prefill(prompt_ids)
+    # 第一次计算并存入快照 (miss), 第二次从快照复制 (hit), 两者都要与完整 prefill 相同
+    for _ in range(2):
+        cache, logits = model.prefill(prompt_ids, prefix_len=len(prefix_ids))
+        assert cache.length == full_cache.length
+        np.testing.assert_allclose(logits, full_logits, rtol=1e-4, atol=1e-5)
+        for layer in range(len(cache.k)):
+            np.testing.assert_allclose(cache.k[layer][:cache.length], full_cache.k[layer][:cache.length],
+                                       rtol=1e-4, atol=1e-5)
+    stats = model.prefix_cache.stats()
+    assert (stats["misses"], stats["hits"]) == (1, 1)
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_stop_sequence_truncates(client, stream):
+    full = client.chat_completion(MESSAGES, **PARAMS).choices[0].message.content
+    assert len(full) > 30
+    stop = full[20:23]
+    expected = full[:full.find(stop)]
+
+    if stream:
+        text, finish_reason = stream_text(client, stop=[stop])
+    else:
+        choice = client.chat_completion(MESSAGES, stop=[stop], **PARAMS).choices[0]
+        text, finish_reason = choice.message.content, choice.finish_reason
+    assert text == expected
+    assert stop not in text
+    assert finish_reason == "stop"
+
+
+def test_stop_sequence_not_found_keeps_full_text(client):
+    full = client.chat_completion(MESSAGES, **PARAMS).choices[0]
+    choice = client.chat_completion(MESSAGES, stop=["完全是 Lucky Vicky 呀!"], **PARAMS).choices[0]
+    assert choice.message.content == full.message.content
+    assert choice.finish_reason == full.finish_reason == "length"
+
+
+def test_prefix_computed_once_under_concurrency(model_dir):
+    model = LocalModel(model_dir)
+    prefix_ids, _ = model.encode_prompt(MESSAGES)
+    threads = [threading.Thread(target=model.prefix_cache.fork, args=(prefix_ids,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = model.prefix_cache.stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 7
+
+
+def test_prefix_failure_releases_lock(model_dir, monkeypatch):
+    model = LocalModel(model_dir)
+    prefix_ids, _ = model.encode_prompt(MESSAGES)
+    forward = model.forward
+
+    def failing_forward(*args, **kwargs):
+        raise RuntimeError("forward failed")
+
+    monkeypatch.setattr(model, "forward", failing_forward)
+    with pytest.raises(RuntimeError):
+        model.prefix_cache.fork(prefix_ids)
+    assert model.prefix_cache._computing == {}
+
+    # 失败之后同一个前缀还能正常计算并缓存
+    monkeypatch.setattr(model, "forward", forward)
+    cache = model.prefix_cache.fork(prefix_ids)
+    assert cache.length == len(prefix_ids)
+    assert model.prefix_cache._computing == {}
+    assert model.prefix_cache.stats()["misses"] == 1
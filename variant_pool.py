@@ -0,0 +1,157 @@
+"""
+热门事件变体池
+temperature=0.8 就是为了每次都不一样, 但缓存会让重复点击拿到同一篇贴文
+对请求次数达到门槛的热门事件, 预先生成 N 个不同版本放进池子:
+- 每次请求从池中取出一篇 (不放回), 不需要等待远程模型
+- 池中数量低于低水位时, 后台线程补充到满
+- 只保留最热门的若干个事件的池子, 控制额度与内存
+- 补充与使用者请求共用同一套准入 / 调度 / 熔断 (由 generate 负责),
+  服务忙碌时 (paused() 为真) 暂停补充, 额度先留给使用者
+"""
+
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from event_normalizer import normalize_event
+
+# ============================================
+# 配置
+# ============================================
+
+DEFAULT_POOL_SIZE = 4          # 每个事件预先生成的版本数
+DEFAULT_LOW_WATER = 2          # 低于此数量时开始补充
+DEFAULT_HOT_THRESHOLD = 3      # 请求次数达到此值才算热门事件
+DEFAULT_MAX_EVENTS = 20        # 最多同时维护的事件池数量
+DEFAULT_MAX_CONCURRENCY = 2    # 后台补充时同时发出的请求数
+_MAX_TRACKED = 4096            # 请求次数统计最多记录的事件数
+
+
+class RefillPaused(RuntimeError):
+    """generate 因服务忙碌而放弃这次补充 (不算失败, 下次取出时再试)"""
+
+
+class VariantPool:
+    """
+    热门事件的贴文变体池
+
+    参数:
+        generate: generate(event, model) -> 贴文, 失败时抛出异常
+        size: 每个事件池的容量
+        low_water: 低水位, 取出后剩余数量低于此值就在后台补充
+        hot_threshold: 事件被请求几次后开始为它建立池子
+        max_events: 最多维护的事件池数, 超出时丢弃最久没被请求的
+        max_concurrency: 后台补充的并发请求数
+        paused: paused() 为真时暂停补充 (例如准入控制正在降级)
+    """
+
+    def __init__(self, generate, size=DEFAULT_POOL_SIZE, low_water=DEFAULT_LOW_WATER,
+                 hot_threshold=DEFAULT_HOT_THRESHOLD, max_events=DEFAULT_MAX_EVENTS,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, paused=None):
+        self.generate = generate
+        self.paused = paused
+        self.size = size
+        self.low_water = low_water
+        self.hot_threshold = hot_threshold
+        self.max_events = max_events
+
+        self._demand = OrderedDict()   # key -> 请求次数
+        self._pools = OrderedDict()    # key -> (event, model, deque[贴文])
+        self._refilling = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency,
+                                            thread_name_prefix="variant-pool")
+        self._stats = {"hits": 0, "misses": 0, "generated": 0, "failed": 0,
+                       "refills": 0, "evictions": 0, "paused": 0}
+
+    @staticmethod
+    def _key(event, model):
+        # 与缓存 key 一样先正规化, 同一件事的不同写法共用一个池子
+        return normalize_event(event), model
+
+    def draw(self, event, model):
+        """
+        从池中取出一篇贴文 (不放回); 池子不存在或已取空时返回 None
+
+        每次调用都会计入该事件的热度, 达到门槛后自动建立池子并在后台填满
+        """
+        key = self._key(event, model)
+        with self._lock:
+            demand = self._demand.pop(key, 0) + 1
+            self._demand[key] = demand
+            while len(self._demand) > _MAX_TRACKED:
+                self._demand.popitem(last=False)
+
+            variant = None
+            pool = self._pools.get(key)
+            if pool is None and demand >= self.hot_threshold:
+                pool = (event, model, deque())
+                self._pools[key] = pool
+                while len(self._pools) > self.max_events:
+                    self._pools.popitem(last=False)
+                    self._stats["evictions"] += 1
+            if pool is not None:
+                self._pools.move_to_end(key)
+                if pool[2]:
+                    variant = pool[2].popleft()
+                needs_refill = len(pool[2]) < self.low_water and key not in self._refilling
+                if needs_refill:
+                    self._refilling.add(key)
+            else:
+                needs_refill = False
+            self._stats["hits" if variant is not None else "misses"] += 1
+
+        if needs_refill:
+            self._executor.submit(self._refill, key)
+        return variant
+
+    def _refill(self, key):
+        """后台补充一个事件池直到填满 (或生成失败、池子已被淘汰)"""
+        with self._lock:
+            self._stats["refills"] += 1
+        try:
+            while True:
+                with self._lock:
+                    pool = self._pools.get(key)
+                    if pool is None or len(pool[2]) >= self.size:
+                        return
+                    event, model, variants = pool
+                try:
+                    if self.paused is not None and self.paused():
+                        raise RefillPaused()
+                    text = self.generate(event, model)
+                except RefillPaused:
+                    with self._lock:
+                        self._stats["paused"] += 1
+                    return
+                except Exception as e:
+                    print(f"⚠️  变体池补充失败 [{model}] {event}: {e}")
+                    with self._lock:
+                        self._stats["failed"] += 1
+                    return
+                with self._lock:
+                    variants.append(text)
+                    self._stats["generated"] += 1
+        finally:
+            with self._lock:
+                self._refilling.discard(key)
+
+    def available(self, event, model):
+        """某个事件池中还剩几篇"""
+        with self._lock:
+            pool = self._pools.get(self._key(event, model))
+            return len(pool[2]) if pool else 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pools"] = len(self._pools)
+            stats["variants"] = sum(len(pool[2]) for pool in self._pools.values())
+            stats["refilling"] = len(self._refilling)
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / total if total else 0.0
+        return stats
+
+    def close(self):
+        """停止后台补充 (不等待进行中的请求)"""
+        self._executor.shutdown(wait=False, cancel_futures=True)